@@ -3,18 +3,49 @@ BizCopilot MongoDB Connector - Vercel Serverless Handler
 """
 import json
 import os
+import sys
 import time
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bizcopilot_connector.health import HealthProber  # noqa: E402
 
 # Environment variables
 API_KEY = os.getenv("CONNECTOR_API_KEY", "test-api-key-12345")
 DATABASE_URL = os.getenv("MONGODB_URI") or os.getenv("MONGODB_URL") or os.getenv("DATABASE_URL", "")
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "10"))
+CONNECTION_MAX_IDLE_SECONDS = float(os.getenv("CONNECTION_MAX_IDLE_SECONDS", "30"))
+
+# Module-level client survives warm invocations of the same container.
+# pymongo is imported on first use so cold starts that only answer OPTIONS
+# or a cached health check never pay for it.
+_client = None
+# Aggregation results cached by pipeline fingerprint, also kept while warm
+_aggregate_cache = None
 
 def get_db_client():
-    """Create MongoDB client"""
-    from pymongo import MongoClient
-    return MongoClient(DATABASE_URL, serverSelectionTimeoutMS=5000)
+    """Return the container's MongoDB client, creating it on first use"""
+    global _client
+    if _client is None:
+        from pymongo import MongoClient
+        # maxIdleTimeMS makes the pool discard sockets that sat idle while the
+        # container was frozen instead of failing on them
+        _client = MongoClient(
+            DATABASE_URL,
+            serverSelectionTimeoutMS=5000,
+            maxIdleTimeMS=int(CONNECTION_MAX_IDLE_SECONDS * 1000),
+        )
+    return _client
+
+def probe_database():
+    """Liveness probe used by the cached health state"""
+    get_db_client().admin.command("ping")
+    return {}
+
+# Warm invocations reuse the last probe result for HEALTH_CACHE_SECONDS
+health_prober = HealthProber(probe_database, HEALTH_CACHE_SECONDS)
 
 def verify_api_key(headers):
     """Verify API key from headers"""
@@ -24,53 +55,21 @@ def verify_api_key(headers):
     return True
 
 def execute_query(query_data, timeout_ms=30000):
-    """Execute MongoDB query"""
-    from pymongo import MongoClient
-    from bson import ObjectId
-    
-    client = MongoClient(DATABASE_URL, serverSelectionTimeoutMS=timeout_ms)
-    db = client.get_default_database()
+    """Execute MongoDB query; rows come back as a pre-encoded JSON array (data_json)"""
+    # Same operation model as the FastAPI connector; imported on first query
+    from bizcopilot_connector.mongoquery import (
+        execute_mongo_query,
+        new_aggregate_cache,
+        parse_mongo_query,
+    )
+    global _aggregate_cache
+    if _aggregate_cache is None:
+        _aggregate_cache = new_aggregate_cache()
     
-    try:
-        collection_name = query_data.get("collection")
-        operation = query_data.get("operation", "find")
-        filter_query = query_data.get("filter") or query_data.get("query", {})
-        options = query_data.get("options", {})
-        
-        if not collection_name:
-            raise Exception("Collection name is required")
-        
-        # Only allow read operations
-        allowed_ops = ["find", "findone", "count", "countdocuments", "aggregate"]
-        if operation.lower() not in allowed_ops:
-            raise Exception(f"Only read operations are allowed: {', '.join(allowed_ops)}")
-        
-        collection = db[collection_name]
-        
-        if operation.lower() == "find":
-            limit = options.get("limit", 100)
-            cursor = collection.find(filter_query).limit(limit)
-            results = list(cursor)
-        elif operation.lower() == "findone":
-            results = [collection.find_one(filter_query)]
-            results = [r for r in results if r is not None]
-        elif operation.lower() in ["count", "countdocuments"]:
-            count = collection.count_documents(filter_query)
-            results = [{"count": count}]
-        elif operation.lower() == "aggregate":
-            pipeline = filter_query if isinstance(filter_query, list) else []
-            results = list(collection.aggregate(pipeline))
-        else:
-            results = []
-        
-        # Convert ObjectId to string
-        for doc in results:
-            if "_id" in doc and isinstance(doc["_id"], ObjectId):
-                doc["_id"] = str(doc["_id"])
-        
-        return {"data": results, "rows_affected": len(results)}
-    finally:
-        client.close()
+    # Unbounded finds stay capped at 100 documents unless a limit is given
+    query = parse_mongo_query(query_data, default_limit=100)
+    db = get_db_client().get_default_database()
+    return execute_mongo_query(db, query, timeout_ms, _aggregate_cache)
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -93,21 +92,13 @@ class handler(BaseHTTPRequestHandler):
             self.wfile.write(json.dumps(response).encode())
             return
         
-        try:
-            client = get_db_client()
-            client.server_info()
-            client.close()
-            response = {
-                "status": "healthy",
-                "database_type": "mongodb",
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-        except Exception as e:
-            response = {
-                "status": "unhealthy",
-                "error": str(e),
-                "timestamp": datetime.utcnow().isoformat(),
-            }
+        deep = parse_qs(urlparse(self.path).query).get("deep", [""])[0].lower() in ("1", "true")
+        state = health_prober.refresh() if deep else health_prober.get()
+        response = {
+            **state,
+            "database_type": "mongodb",
+            "timestamp": datetime.utcnow().isoformat(),
+        }
         
         self.wfile.write(json.dumps(response).encode())
     
@@ -145,9 +136,11 @@ class handler(BaseHTTPRequestHandler):
             else:
                 query_data = query_raw
             
-            # Support direct collection/operation format
+            # Support direct collection/operation format; top-level options
+            # (projection, sort, limit, ...) are picked up by parse_mongo_query
             if "collection" not in query_data:
                 query_data = {
+                    **data,
                     "collection": data.get("collection", ""),
                     "operation": data.get("operation", "find"),
                     "filter": data.get("filter") or data.get("query", {}),
@@ -164,14 +157,20 @@ class handler(BaseHTTPRequestHandler):
             self.send_header("Content-Type", "application/json")
             self.end_headers()
             
-            response = {
-                "success": True,
-                "data": result.get("data"),
-                "rows_affected": result.get("rows_affected"),
-                "execution_time_ms": execution_time_ms,
-                "request_id": request_id,
-            }
-            self.wfile.write(json.dumps(response, default=str).encode())
+            # Splice the encoded rows in rather than decoding and re-encoding them
+            self.wfile.write(b'{"success":true,"data":')
+            if "data_buffer" in result:
+                # Spilled to disk; stream it back chunk by chunk
+                with result["data_buffer"] as buffer:
+                    for chunk in buffer.json_chunks():
+                        self.wfile.write(chunk)
+            else:
+                self.wfile.write(result["data_json"])
+            self.wfile.write(
+                b',"rows_affected":%d,"execution_time_ms":%d,"request_id":'
+                % (result["rows_affected"], execution_time_ms)
+                + json.dumps(request_id).encode() + b"}"
+            )
             
         except Exception as e:
             execution_time_ms = int((time.time() - start_time) * 1000)
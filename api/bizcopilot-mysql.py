@@ -4,14 +4,20 @@ BizCopilot MySQL Connector - Vercel Serverless Handler
 import json
 import os
 import re
+import sys
 import time
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler
-from urllib.parse import urlparse
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bizcopilot_connector.health import HealthProber  # noqa: E402
 
 # Environment variables
 API_KEY = os.getenv("CONNECTOR_API_KEY", "test-api-key-12345")
 DATABASE_URL = os.getenv("MYSQL_URL") or os.getenv("DATABASE_URL", "")
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "10"))
+CONNECTION_MAX_IDLE_SECONDS = float(os.getenv("CONNECTION_MAX_IDLE_SECONDS", "30"))
 
 def parse_mysql_url(url):
     """Parse MySQL URL to connection parameters"""
@@ -29,11 +35,49 @@ def parse_mysql_url(url):
         "database": parsed.path.lstrip("/") if parsed.path else "",
     }
 
+# Module-level state survives warm invocations of the same container.
+# mysql.connector is imported on first use so cold starts that only answer
+# OPTIONS or a cached health check never pay for it.
+_conn = None
+_conn_last_used = 0.0
+
 def get_db_connection():
-    """Create MySQL connection"""
+    """Return the container's MySQL connection, reconnecting if it went stale"""
+    global _conn, _conn_last_used
     import mysql.connector
-    params = parse_mysql_url(DATABASE_URL)
-    return mysql.connector.connect(**params)
+
+    if _conn is not None:
+        idle = time.monotonic() - _conn_last_used
+        if idle > CONNECTION_MAX_IDLE_SECONDS:
+            # Frozen containers outlive wait_timeout; ping before reuse
+            try:
+                _conn.ping(reconnect=True, attempts=1, delay=0)
+            except mysql.connector.Error:
+                reset_db_connection()
+    if _conn is None:
+        params = parse_mysql_url(DATABASE_URL)
+        # autocommit: no REPEATABLE READ snapshot is carried between invocations
+        _conn = mysql.connector.connect(autocommit=True, **params)
+    _conn_last_used = time.monotonic()
+    return _conn
+
+def reset_db_connection():
+    """Drop the cached connection"""
+    global _conn
+    if _conn is not None:
+        try:
+            _conn.close()
+        except Exception:
+            pass
+    _conn = None
+
+def probe_database():
+    """Liveness probe used by the cached health state"""
+    get_db_connection().ping(reconnect=True, attempts=1, delay=0)
+    return {}
+
+# Warm invocations reuse the last probe result for HEALTH_CACHE_SECONDS
+health_prober = HealthProber(probe_database, HEALTH_CACHE_SECONDS)
 
 def verify_api_key(headers):
     """Verify API key from headers"""
@@ -46,34 +90,42 @@ def execute_query(query_text, timeout_ms=30000):
     """Execute MySQL query"""
     import mysql.connector
     
-    params = parse_mysql_url(DATABASE_URL)
-    conn = mysql.connector.connect(**params)
-    cursor = conn.cursor(dictionary=True)
+    # Safety check
+    if ";" in query_text.strip().rstrip(";"):
+        raise Exception("Multiple statements are not allowed")
+    
+    query_upper = query_text.upper().strip()
+    
+    # Check if EXPLAIN query
+    if query_upper.startswith("EXPLAIN"):
+        if not re.match(r"^EXPLAIN(\s+ANALYZE)?\s+(SELECT|WITH)\b", query_upper):
+            raise Exception("Only EXPLAIN SELECT/WITH queries are allowed")
+        is_select = True
+    else:
+        is_select = query_upper.startswith("SELECT") or query_upper.startswith("WITH")
     
+    if not is_select:
+        raise Exception("Only SELECT/WITH/EXPLAIN queries are allowed")
+    
+    conn = get_db_connection()
+    try:
+        return run_query(conn, query_text)
+    except mysql.connector.Error:
+        if conn.is_connected():
+            raise
+        # The cached connection died between invocations; retry once on a fresh one
+        reset_db_connection()
+        return run_query(get_db_connection(), query_text)
+
+def run_query(conn, query_text):
+    """Run a validated query and return rows as dicts"""
+    cursor = conn.cursor(dictionary=True)
     try:
-        # Safety check
-        if ";" in query_text.strip().rstrip(";"):
-            raise Exception("Multiple statements are not allowed")
-        
-        query_upper = query_text.upper().strip()
-        
-        # Check if EXPLAIN query
-        if query_upper.startswith("EXPLAIN"):
-            if not re.match(r"^EXPLAIN(\s+ANALYZE)?\s+(SELECT|WITH)\b", query_upper):
-                raise Exception("Only EXPLAIN SELECT/WITH queries are allowed")
-            is_select = True
-        else:
-            is_select = query_upper.startswith("SELECT") or query_upper.startswith("WITH")
-        
-        if not is_select:
-            raise Exception("Only SELECT/WITH/EXPLAIN queries are allowed")
-        
         cursor.execute(query_text)
         rows = cursor.fetchall()
         return {"data": rows, "rows_affected": len(rows)}
     finally:
         cursor.close()
-        conn.close()
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -96,20 +148,13 @@ class handler(BaseHTTPRequestHandler):
             self.wfile.write(json.dumps(response).encode())
             return
         
-        try:
-            conn = get_db_connection()
-            conn.close()
-            response = {
-                "status": "healthy",
-                "database_type": "mysql",
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-        except Exception as e:
-            response = {
-                "status": "unhealthy",
-                "error": str(e),
-                "timestamp": datetime.utcnow().isoformat(),
-            }
+        deep = parse_qs(urlparse(self.path).query).get("deep", [""])[0].lower() in ("1", "true")
+        state = health_prober.refresh() if deep else health_prober.get()
+        response = {
+            **state,
+            "database_type": "mysql",
+            "timestamp": datetime.utcnow().isoformat(),
+        }
         
         self.wfile.write(json.dumps(response).encode())
     
@@ -4,19 +4,71 @@ BizCopilot PostgreSQL Connector - Vercel Serverless Handler
 import json
 import os
 import re
+import sys
 import time
 from datetime import datetime
 from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bizcopilot_connector.health import HealthProber  # noqa: E402
 
 # Environment variables
 API_KEY = os.getenv("CONNECTOR_API_KEY", "test-api-key-12345")
 DATABASE_URL = os.getenv("POSTGRESQL_URL") or os.getenv("DATABASE_URL", "")
+HEALTH_CACHE_SECONDS = float(os.getenv("HEALTH_CACHE_SECONDS", "10"))
+CONNECTION_MAX_IDLE_SECONDS = float(os.getenv("CONNECTION_MAX_IDLE_SECONDS", "30"))
+
+# Module-level state survives warm invocations of the same container.
+# psycopg2 is imported on first use so cold starts that only answer OPTIONS
+# or a cached health check never pay for it.
+_conn = None
+_conn_last_used = 0.0
 
 def get_db_connection():
-    """Create PostgreSQL connection"""
+    """Return the container's PostgreSQL connection, reconnecting if it went stale"""
+    global _conn, _conn_last_used
     import psycopg2
-    import psycopg2.extras
-    return psycopg2.connect(DATABASE_URL)
+
+    if _conn is not None and not _conn.closed:
+        idle = time.monotonic() - _conn_last_used
+        if idle > CONNECTION_MAX_IDLE_SECONDS and not _is_alive(_conn):
+            reset_db_connection()
+    if _conn is None or _conn.closed:
+        _conn = psycopg2.connect(DATABASE_URL)
+        # No transaction is left open between invocations
+        _conn.autocommit = True
+    _conn_last_used = time.monotonic()
+    return _conn
+
+def _is_alive(conn):
+    """Round-trip check after the container was frozen or the server may have timed us out"""
+    import psycopg2
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        return True
+    except psycopg2.Error:
+        return False
+
+def reset_db_connection():
+    """Drop the cached connection"""
+    global _conn
+    if _conn is not None:
+        try:
+            _conn.close()
+        except Exception:
+            pass
+    _conn = None
+
+def probe_database():
+    """Liveness probe used by the cached health state"""
+    with get_db_connection().cursor() as cursor:
+        cursor.execute("SELECT 1")
+    return {}
+
+# Warm invocations reuse the last probe result for HEALTH_CACHE_SECONDS
+health_prober = HealthProber(probe_database, HEALTH_CACHE_SECONDS)
 
 def verify_api_key(headers):
     """Verify API key from headers"""
@@ -28,40 +80,50 @@ def verify_api_key(headers):
 def execute_query(query_text, timeout_ms=30000):
     """Execute PostgreSQL query"""
     import psycopg2
-    import psycopg2.extras
     
-    conn = psycopg2.connect(DATABASE_URL)
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    # Safety check
+    if ";" in query_text.strip().rstrip(";"):
+        raise Exception("Multiple statements are not allowed")
+    
+    query_upper = query_text.upper().strip()
+    
+    # Check if EXPLAIN query
+    if query_upper.startswith("EXPLAIN"):
+        if not re.match(r"^EXPLAIN(\s+ANALYZE)?\s+(SELECT|WITH)\b", query_upper):
+            raise Exception("Only EXPLAIN SELECT/WITH queries are allowed")
+        is_select = True
+    else:
+        is_select = query_upper.startswith("SELECT") or query_upper.startswith("WITH")
+    
+    if not is_select:
+        raise Exception("Only SELECT/WITH/EXPLAIN queries are allowed")
     
+    conn = get_db_connection()
+    try:
+        return run_query(conn, query_text, timeout_ms)
+    except psycopg2.Error:
+        if not conn.closed:
+            raise
+        # The cached connection died between invocations; retry once on a fresh one
+        reset_db_connection()
+        return run_query(get_db_connection(), query_text, timeout_ms)
+
+def run_query(conn, query_text, timeout_ms):
+    """Run a validated query and return rows as dicts"""
+    # Plain cursor + description instead of RealDictCursor: skips importing
+    # psycopg2.extras on cold start
+    cursor = conn.cursor()
     try:
-        # Safety check
-        if ";" in query_text.strip().rstrip(";"):
-            raise Exception("Multiple statements are not allowed")
-        
-        query_upper = query_text.upper().strip()
-        
-        # Check if EXPLAIN query
-        if query_upper.startswith("EXPLAIN"):
-            if not re.match(r"^EXPLAIN(\s+ANALYZE)?\s+(SELECT|WITH)\b", query_upper):
-                raise Exception("Only EXPLAIN SELECT/WITH queries are allowed")
-            is_select = True
-        else:
-            is_select = query_upper.startswith("SELECT") or query_upper.startswith("WITH")
-        
-        if not is_select:
-            raise Exception("Only SELECT/WITH/EXPLAIN queries are allowed")
-        
         # Set timeout
         timeout_seconds = timeout_ms / 1000
         cursor.execute(f"SET statement_timeout = {int(timeout_seconds * 1000)}")
         cursor.execute(query_text)
         
-        rows = cursor.fetchall()
-        data = [dict(row) for row in rows]
+        columns = [column.name for column in cursor.description]
+        data = [dict(zip(columns, row)) for row in cursor.fetchall()]
         return {"data": data, "rows_affected": len(data)}
     finally:
         cursor.close()
-        conn.close()
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -84,20 +146,13 @@ class handler(BaseHTTPRequestHandler):
             self.wfile.write(json.dumps(response).encode())
             return
         
-        try:
-            conn = get_db_connection()
-            conn.close()
-            response = {
-                "status": "healthy",
-                "database_type": "postgresql",
-                "timestamp": datetime.utcnow().isoformat(),
-            }
-        except Exception as e:
-            response = {
-                "status": "unhealthy",
-                "error": str(e),
-                "timestamp": datetime.utcnow().isoformat(),
-            }
+        deep = parse_qs(urlparse(self.path).query).get("deep", [""])[0].lower() in ("1", "true")
+        state = health_prober.refresh() if deep else health_prober.get()
+        response = {
+            **state,
+            "database_type": "postgresql",
+            "timestamp": datetime.utcnow().isoformat(),
+        }
         
         self.wfile.write(json.dumps(response).encode())
     
@@ -0,0 +1,80 @@
+"""
+MongoDB result encoding: decoding BSON into dicts and re-encoding them
+(json.dumps with default=str, and FastAPI's jsonable_encoder) vs
+transcoding RawBSONDocument bytes straight to JSON.
+
+  python benchmarks/bench_bson_json.py --documents 5000 --items 5
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson  # noqa: E402
+from bson import Decimal128, ObjectId  # noqa: E402
+from bson.raw_bson import RawBSONDocument  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from bizcopilot_connector.bsonjson import documents_to_json_array  # noqa: E402
+
+
+def order(rng: random.Random, items: int) -> dict:
+    placed = datetime(2026, 1, 1) + timedelta(minutes=rng.randrange(500000))
+    return {
+        "_id": ObjectId(),
+        "tenant_id": f"tenant-{rng.randrange(50)}",
+        "customer": {"_id": ObjectId(), "name": f"Customer {rng.randrange(10000)}"},
+        "created_at": placed,
+        "total": Decimal128(f"{rng.randrange(10**7)}.{rng.randrange(100):02d}"),
+        "items": [
+            {
+                "product_id": ObjectId(),
+                "qty": rng.randrange(1, 20),
+                "price": Decimal128(f"{rng.randrange(10**5)}.{rng.randrange(100):02d}"),
+                "shipped_at": placed + timedelta(days=rng.randrange(5)),
+            }
+            for _ in range(items)
+        ],
+    }
+
+
+def best(label: str, fn, repeat: int, count: int) -> None:
+    seconds = min(timeit.repeat(fn, number=1, repeat=repeat))
+    print(f"{label:<32} {seconds * 1000:9.1f} ms  ({seconds / count * 1e6:.1f} us/doc)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--documents", type=int, default=5000)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    raw = [RawBSONDocument(bson.encode(order(rng, args.items))) for _ in range(args.documents)]
+    size = sum(len(doc.raw) for doc in raw)
+    print(f"{args.documents} documents, {size / 1024:.0f} KiB of BSON")
+
+    def decode():
+        return [bson.decode(doc.raw) for doc in raw]
+
+    def dumps():
+        return json.dumps(decode(), default=str).encode()
+
+    def encoder():
+        return jsonable_encoder(decode(), custom_encoder={ObjectId: str, Decimal128: str})
+
+    best("decode + json.dumps(default=str)", dumps, args.repeat, args.documents)
+    best("decode + jsonable_encoder", encoder, args.repeat, args.documents)
+    best("raw transcode", lambda: documents_to_json_array(raw), args.repeat, args.documents)
+
+
+if __name__ == "__main__":
+    main()
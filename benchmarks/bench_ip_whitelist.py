@@ -0,0 +1,78 @@
+"""
+IP whitelist lookup: linear scan over ipaddress networks (the original
+middleware) vs the compiled IPWhitelist, with and without verdict cache
+hits.
+
+  python benchmarks/bench_ip_whitelist.py --networks 2000 --lookups 20000
+"""
+
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bizcopilot_connector.core import parse_whitelist  # noqa: E402
+from bizcopilot_connector.ipmatch import IPWhitelist  # noqa: E402
+
+
+def random_cidrs(count: int, rng: random.Random):
+    tokens = []
+    for _ in range(count):
+        if rng.random() < 0.8:
+            prefix = rng.randint(16, 32)
+            address = ipaddress.IPv4Address(rng.getrandbits(32))
+        else:
+            prefix = rng.randint(32, 128)
+            address = ipaddress.IPv6Address(rng.getrandbits(128))
+        tokens.append(f"{address}/{prefix}")
+    return ",".join(tokens)
+
+
+def linear_scan(networks, client_ip: str) -> bool:
+    ip = ipaddress.ip_address(client_ip)
+    return any(ip in net for net in networks)
+
+
+def timed(label: str, check, ips) -> None:
+    started = time.perf_counter()
+    allowed = sum(1 for ip in ips if check(ip))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {elapsed / len(ips) * 1e6:9.2f} us/lookup  ({allowed} allowed)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--networks", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--distinct-clients", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    networks = parse_whitelist(random_cidrs(args.networks, rng))
+    unique_ips = [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(args.lookups)]
+    # Mix in addresses that fall inside whitelisted v4 networks
+    for net in networks[: args.lookups // 10]:
+        if net.version == 4:
+            unique_ips[rng.randrange(len(unique_ips))] = str(net.network_address)
+    clients = [unique_ips[i] for i in range(args.distinct_clients)]
+    repeat_ips = [rng.choice(clients) for _ in range(args.lookups)]
+
+    started = time.perf_counter()
+    whitelist = IPWhitelist(networks, cache_size=4096)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"{len(networks)} networks, compile {build_ms:.2f} ms, {args.lookups} lookups")
+
+    timed("linear scan", lambda ip: linear_scan(networks, ip), unique_ips)
+    uncached = IPWhitelist(networks, cache_size=0)
+    timed("compiled, no cache", uncached.allows, unique_ips)
+    timed("compiled, repeat clients", whitelist.allows, repeat_ips)
+    print(f"cache: {whitelist.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Cold vs warm invocation latency of the api/ serverless handlers.
+
+Each cold run starts a fresh interpreter (a new container), times the
+handler module import, then the first POST (driver import + connect +
+query), then --warm further POSTs on the same module (a reused container).
+
+Point the handler at a real database through the same environment
+variables Vercel uses (POSTGRESQL_URL, MYSQL_URL, MONGODB_URI or
+DATABASE_URL), then run:
+
+  python benchmarks/bench_vercel_cold_start.py postgresql --runs 5 --warm 20
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BODIES = {
+    "postgresql": {"query": "SELECT 1", "database_type": "postgresql"},
+    "mysql": {"query": "SELECT 1", "database_type": "mysql"},
+    "mongodb": {
+        "database_type": "mongodb",
+        "query": {"collection": "tenants", "operation": "findone"},
+    },
+}
+
+
+class _FakeSocket:
+    """Just enough of a socket for BaseHTTPRequestHandler to serve one request."""
+
+    def __init__(self, raw_request: bytes):
+        self._rfile = io.BytesIO(raw_request)
+        self.output = io.BytesIO()
+
+    def makefile(self, mode, *args, **kwargs):
+        return self._rfile
+
+    def sendall(self, data):
+        self.output.write(data)
+
+
+def invoke(handler_cls, body: dict) -> float:
+    payload = json.dumps(body).encode()
+    api_key = os.getenv("CONNECTOR_API_KEY", "test-api-key-12345")
+    raw = (
+        b"POST /api HTTP/1.1\r\n"
+        b"Host: localhost\r\n"
+        b"Content-Type: application/json\r\n"
+        + f"X-API-Key: {api_key}\r\n".encode()
+        + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+        + payload
+    )
+    sock = _FakeSocket(raw)
+    started = time.perf_counter()
+    handler_cls(sock, ("127.0.0.1", 0), None)
+    elapsed = (time.perf_counter() - started) * 1000
+    status_line = sock.output.getvalue().split(b"\r\n", 1)[0].decode()
+    if " 200 " not in status_line:
+        raise SystemExit(f"Request failed: {sock.output.getvalue().decode(errors='replace')}")
+    return elapsed
+
+
+def run_child(backend: str, warm: int, body: dict) -> None:
+    path = os.path.join(ROOT, "api", f"bizcopilot-{backend}.py")
+    started = time.perf_counter()
+    spec = importlib.util.spec_from_file_location(f"bizcopilot_{backend}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    import_ms = (time.perf_counter() - started) * 1000
+
+    first_ms = invoke(module.handler, body)
+    warm_ms = [invoke(module.handler, body) for _ in range(warm)]
+    print(json.dumps({"import_ms": import_ms, "first_ms": first_ms, "warm_ms": warm_ms}))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("backend", choices=sorted(DEFAULT_BODIES))
+    parser.add_argument("--runs", type=int, default=5, help="cold starts (fresh interpreters)")
+    parser.add_argument("--warm", type=int, default=20, help="warm invocations per cold start")
+    parser.add_argument("--body", help="JSON request body (defaults to a trivial query)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    body = json.loads(args.body) if args.body else DEFAULT_BODIES[args.backend]
+
+    if args.child:
+        run_child(args.backend, args.warm, body)
+        return
+
+    results = []
+    for _ in range(args.runs):
+        command = [sys.executable, __file__, args.backend, "--child", "--warm", str(args.warm)]
+        if args.body:
+            command += ["--body", args.body]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    imports = [r["import_ms"] for r in results]
+    firsts = [r["first_ms"] for r in results]
+    warms = [ms for r in results for ms in r["warm_ms"]]
+    print(f"backend: {args.backend}  cold runs: {args.runs}  warm invocations: {len(warms)}")
+    print(f"module import     median {statistics.median(imports):8.2f} ms")
+    print(f"cold invocation   median {statistics.median(firsts):8.2f} ms  (first request)")
+    if warms:
+        print(
+            f"warm invocation   median {statistics.median(warms):8.2f} ms  "
+            f"p95 {percentile(warms, 95):8.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
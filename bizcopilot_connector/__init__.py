@@ -0,0 +1,7 @@
+"""
+Shared helpers for the BizCopilot connector apps.
+
+The bizcopilot-connector-*.py scripts (and the api/ serverless handlers)
+import from this package. Keep this module free of heavy imports so that
+importing a single helper stays cheap.
+"""
@@ -0,0 +1,183 @@
+"""
+Estimated answers for /execute requests sent with "approximate": true.
+
+Only single-table counts are estimated:
+
+  SELECT COUNT(*) FROM orders
+  SELECT COUNT(*) AS paid FROM orders WHERE status = 'paid'
+  SELECT COUNT(DISTINCT tenant_id) FROM orders [WHERE ...]
+
+and, on MongoDB, the count operation. Everything else runs exactly and is
+reported as {"method": "exact"}.
+
+- A plain count comes from catalog statistics (pg_class.reltuples,
+  information_schema.TABLES, estimated_document_count). The bounds say how
+  far the statistic can have drifted.
+- A filtered count runs its WHERE clause over a random sample of about
+  APPROXIMATE_SAMPLE_ROWS rows and scales the matching fraction to the
+  table, with a 95% Wilson interval.
+- COUNT(DISTINCT) streams the column into a HyperLogLog sketch (about 0.8%
+  standard error, a few KB of memory and no sort in the database). Above
+  APPROXIMATE_SCAN_ROWS rows only a sample is read, and the distinct count
+  is extrapolated with the GEE estimator, whose error is bounded by a
+  factor of sqrt(rows / sampled rows).
+
+Tables smaller than the sample are counted exactly; that is already cheap.
+Every estimate carries an "approximation" object with the method, the
+estimate, and low/high bounds.
+"""
+
+import hashlib
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+# Two-sided 95% normal quantile
+_Z = 1.96
+
+_IDENTIFIER = r'[A-Za-z_][A-Za-z0-9_$]*|"[^"]+"|`[^`]+`'
+_COUNT_RE = re.compile(
+    r"^SELECT\s+(?P<expression>COUNT\s*\(\s*(?:\*|1|DISTINCT\s+(?P<column>"
+    + _IDENTIFIER
+    + r"))\s*\))(?:\s+(?:AS\s+)?(?!FROM\b)(?P<label>"
+    + _IDENTIFIER
+    + r"))?\s+FROM\s+(?P<table>"
+    + _IDENTIFIER
+    + r")(?:\s+WHERE\s+(?P<where>.+?))?\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+# A WHERE clause holding any of these is not a plain filter on one table
+_NOT_A_FILTER_RE = re.compile(
+    r"\b(SELECT|GROUP\s+BY|ORDER\s+BY|HAVING|LIMIT|OFFSET|FETCH|UNION|JOIN|WINDOW)\b",
+    re.IGNORECASE,
+)
+
+
+class CountQuery(NamedTuple):
+    table: str
+    # COUNT(DISTINCT column); None for COUNT(*)
+    column: Optional[str]
+    where: Optional[str]
+    # The AS alias, if any
+    label: Optional[str]
+    # COUNT(...) as written, which MySQL uses as the column name
+    expression: str
+
+
+def _unquote(identifier: Optional[str]) -> Optional[str]:
+    if identifier and identifier[0] in '"`':
+        return identifier[1:-1]
+    return identifier
+
+
+def parse_count_query(query_text: str) -> Optional[CountQuery]:
+    match = _COUNT_RE.match(query_text.strip())
+    if match is None:
+        return None
+    where = match.group("where")
+    if where is not None and _NOT_A_FILTER_RE.search(where):
+        return None
+    return CountQuery(
+        table=_unquote(match.group("table")),
+        column=_unquote(match.group("column")),
+        where=where,
+        label=_unquote(match.group("label")),
+        expression=match.group("expression"),
+    )
+
+
+class HyperLogLog:
+    """Distinct-value sketch with 2**precision one-byte registers."""
+
+    def __init__(self, precision: int = 14):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self._rank_bits = 64 - precision
+
+    def add(self, value: Any) -> None:
+        digest = hashlib.blake2b(repr(value).encode(), digest_size=8).digest()
+        hashed = int.from_bytes(digest, "big")
+        index = hashed >> self._rank_bits
+        rest = hashed & ((1 << self._rank_bits) - 1)
+        rank = self._rank_bits - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.size)
+
+    def count(self) -> float:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small cardinalities: linear counting is more accurate
+            estimate = m * math.log(m / zeros)
+        return estimate
+
+
+def approximation(
+    method: str,
+    estimate: float,
+    low: float,
+    high: float,
+    confidence: Optional[float] = None,
+    **details: Any,
+) -> Dict[str, Any]:
+    return {
+        "method": method,
+        "estimate": round(estimate),
+        "low": math.floor(low),
+        "high": math.ceil(high),
+        # None when the bounds are hard limits rather than a confidence interval
+        "confidence": confidence,
+        "relative_error": round((high - low) / 2 / estimate, 4) if estimate else None,
+        **details,
+    }
+
+
+def scaled_proportion(
+    matched: int, sampled: int, population: Dict[str, Any]
+) -> Tuple[float, float, float]:
+    """
+    matched of sampled rows scaled to the population (an approximation of
+    the table's row count), with a 95% Wilson interval widened by the
+    population's own bounds.
+    """
+    n = sampled
+    p = matched / n
+    denominator = 1 + _Z * _Z / n
+    centre = (p + _Z * _Z / (2 * n)) / denominator
+    half = _Z * math.sqrt(p * (1 - p) / n + _Z * _Z / (4 * n * n)) / denominator
+    return (
+        p * population["estimate"],
+        max(0.0, centre - half) * population["low"],
+        min(1.0, centre + half) * population["high"],
+    )
+
+
+def distinct_from_sample(
+    frequencies: Counter, sampled: int, population: float
+) -> Tuple[float, float, float]:
+    """
+    GEE estimate (Charikar et al.) of the distinct values among population
+    rows, from the value frequencies of sampled of them:
+    sqrt(N/n) * f1 + (values seen more than once). Its ratio error is at
+    most sqrt(N/n).
+    """
+    seen = len(frequencies)
+    if sampled == 0 or seen == 0:
+        return 0.0, 0.0, 0.0
+    ratio = math.sqrt(max(population, sampled) / sampled)
+    singletons = sum(1 for count in frequencies.values() if count == 1)
+    estimate = ratio * singletons + (seen - singletons)
+    ceiling = seen + max(population - sampled, 0)
+    return (
+        min(estimate, ceiling),
+        max(seen, estimate / ratio),
+        min(ceiling, estimate * ratio),
+    )
@@ -0,0 +1,186 @@
+"""
+BSON to JSON transcoding.
+
+Documents are fetched as RawBSONDocument and their bytes are walked once,
+writing JSON bytes directly; no intermediate dicts, ObjectId or datetime
+objects are built. Every BSON type is handled at any depth:
+
+  ObjectId              -> 24-char hex string (as str(ObjectId))
+  datetime              -> ISO 8601 string, "2026-01-04T18:01:00"
+  Decimal128            -> decimal string, "12500.00" (no precision loss)
+  binary                -> base64 string
+  timestamp             -> {"t": seconds, "i": increment}
+  regex                 -> {"$regex": pattern, "$options": flags}
+  code / symbol         -> string; code with scope -> {"$code", "$scope"}
+  DBPointer             -> {"$ref": collection, "$id": hex}
+  min/max key           -> {"$minKey": 1} / {"$maxKey": 1}
+  undefined, NaN, +-inf -> null
+"""
+
+import base64
+import re
+import struct
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Iterable, List
+
+_INT32 = struct.Struct("<i")
+_INT64 = struct.Struct("<q")
+_TIMESTAMP = struct.Struct("<II")
+_DOUBLE = struct.Struct("<d")
+_UINT64_PAIR = struct.Struct("<QQ")
+# Bytes that cannot be copied into a JSON string verbatim
+_NEEDS_ESCAPE = re.compile(rb'[\x00-\x1f"\\]')
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _string(raw: bytes) -> bytes:
+    if not _NEEDS_ESCAPE.search(raw):
+        return b'"' + raw + b'"'
+    import json
+
+    return json.dumps(raw.decode("utf-8", "replace"), ensure_ascii=False).encode("utf-8")
+
+
+def _datetime(millis: int) -> bytes:
+    try:
+        return b'"' + (_EPOCH + timedelta(milliseconds=millis)).isoformat().encode() + b'"'
+    except OverflowError:
+        return str(millis).encode()
+
+
+def _decimal128(raw: bytes) -> bytes:
+    low, high = _UINT64_PAIR.unpack(raw)
+    if (high >> 61) & 3 == 3:
+        # NaN, Infinity and the non-canonical large-coefficient form are rare
+        from bson.decimal128 import Decimal128
+
+        return b'"' + str(Decimal128.from_bid(raw)).encode() + b'"'
+    exponent = ((high >> 49) & 0x3FFF) - 6176
+    coefficient = ((high & 0x1FFFFFFFFFFFF) << 64) | low
+    sign = "-" if high >> 63 else ""
+    # Decimal parses the literal exactly and formats it the way Decimal128 does
+    return b'"' + str(Decimal(f"{sign}{coefficient}E{exponent}")).encode() + b'"'
+
+
+def _double(value: float) -> bytes:
+    if value != value or value in (float("inf"), float("-inf")):
+        return b"null"
+    return repr(value).encode()
+
+
+def _write_document(data: bytes, pos: int, out: List[bytes], is_array: bool) -> int:
+    """Write the document starting at pos; return the position after it."""
+    end = pos + _INT32.unpack_from(data, pos)[0] - 1
+    pos += 4
+    append = out.append
+    append(b"[" if is_array else b"{")
+    separator = b""
+    # Common types are handled inline; the rest go through _write_value
+    while pos < end:
+        kind = data[pos]
+        name_end = data.index(b"\x00", pos + 1)
+        if is_array:
+            append(separator)
+        else:
+            name = data[pos + 1:name_end]
+            if _NEEDS_ESCAPE.search(name):
+                append(separator + _string(name) + b":")
+            else:
+                append(separator + b'"' + name + b'":')
+        separator = b","
+        pos = name_end + 1
+        if kind == 0x02:
+            length = _INT32.unpack_from(data, pos)[0]
+            append(_string(data[pos + 4:pos + 3 + length]))
+            pos += 4 + length
+        elif kind == 0x07:
+            append(b'"' + data[pos:pos + 12].hex().encode() + b'"')
+            pos += 12
+        elif kind == 0x10:
+            append(b"%d" % _INT32.unpack_from(data, pos)[0])
+            pos += 4
+        elif kind == 0x03 or kind == 0x04:
+            pos = _write_document(data, pos, out, kind == 0x04)
+        else:
+            pos = _write_value(data, kind, pos, out)
+    append(b"]" if is_array else b"}")
+    return end + 1
+
+
+def _write_value(data: bytes, kind: int, pos: int, out: List[bytes]) -> int:
+    if kind == 0x12:  # int64
+        out.append(b"%d" % _INT64.unpack_from(data, pos)[0])
+        return pos + 8
+    if kind == 0x01:  # double
+        out.append(_double(_DOUBLE.unpack_from(data, pos)[0]))
+        return pos + 8
+    if kind == 0x09:  # UTC datetime
+        out.append(_datetime(_INT64.unpack_from(data, pos)[0]))
+        return pos + 8
+    if kind == 0x0D or kind == 0x0E:  # code, symbol
+        length = _INT32.unpack_from(data, pos)[0]
+        out.append(_string(data[pos + 4:pos + 3 + length]))
+        return pos + 4 + length
+    if kind == 0x08:  # bool
+        out.append(b"true" if data[pos] else b"false")
+        return pos + 1
+    if kind == 0x0A or kind == 0x06:  # null, undefined
+        out.append(b"null")
+        return pos
+    if kind == 0x13:  # Decimal128
+        out.append(_decimal128(data[pos:pos + 16]))
+        return pos + 16
+    if kind == 0x05:  # binary
+        length = _INT32.unpack_from(data, pos)[0]
+        payload = data[pos + 5:pos + 5 + length]
+        out.append(b'"' + base64.b64encode(payload) + b'"')
+        return pos + 5 + length
+    if kind == 0x11:  # timestamp: increment then seconds
+        increment, seconds = _TIMESTAMP.unpack_from(data, pos)
+        out.append(b'{"t":%d,"i":%d}' % (seconds, increment))
+        return pos + 8
+    if kind == 0x0B:  # regex: two cstrings
+        pattern_end = data.index(b"\x00", pos)
+        options_end = data.index(b"\x00", pattern_end + 1)
+        out.append(b'{"$regex":' + _string(data[pos:pattern_end]))
+        out.append(b',"$options":' + _string(data[pattern_end + 1:options_end]) + b"}")
+        return options_end + 1
+    if kind == 0x0F:  # code with scope
+        code_length = _INT32.unpack_from(data, pos + 4)[0]
+        out.append(b'{"$code":' + _string(data[pos + 8:pos + 7 + code_length]) + b',"$scope":')
+        scope_end = _write_document(data, pos + 8 + code_length, out, is_array=False)
+        out.append(b"}")
+        return scope_end
+    if kind == 0x0C:  # DBPointer
+        length = _INT32.unpack_from(data, pos)[0]
+        ref = data[pos + 4:pos + 3 + length]
+        oid = data[pos + 4 + length:pos + 16 + length]
+        out.append(b'{"$ref":' + _string(ref) + b',"$id":"' + oid.hex().encode() + b'"}')
+        return pos + 16 + length
+    if kind == 0xFF:
+        out.append(b'{"$minKey":1}')
+        return pos
+    if kind == 0x7F:
+        out.append(b'{"$maxKey":1}')
+        return pos
+    raise ValueError(f"Unsupported BSON type 0x{kind:02x}")
+
+
+def document_to_json(raw: bytes) -> bytes:
+    out: List[bytes] = []
+    _write_document(raw, 0, out, is_array=False)
+    return b"".join(out)
+
+
+def documents_to_json_array(raw_documents: Iterable) -> bytes:
+    """Transcode RawBSONDocuments (or raw BSON bytes) into one JSON array."""
+    out: List[bytes] = [b"["]
+    first = True
+    for document in raw_documents:
+        if not first:
+            out.append(b",")
+        first = False
+        _write_document(getattr(document, "raw", document), 0, out, is_array=False)
+    out.append(b"]")
+    return b"".join(out)
@@ -0,0 +1,133 @@
+"""
+Delta sync for /changes: the rows of a table or collection newer than a
+watermark, and the watermark to send next time.
+
+Rows are read in (column, key) order, where column is a timestamp such as
+created_at and key the primary key (_id on MongoDB), and a watermark is
+the position of the last row sent. Many rows can share one timestamp, so
+the position carries the key as well:
+
+- While a delta is paged (has_more), the next page starts strictly after
+  the last row: column > v OR (column = v AND key > k). Rows sharing a
+  timestamp across a page boundary are neither skipped nor repeated.
+- Once the reader has caught up, the watermark only keeps the timestamp,
+  and the next sync starts at column >= v. Rows written later with that
+  same timestamp (a coarse DATE column, or a transaction that committed
+  after the read) but a smaller key are still picked up; the rows at v
+  are sent again, so consumers should upsert by key.
+
+When column is the key itself (_id, an ObjectId, by default on MongoDB)
+there are no ties and the watermark is always strict.
+
+Watermarks are opaque to clients: base64 of the table, column, key and
+position, encoded by the driver (plain JSON for SQL values, Extended JSON
+for BSON ones).
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+
+class InvalidWatermark(ValueError):
+    pass
+
+
+def encode_watermark(payload: str) -> str:
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_watermark(token: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidWatermark("Malformed watermark")
+
+
+class Position:
+    """Where a sync resumes; key_value is None for a caught-up (inclusive) position."""
+
+    def __init__(self, table: str, column: str, key: str, value: Any, key_value: Any):
+        self.table = table
+        self.column = column
+        self.key = key
+        self.value = value
+        self.key_value = key_value
+
+    def encode(self, dumps: Callable[..., str] = json.dumps) -> str:
+        state = {
+            "table": self.table,
+            "column": self.column,
+            "key": self.key,
+            "value": self.value,
+            "key_value": self.key_value,
+        }
+        return encode_watermark(dumps(state, separators=(",", ":")))
+
+    @classmethod
+    def decode(cls, token: str, loads: Callable[[str], Any] = json.loads) -> "Position":
+        try:
+            state = loads(decode_watermark(token))
+            return cls(
+                state["table"], state["column"], state["key"], state["value"], state["key_value"]
+            )
+        except InvalidWatermark:
+            raise
+        except (KeyError, TypeError, ValueError):
+            raise InvalidWatermark("Malformed watermark")
+
+
+class ChangeFeed:
+    """
+    Up to limit rows after start, read lazily and encoded as JSON bytes.
+    has_more and watermark() are final once iteration is done.
+    """
+
+    def __init__(
+        self,
+        table: str,
+        column: str,
+        key: str,
+        start: Optional[Position],
+        rows: Iterator[Any],
+        limit: int,
+        position_of: Callable[[Any], Tuple[Any, Any]],
+        encode_row: Callable[[Any], bytes],
+        dumps: Callable[..., str] = json.dumps,
+    ):
+        self.table = table
+        self.column = column
+        self.key = key
+        self.start = start
+        self.limit = limit
+        self.rows_read = 0
+        self.has_more = False
+        self._rows = rows
+        self._position_of = position_of
+        self._encode_row = encode_row
+        self._dumps = dumps
+        self._last: Any = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        try:
+            # The source reads limit + 1 rows; the extra one only says there are more
+            for row in self._rows:
+                if self.rows_read >= self.limit:
+                    self.has_more = True
+                    break
+                self.rows_read += 1
+                self._last = row
+                yield self._encode_row(row)
+        finally:
+            close = getattr(self._rows, "close", None)
+            if close is not None:
+                close()
+
+    def watermark(self) -> Optional[str]:
+        if self._last is None:
+            return self.start.encode(self._dumps) if self.start is not None else None
+        value, key_value = self._position_of(self._last)
+        if not self.has_more:
+            key_value = None
+        return Position(self.table, self.column, self.key, value, key_value).encode(self._dumps)
@@ -0,0 +1,102 @@
+"""
+Environment configuration shared by every connector backend.
+
+Read once at import time, like the per-script constants it replaces. See
+the bizcopilot-connector*.py docstrings for what each variable does.
+"""
+
+import os
+import tempfile
+
+API_KEY = os.getenv("CONNECTOR_API_KEY", "test-api-key-12345")
+# The default key above is public; it is only accepted when no key is configured
+API_KEY_SET = bool(os.getenv("CONNECTOR_API_KEY"))
+API_KEYS_JSON = os.getenv("CONNECTOR_API_KEYS", "").strip()
+WHITELISTED_IPS_RAW = os.getenv("WHITELISTED_IPS", "").strip()
+IP_VERDICT_CACHE_SIZE = int(os.getenv("IP_VERDICT_CACHE_SIZE", "4096"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+POOL_MIN_SIZE = int(os.getenv("POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("POOL_MAX_SIZE", "8"))
+MAX_PARTITIONS = int(os.getenv("MAX_PARTITIONS", "16"))
+HEALTH_INTERVAL_SECONDS = float(os.getenv("HEALTH_INTERVAL_SECONDS", "10"))
+WARMUP_QUERIES = [q.strip() for q in os.getenv("WARMUP_QUERIES", "").split(";") if q.strip()]
+WARMUP_COLLECTIONS = [
+    c.strip() for c in os.getenv("WARMUP_COLLECTIONS", "").split(",") if c.strip()
+]
+
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "0"))
+QUOTA_WINDOW_SECONDS = float(os.getenv("QUOTA_WINDOW_SECONDS", "60"))
+QUOTA_DB_SECONDS = float(os.getenv("QUOTA_DB_SECONDS", "0"))
+QUOTA_ROWS = int(os.getenv("QUOTA_ROWS", "0"))
+
+AGGREGATE_DEFAULT_LIMIT = int(os.getenv("AGGREGATE_DEFAULT_LIMIT", "1000"))
+AGGREGATE_ALLOW_DISK_USE = os.getenv("AGGREGATE_ALLOW_DISK_USE", "true").lower() == "true"
+AGGREGATE_CACHE_SECONDS = float(os.getenv("AGGREGATE_CACHE_SECONDS", "60"))
+AGGREGATE_CACHE_SIZE = int(os.getenv("AGGREGATE_CACHE_SIZE", "256"))
+
+SCHEMA_CHECK_SECONDS = float(os.getenv("SCHEMA_CHECK_SECONDS", "30"))
+SCHEMA_MAX_AGE_SECONDS = float(os.getenv("SCHEMA_MAX_AGE_SECONDS", "3600"))
+SCHEMA_SAMPLE_SIZE = int(os.getenv("SCHEMA_SAMPLE_SIZE", "100"))
+
+SAMPLE_CACHE_SECONDS = float(os.getenv("SAMPLE_CACHE_SECONDS", "300"))
+SAMPLE_CACHE_SIZE = int(os.getenv("SAMPLE_CACHE_SIZE", "256"))
+SAMPLE_MAX_ROWS = int(os.getenv("SAMPLE_MAX_ROWS", "100"))
+
+APPROXIMATE_SAMPLE_ROWS = int(os.getenv("APPROXIMATE_SAMPLE_ROWS", "100000"))
+APPROXIMATE_SCAN_ROWS = int(os.getenv("APPROXIMATE_SCAN_ROWS", "1000000"))
+
+CHANGES_MAX_ROWS = int(os.getenv("CHANGES_MAX_ROWS", "100000"))
+
+INDEX_ADVISOR_MAX_SHAPES = int(os.getenv("INDEX_ADVISOR_MAX_SHAPES", "1000"))
+
+JOB_DIR = os.getenv("JOB_DIR", os.path.join(tempfile.gettempdir(), "bizcopilot-jobs"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "100"))
+JOB_DEADLINE_SECONDS = float(os.getenv("JOB_DEADLINE_SECONDS", "3600"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+
+RESULT_BUFFER_MEMORY_MB = float(os.getenv("RESULT_BUFFER_MEMORY_MB", "32"))
+RESULT_SPILL_DIR = os.getenv("RESULT_SPILL_DIR", "").strip()
+
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", "0"))
+ROLLUP_LOOKBACK_DAYS = int(os.getenv("ROLLUP_LOOKBACK_DAYS", "2"))
+ROLLUP_REWRITE = os.getenv("ROLLUP_REWRITE", "false").lower() == "true"
+ROLLUP_DIR = os.getenv("ROLLUP_DIR", tempfile.gettempdir())
+
+READ_MODEL_REFRESH_SECONDS = float(os.getenv("READ_MODEL_REFRESH_SECONDS", "0"))
+READ_MODEL_LOOKBACK_SECONDS = float(os.getenv("READ_MODEL_LOOKBACK_SECONDS", "300"))
+READ_MODEL_MONGODB_URI = os.getenv("READ_MODEL_MONGODB_URI", "").strip()
+
+PRODUCT_INDEX_REFRESH_SECONDS = float(os.getenv("PRODUCT_INDEX_REFRESH_SECONDS", "0"))
+
+RESULT_CACHE_SECONDS = float(os.getenv("RESULT_CACHE_SECONDS", "0"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_MAX_ROWS = int(os.getenv("RESULT_CACHE_MAX_ROWS", "10000"))
+RESULT_CACHE_POLL_SECONDS = float(os.getenv("RESULT_CACHE_POLL_SECONDS", "2"))
+RESULT_CACHE_COLLECTIONS = [
+    c.strip()
+    for c in os.getenv("RESULT_CACHE_COLLECTIONS", "orders,order_history").split(",")
+    if c.strip()
+]
+
+SUBSCRIPTION_MIN_INTERVAL_SECONDS = float(os.getenv("SUBSCRIPTION_MIN_INTERVAL_SECONDS", "1"))
+SUBSCRIPTION_MAX_QUERIES = int(os.getenv("SUBSCRIPTION_MAX_QUERIES", "100"))
+SUBSCRIPTION_KEEPALIVE_SECONDS = float(os.getenv("SUBSCRIPTION_KEEPALIVE_SECONDS", "15"))
+
+RESULT_DELTA_SECONDS = float(os.getenv("RESULT_DELTA_SECONDS", "300"))
+RESULT_DELTA_SIZE = int(os.getenv("RESULT_DELTA_SIZE", "256"))
+RESULT_DELTA_MAX_ROWS = int(os.getenv("RESULT_DELTA_MAX_ROWS", "10000"))
+
+COST_GUARD_MAX_COST = float(os.getenv("COST_GUARD_MAX_COST", "0"))
+COST_GUARD_MAX_ROWS = int(os.getenv("COST_GUARD_MAX_ROWS", "0"))
+COST_GUARD_ACTION = os.getenv("COST_GUARD_ACTION", "reject").strip().lower()
+COST_GUARD_CACHE_SECONDS = float(os.getenv("COST_GUARD_CACHE_SECONDS", "300"))
+COST_GUARD_CACHE_SIZE = int(os.getenv("COST_GUARD_CACHE_SIZE", "1024"))
+COST_GUARD_REPLICA_URL = os.getenv("COST_GUARD_REPLICA_URL", "").strip()
+# Per backend, for the multi-backend app; these win over COST_GUARD_REPLICA_URL
+COST_GUARD_REPLICA_URLS = {
+    database_type: os.getenv(f"{database_type.upper()}_REPLICA_URL", "").strip()
+    for database_type in ("postgresql", "mysql")
+}
@@ -0,0 +1,1108 @@
+"""
+Connector core: one FastAPI app serving one or more database backends.
+
+The IP whitelist, API key check, request models and the /execute, /jobs,
+/export, /health, /ready, /schema, /sample, /changes, /index-advice,
+/rollups, /read-model, /search/products, /result-cache, /subscribe and
+/cost-guard endpoints are shared. Each backend is a Driver plugin with
+its own pooled engine; /execute routes on the request's database_type,
+so a single process (one set of uvicorn workers) can serve PostgreSQL,
+MySQL and MongoDB side by side.
+"""
+
+import ipaddress
+import json
+import logging
+import math
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import uvicorn
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic_core import to_json
+
+from bizcopilot_connector import config
+from bizcopilot_connector.changes import InvalidWatermark
+from bizcopilot_connector.costguard import QueryTooExpensive
+from bizcopilot_connector.drivers import Driver, load_driver
+from bizcopilot_connector.ipmatch import IPWhitelist
+from bizcopilot_connector.jobs import JobManager, JobsBusy
+from bizcopilot_connector.models import (
+    ApproximateQueryResponse,
+    ExportRequest,
+    JobRequest,
+    QueryRequest,
+    QueryResponse,
+    SubscriptionRequest,
+)
+from bizcopilot_connector.ratelimit import QuotaExceeded, QuotaManager, load_policies
+from bizcopilot_connector.resultdiff import (
+    ResultHash,
+    ResultVersions,
+    data_bytes,
+    hash_chunks,
+    json_array,
+    normalize_hash,
+    row_encodings,
+)
+from bizcopilot_connector.rollups import RollupSourceMismatch
+from bizcopilot_connector.schema import content_etag
+from bizcopilot_connector.subscriptions import SubscriptionHub, SubscriptionsBusy, sse_event
+
+logger = logging.getLogger("connector")
+
+
+def configure_logging() -> None:
+    logger.setLevel(config.LOG_LEVEL)
+    if not logger.handlers:
+        handler = logging.StreamHandler(stream=sys.stdout)
+        handler.setLevel(config.LOG_LEVEL)
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+        )
+        logger.addHandler(handler)
+
+
+def parse_whitelist(raw: str) -> List[ipaddress._BaseNetwork]:
+    networks: List[ipaddress._BaseNetwork] = []
+    for token in [t.strip() for t in raw.split(",") if t.strip()]:
+        try:
+            if "/" in token:
+                networks.append(ipaddress.ip_network(token, strict=False))
+            else:
+                if ":" in token:
+                    networks.append(ipaddress.ip_network(token + "/128", strict=False))
+                else:
+                    networks.append(ipaddress.ip_network(token + "/32", strict=False))
+        except ValueError:
+            pass
+    return networks
+
+
+def verify_api_key(request: Request, x_api_key: str = Header(...)):
+    if request.app.state.quotas.policy(x_api_key) is None:
+        raise HTTPException(status_code=401, detail="Invalid API key")
+    return x_api_key
+
+
+def _select(drivers: Dict[str, Driver], database_type: Optional[str]) -> List[Driver]:
+    if database_type is None:
+        return list(drivers.values())
+    if database_type not in drivers:
+        raise HTTPException(status_code=400, detail=f"Unknown database type: {database_type}")
+    return [drivers[database_type]]
+
+
+def _combine(
+    selected: List[Driver], state_of: Callable[[Driver], Dict[str, Any]], ok_status: str
+) -> Dict[str, Any]:
+    """One backend keeps the flat single-connector shape; several are nested under "backends"."""
+    if len(selected) == 1:
+        driver = selected[0]
+        return {**state_of(driver), "database_type": driver.database_type}
+    backends = {driver.database_type: state_of(driver) for driver in selected}
+    all_ok = all(state["status"] == ok_status for state in backends.values())
+    return {"status": ok_status if all_ok else "degraded", "backends": backends}
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def record_shapes(driver: Driver, query_text: str, seconds: float) -> None:
+    """Feed the index advisor; a query it cannot read must never fail the request."""
+    try:
+        driver.shape_recorder.record(query_text, seconds)
+    except Exception:
+        logger.debug("Could not extract query shapes", exc_info=True)
+
+
+def _rate_limited(exc: QuotaExceeded, request_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+        content={
+            "success": False,
+            "error": str(exc),
+            "error_code": exc.error_code,
+            "request_id": request_id,
+            "retry_after_seconds": round(exc.retry_after, 3),
+        },
+    )
+
+
+def _envelope_tail(
+    result: Dict[str, Any],
+    execution_time_ms: int,
+    request_id: str,
+    approximation: Optional[Dict[str, Any]],
+    result_hash: str,
+) -> bytes:
+    """The QueryResponse fields that follow "data", as JSON bytes."""
+    tail = b',"rows_affected":%d,"execution_time_ms":%d,"request_id":%s,"result_hash":"%s"' % (
+        result["rows_affected"],
+        execution_time_ms,
+        json.dumps(request_id).encode(),
+        result_hash.encode(),
+    )
+    if approximation is not None:
+        tail += b',"approximation":' + json.dumps(approximation).encode()
+    if result.get("cost_guard") is not None:
+        tail += b',"cost_guard":' + json.dumps(result["cost_guard"]).encode()
+    return tail + b"}"
+
+
+def _too_expensive(exc: QueryTooExpensive, request_id: str, execution_time_ms: int):
+    return JSONResponse(
+        status_code=422,
+        content={
+            "success": False,
+            "error": str(exc),
+            "error_code": exc.error_code,
+            "request_id": request_id,
+            "execution_time_ms": execution_time_ms,
+            "cost_guard": exc.details,
+        },
+    )
+
+
+def _raw_query_response(
+    result: Dict[str, Any],
+    data_json: bytes,
+    execution_time_ms: int,
+    request_id: str,
+    approximation: Optional[Dict[str, Any]],
+    result_hash: str,
+):
+    """
+    QueryResponse for rows already encoded as a JSON array (data_json),
+    spliced in as bytes instead of being parsed and re-encoded.
+    """
+    body = b"".join(
+        [
+            b'{"success":true,"data":',
+            data_json,
+            _envelope_tail(result, execution_time_ms, request_id, approximation, result_hash),
+        ]
+    )
+    return Response(content=body, media_type="application/json")
+
+
+def _delta_query_response(
+    result: Dict[str, Any],
+    execution_time_ms: int,
+    request_id: str,
+    approximation: Optional[Dict[str, Any]],
+    result_hash: str,
+    base_hash: str,
+    added: List[bytes],
+    removed: List[bytes],
+):
+    """QueryResponse without data, and the rows added and removed since base_hash."""
+    body = b"".join(
+        [
+            b'{"success":true,"data":null,"delta":{"base":"%s","added":' % base_hash.encode(),
+            json_array(added),
+            b',"removed":',
+            json_array(removed),
+            b"}",
+            _envelope_tail(result, execution_time_ms, request_id, approximation, result_hash),
+        ]
+    )
+    return Response(content=body, media_type="application/json")
+
+
+def _buffered_query_response(
+    result: Dict[str, Any],
+    execution_time_ms: int,
+    request_id: str,
+    approximation: Optional[Dict[str, Any]],
+    result_hash: Optional[str] = None,
+):
+    """
+    QueryResponse for a result that spilled to disk (data_buffer), streamed
+    from the buffer so the whole body is never held in memory. Without a
+    result_hash, it is computed on the way.
+    """
+    buffer = result["data_buffer"]
+
+    def body():
+        hashed = ResultHash()
+        try:
+            yield b'{"success":true,"data":'
+            for chunk in buffer.json_chunks():
+                yield hashed.update(chunk)
+            yield _envelope_tail(
+                result,
+                execution_time_ms,
+                request_id,
+                approximation,
+                result_hash or hashed.hexdigest(),
+            )
+        finally:
+            buffer.close()
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
+def _not_modified(result_hash: str) -> Response:
+    return Response(status_code=304, headers={"ETag": f'"{result_hash}"'})
+
+
+def create_app(backends: Dict[str, str], title: str = "BizCopilot Connector") -> FastAPI:
+    """
+    Build the connector app for {database_type: database_url}. Drivers are
+    created up front but connect lazily; warm-up starts with the app.
+    """
+    configure_logging()
+    drivers = {
+        database_type: load_driver(database_type, url) for database_type, url in backends.items()
+    }
+    whitelist = IPWhitelist(
+        parse_whitelist(config.WHITELISTED_IPS_RAW), cache_size=config.IP_VERDICT_CACHE_SIZE
+    )
+
+    app = FastAPI(
+        title=title,
+        description="External database connector for BizCopilot",
+        version="1.0.0",
+    )
+    app.state.drivers = drivers
+    app.state.quotas = QuotaManager(load_policies())
+    app.state.jobs = JobManager(
+        config.JOB_DIR,
+        workers=config.JOB_WORKERS,
+        max_pending=config.JOB_MAX_PENDING,
+        default_deadline_seconds=config.JOB_DEADLINE_SECONDS,
+        ttl_seconds=config.JOB_RESULT_TTL_SECONDS,
+        on_finish=app.state.quotas.record,
+    )
+    # Encoded rows of recent results, for "delta": true requests
+    app.state.result_versions = ResultVersions(
+        config.RESULT_DELTA_SECONDS, config.RESULT_DELTA_SIZE, config.RESULT_DELTA_MAX_ROWS
+    )
+    app.state.subscriptions = SubscriptionHub(
+        config.SUBSCRIPTION_MAX_QUERIES, config.SUBSCRIPTION_MIN_INTERVAL_SECONDS
+    )
+
+    @app.middleware("http")
+    async def ip_whitelist_middleware(request: Request, call_next):
+        if not whitelist:
+            return await call_next(request)
+
+        xff = request.headers.get("x-forwarded-for")
+        client_ip = None
+        if xff:
+            client_ip = xff.partition(",")[0].strip()
+        elif request.client:
+            client_ip = request.client.host
+
+        if not client_ip:
+            return JSONResponse(
+                status_code=400, content={"detail": "Unable to determine client IP"}
+            )
+
+        try:
+            allowed = whitelist.allows(client_ip)
+        except ValueError:
+            return JSONResponse(status_code=400, content={"detail": "Invalid client IP format"})
+
+        if not allowed:
+            return JSONResponse(status_code=403, content={"detail": "IP not allowed"})
+
+        return await call_next(request)
+
+    @app.on_event("startup")
+    def start_background_tasks():
+        for driver in drivers.values():
+            driver.start()
+        app.state.jobs.start()
+
+    @app.on_event("shutdown")
+    def stop_background_tasks():
+        app.state.subscriptions.close()
+        app.state.jobs.stop()
+        for driver in drivers.values():
+            driver.stop()
+
+    @app.get("/health")
+    async def health_check(
+        deep: bool = False,
+        database_type: Optional[str] = None,
+        api_key: str = Depends(verify_api_key),
+    ):
+        # Answer from the probers' cached state; ?deep=true probes the database inline
+        selected = _select(drivers, database_type)
+        if deep:
+            states = {
+                d.database_type: await run_in_threadpool(d.health_prober.refresh) for d in selected
+            }
+        else:
+            states = {d.database_type: d.health_prober.snapshot() for d in selected}
+        content = _combine(selected, lambda d: states[d.database_type], "healthy")
+        content["timestamp"] = datetime.utcnow().isoformat()
+        if content["status"] != "healthy":
+            return JSONResponse(status_code=503, content=content)
+        return content
+
+    @app.get("/ready")
+    async def readiness_check(database_type: Optional[str] = None):
+        # Unauthenticated so orchestrator probes can call it; reports step status only
+        selected = _select(drivers, database_type)
+        content = _combine(selected, lambda d: d.readiness_gate.state(), "ready")
+        content["timestamp"] = datetime.utcnow().isoformat()
+        if content["status"] != "ready":
+            return JSONResponse(status_code=503, content=content)
+        return content
+
+    @app.get("/index-advice")
+    async def index_advice(
+        database_type: Optional[str] = None,
+        limit: int = 10,
+        api_key: str = Depends(verify_api_key),
+    ):
+        # Composite indexes for the most expensive observed query shapes, each
+        # checked against an EXPLAIN of a sample query; nothing is created
+        selected = _select(drivers, database_type)
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, "")
+        started = time.perf_counter()
+        try:
+            advice = {
+                d.database_type: await run_in_threadpool(d.index_advice, limit) for d in selected
+            }
+        finally:
+            # Every candidate costs an EXPLAIN (and hypopg calls on PostgreSQL)
+            app.state.quotas.record(api_key, time.perf_counter() - started, 0)
+        if len(selected) == 1:
+            return {**advice[selected[0].database_type], "database_type": selected[0].database_type}
+        return {"backends": advice}
+
+    @app.get("/schema")
+    async def schema(
+        request: Request,
+        database_type: Optional[str] = None,
+        refresh: bool = False,
+        api_key: str = Depends(verify_api_key),
+    ):
+        # Tables, columns, indexes and row estimates from a cached snapshot that is
+        # rebuilt when the catalog version changes; ?refresh=true rebuilds it now
+        selected = _select(drivers, database_type)
+        # A forced rebuild reads the whole catalog; cached snapshots are free
+        if refresh:
+            try:
+                app.state.quotas.admit(api_key)
+            except QuotaExceeded as exc:
+                return _rate_limited(exc, "")
+        started = time.perf_counter()
+        try:
+            snapshots = {
+                d.database_type: await run_in_threadpool(d.schema_cache.get, refresh)
+                for d in selected
+            }
+        finally:
+            # Version checks and rebuilds count whether or not refresh was asked for
+            app.state.quotas.record(api_key, time.perf_counter() - started, 0)
+        if len(selected) == 1:
+            database_type = selected[0].database_type
+            content = {"success": True, **snapshots[database_type], "database_type": database_type}
+        else:
+            etag = content_etag({name: snapshot["etag"] for name, snapshot in snapshots.items()})
+            content = {"success": True, "etag": etag, "backends": snapshots}
+        headers = {"ETag": content["etag"], "Cache-Control": "private, no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), content["etag"]):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content=content, headers=headers)
+
+    @app.get("/sample")
+    async def sample(
+        table: str,
+        size: int = 5,
+        database_type: Optional[str] = None,
+        refresh: bool = False,
+        api_key: str = Depends(verify_api_key),
+    ):
+        # Representative rows of one table or collection, drawn without a scan
+        # and cached per table for SAMPLE_CACHE_SECONDS
+        selected = _select(drivers, database_type)
+        if len(selected) > 1:
+            raise HTTPException(status_code=400, detail="Pass database_type to pick a backend")
+        driver = selected[0]
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, "")
+        started = time.perf_counter()
+        rows = 0
+        try:
+            result = await run_in_threadpool(driver.table_sample, table, size, refresh)
+            rows = 0 if result["cached"] else result["rows_affected"]
+        finally:
+            app.state.quotas.record(api_key, time.perf_counter() - started, rows)
+        content = {"success": True, **result, "database_type": driver.database_type}
+        # Encoded like /execute rows (decimals as strings, ISO dates)
+        return Response(content=to_json(content), media_type="application/json")
+
+    @app.get("/changes")
+    async def changes(
+        table: str,
+        watermark: Optional[str] = None,
+        column: Optional[str] = None,
+        limit: int = 10000,
+        database_type: Optional[str] = None,
+        api_key: str = Depends(verify_api_key),
+    ):
+        # Rows newer than an opaque watermark, streamed, and the watermark to
+        # send next time; see bizcopilot_connector.changes for tie handling
+        def error(status_code: int, message: str, error_code: str) -> JSONResponse:
+            return JSONResponse(
+                status_code=status_code,
+                content={"success": False, "error": message, "error_code": error_code},
+            )
+
+        selected = _select(drivers, database_type)
+        if len(selected) > 1:
+            return error(400, "Pass database_type to pick a backend", "INVALID_CHANGES")
+        driver = selected[0]
+        if not 1 <= limit <= config.CHANGES_MAX_ROWS:
+            message = f"limit must be between 1 and {config.CHANGES_MAX_ROWS}"
+            return error(400, message, "INVALID_CHANGES")
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, "")
+
+        db_started = time.perf_counter()
+        rows = None
+        try:
+            feed = await run_in_threadpool(driver.changes, table, column, watermark, limit)
+            rows = iter(feed)
+            # Wait for the first row so that query errors still get a JSON error response
+            first = await run_in_threadpool(next, rows, None)
+        except Exception as exc:
+            if rows is not None:
+                rows.close()
+            app.state.quotas.record(api_key, time.perf_counter() - db_started, 0)
+            if isinstance(exc, InvalidWatermark):
+                return error(400, str(exc), "INVALID_WATERMARK")
+            if isinstance(exc, HTTPException):
+                return error(exc.status_code, str(exc.detail), "INVALID_CHANGES")
+            return error(500, str(exc), "CHANGES_ERROR")
+
+        def body():
+            try:
+                chunk = bytearray(b'{"success":true,"database_type":')
+                chunk += json.dumps(driver.database_type).encode()
+                chunk += b',"table":' + json.dumps(table).encode() + b',"data":['
+                if first is not None:
+                    chunk += first
+                    for row in rows:
+                        chunk += b"," + row
+                        if len(chunk) >= 64 * 1024:
+                            yield bytes(chunk)
+                            chunk.clear()
+                chunk += b'],"rows_affected":%d,"has_more":%s,"watermark":%s}' % (
+                    feed.rows_read,
+                    b"true" if feed.has_more else b"false",
+                    json.dumps(feed.watermark()).encode(),
+                )
+                yield bytes(chunk)
+            finally:
+                rows.close()
+                app.state.quotas.record(
+                    api_key, time.perf_counter() - db_started, feed.rows_read
+                )
+
+        return StreamingResponse(body(), media_type="application/json")
+
+    def _rollup_driver(database_type: Optional[str]) -> Driver:
+        selected = [d for d in _select(drivers, database_type) if d.rollups is not None]
+        if not selected:
+            raise HTTPException(
+                status_code=404, detail="Rollups are not enabled; set ROLLUP_REFRESH_SECONDS"
+            )
+        if len(selected) > 1:
+            raise HTTPException(status_code=400, detail="Pass database_type to pick a backend")
+        return selected[0]
+
+    async def _from_rollups(call: Callable[..., Any], *args: Any) -> Any:
+        try:
+            return await run_in_threadpool(call, *args)
+        except RollupSourceMismatch as exc:
+            raise HTTPException(status_code=409, detail=str(exc))
+
+    def _rollup_rows(driver: Driver, read: Callable[[], List[Dict[str, Any]]]) -> Dict[str, Any]:
+        try:
+            data = read()
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        watermark = driver.rollups.watermark()
+        return {
+            "success": True,
+            "database_type": driver.database_type,
+            "watermark": watermark.isoformat() if watermark else None,
+            "data": data,
+            "rows_affected": len(data),
+        }
+
+    @app.get("/rollups")
+    async def rollup_status(
+        database_type: Optional[str] = None, api_key: str = Depends(verify_api_key)
+    ):
+        driver = _rollup_driver(database_type)
+        status = await _from_rollups(driver.rollups.status)
+        return {**status, "database_type": driver.database_type}
+
+    @app.get("/rollups/sales")
+    async def rollup_sales(
+        database_type: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        granularity: str = "day",
+        api_key: str = Depends(verify_api_key),
+    ):
+        # Orders and revenue per tenant and day/month, from the rollups
+        driver = _rollup_driver(database_type)
+        return await _from_rollups(
+            _rollup_rows,
+            driver,
+            lambda: driver.rollups.sales(tenant_id, start, end, granularity),
+        )
+
+    @app.get("/rollups/products")
+    async def rollup_products(
+        database_type: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: int = 10,
+        order_by: str = "revenue",
+        api_key: str = Depends(verify_api_key),
+    ):
+        # Top products by revenue or quantity, from the rollups
+        driver = _rollup_driver(database_type)
+        return await _from_rollups(
+            _rollup_rows,
+            driver,
+            lambda: driver.rollups.top_products(tenant_id, start, end, limit, order_by),
+        )
+
+    @app.post("/rollups/refresh")
+    async def rollup_refresh(
+        database_type: Optional[str] = None, api_key: str = Depends(verify_api_key)
+    ):
+        driver = _rollup_driver(database_type)
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, "")
+        started = time.perf_counter()
+        try:
+            result = await _from_rollups(driver.rollups.refresh, driver.fetch_source)
+        finally:
+            app.state.quotas.record(api_key, time.perf_counter() - started, 0)
+        return {**result, "database_type": driver.database_type}
+
+    def _read_model_driver() -> Driver:
+        selected = [d for d in drivers.values() if d.read_model is not None]
+        if not selected:
+            raise HTTPException(
+                status_code=404,
+                detail="The read model is not enabled; set READ_MODEL_REFRESH_SECONDS",
+            )
+        return selected[0]
+
+    @app.get("/read-model")
+    async def read_model_status(api_key: str = Depends(verify_api_key)):
+        # Document count, per-source watermarks and the last refresh of orders_enriched
+        driver = _read_model_driver()
+        status = await run_in_threadpool(driver.read_model.status)
+        return {**status, "database_type": driver.database_type}
+
+    @app.post("/read-model/refresh")
+    async def read_model_refresh(api_key: str = Depends(verify_api_key)):
+        driver = _read_model_driver()
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, "")
+        started = time.perf_counter()
+        try:
+            result = await run_in_threadpool(driver.read_model.refresh)
+        finally:
+            app.state.quotas.record(api_key, time.perf_counter() - started, 0)
+        return {**result, "database_type": driver.database_type}
+
+    def _product_index_driver(database_type: Optional[str]) -> Driver:
+        selected = [d for d in _select(drivers, database_type) if d.product_index is not None]
+        if not selected:
+            raise HTTPException(
+                status_code=404,
+                detail="The product index is not enabled; set PRODUCT_INDEX_REFRESH_SECONDS",
+            )
+        if len(selected) > 1:
+            raise HTTPException(status_code=400, detail="Pass database_type to pick a backend")
+        return selected[0]
+
+    @app.get("/search/products")
+    async def search_products(
+        q: str,
+        tenant_id: Optional[str] = None,
+        limit: int = 10,
+        min_score: float = 0.3,
+        database_type: Optional[str] = None,
+        api_key: str = Depends(verify_api_key),
+    ):
+        # Fuzzy product name lookup in the in-memory trigram index; the exact
+        # names returned are meant for product_name IN (...) filters
+        driver = _product_index_driver(database_type)
+        index = driver.product_index
+        if not index.ready:
+            raise HTTPException(status_code=503, detail="The product index is still being built")
+        if not 1 <= limit <= 100:
+            raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+        started = time.perf_counter()
+        data = index.search(q, tenant_id, limit, min_score)
+        return {
+            "success": True,
+            "database_type": driver.database_type,
+            "query": q,
+            "tenant_id": tenant_id,
+            "data": data,
+            "rows_affected": len(data),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "refreshed_at": index.last_refresh["refreshed_at"],
+        }
+
+    @app.get("/search/products/status")
+    async def product_index_status(
+        database_type: Optional[str] = None, api_key: str = Depends(verify_api_key)
+    ):
+        driver = _product_index_driver(database_type)
+        return {**driver.product_index.status(), "database_type": driver.database_type}
+
+    @app.post("/search/products/refresh")
+    async def product_index_refresh(
+        database_type: Optional[str] = None, api_key: str = Depends(verify_api_key)
+    ):
+        driver = _product_index_driver(database_type)
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, "")
+        started = time.perf_counter()
+        try:
+            result = await run_in_threadpool(driver.product_index.refresh)
+        finally:
+            app.state.quotas.record(api_key, time.perf_counter() - started, 0)
+        return {**result, "database_type": driver.database_type}
+
+    @app.get("/result-cache")
+    async def result_cache_status(
+        database_type: Optional[str] = None, api_key: str = Depends(verify_api_key)
+    ):
+        # Watched tables and hit counts of the change-invalidated /execute cache
+        selected = [d for d in _select(drivers, database_type) if d.change_watcher is not None]
+        if not selected:
+            raise HTTPException(
+                status_code=404, detail="The result cache is not enabled; set RESULT_CACHE_SECONDS"
+            )
+        status = {d.database_type: d.change_watcher.status() for d in selected}
+        if len(selected) == 1:
+            return {**status[selected[0].database_type], "database_type": selected[0].database_type}
+        return {"backends": status}
+
+    @app.get("/cost-guard")
+    async def cost_guard_status(
+        database_type: Optional[str] = None, api_key: str = Depends(verify_api_key)
+    ):
+        # Limits and verdict counts of the pre-flight EXPLAIN check
+        selected = [d for d in _select(drivers, database_type) if d.cost_guard is not None]
+        if not selected:
+            raise HTTPException(
+                status_code=404,
+                detail=(
+                    "The cost guard is not enabled; set COST_GUARD_MAX_COST or COST_GUARD_MAX_ROWS"
+                ),
+            )
+        status = {d.database_type: d.cost_guard.status() for d in selected}
+        if len(selected) == 1:
+            return {**status[selected[0].database_type], "database_type": selected[0].database_type}
+        return {"backends": status}
+
+    @app.post("/subscribe")
+    async def subscribe(
+        subscription: SubscriptionRequest,
+        request: Request,
+        api_key: str = Depends(verify_api_key),
+    ):
+        # Server-Sent Events: every subscriber of the same query shares one
+        # execution per interval and only hears about results that changed
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, subscription.request_id)
+        driver = drivers.get(subscription.database_type)
+        if driver is None:
+            configured = ", ".join(drivers)
+            raise HTTPException(
+                status_code=400,
+                detail=f"Database type mismatch. Connector is configured for {configured}",
+            )
+
+        def payload(content: Dict[str, Any]) -> bytes:
+            return json.dumps(content, default=str, separators=(",", ":")).encode()
+
+        async def run():
+            db_started = time.perf_counter()
+            rows = 0
+            try:
+                result = await run_in_threadpool(driver.execute_cached, subscription)
+                rows = result.get("rows_affected") or 0
+            except QueryTooExpensive as exc:
+                failure = {
+                    "success": False,
+                    "error": str(exc),
+                    "error_code": exc.error_code,
+                    "cost_guard": exc.details,
+                }
+                return "error", payload(failure), True
+            except Exception as exc:
+                failure = {
+                    "success": False,
+                    "error": str(exc),
+                    "error_code": "QUERY_EXECUTION_ERROR",
+                }
+                # A query the driver rejects will not pass on the next run either
+                rejected = isinstance(exc, HTTPException) and exc.status_code < 500
+                return "error", payload(failure), rejected
+            finally:
+                db_seconds = time.perf_counter() - db_started
+                app.state.quotas.record(api_key, db_seconds, rows)
+            record_shapes(driver, subscription.query, db_seconds)
+            if "data_buffer" in result:
+                result["data_buffer"].close()
+                failure = {
+                    "success": False,
+                    "error": "The result is too large to subscribe to; use /jobs",
+                    "error_code": "SUBSCRIPTION_TOO_LARGE",
+                }
+                return "error", payload(failure), True
+            data = result["data_json"] if "data_json" in result else to_json(result["data"])
+            # Nothing that differs between identical results, such as timings
+            body = b'{"success":true,"data":%s,"rows_affected":%d' % (data, rows)
+            if result.get("approximation") is not None:
+                body += b',"approximation":' + payload(result["approximation"])
+            if result.get("cost_guard") is not None:
+                body += b',"cost_guard":' + payload(result["cost_guard"])
+            return "result", body + b"}", False
+
+        def watch(wake: Callable[[], None]) -> Callable[[], None]:
+            cache = driver.result_cache
+            tables = driver.tables_read(subscription) if cache is not None else None
+            if tables is None:
+                return lambda: None
+
+            def on_change(table: Optional[str]) -> None:
+                if table is None or table in tables:
+                    wake()
+
+            cache.add_listener(on_change)
+            return lambda: cache.remove_listener(on_change)
+
+        partition = subscription.partition
+        key = (
+            subscription.database_type,
+            subscription.query,
+            subscription.approximate,
+            partition.model_dump_json() if partition is not None else None,
+        )
+        try:
+            subscriber = app.state.subscriptions.subscribe(
+                key, driver.database_type, subscription.interval_seconds, run, watch
+            )
+        except SubscriptionsBusy as exc:
+            return JSONResponse(
+                status_code=503,
+                headers={"Retry-After": "5"},
+                content={
+                    "success": False,
+                    "error": str(exc),
+                    "error_code": "SUBSCRIPTIONS_BUSY",
+                    "request_id": subscription.request_id,
+                },
+            )
+
+        async def events():
+            try:
+                while True:
+                    message = await subscriber.next(config.SUBSCRIPTION_KEEPALIVE_SECONDS)
+                    if message is None:
+                        if await request.is_disconnected():
+                            break
+                        # Comment line: keeps proxies from closing an idle stream
+                        yield b": keepalive\n\n"
+                        continue
+                    yield sse_event(message)
+                    if message.final:
+                        break
+            finally:
+                app.state.subscriptions.unsubscribe(subscriber)
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/subscriptions")
+    async def subscriptions_status(api_key: str = Depends(verify_api_key)):
+        return app.state.subscriptions.status()
+
+    @app.post("/jobs", status_code=202)
+    async def submit_job(job_request: JobRequest, api_key: str = Depends(verify_api_key)):
+        # Long queries run on the job pool and are written to a result file
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, job_request.request_id)
+
+        def error(status_code: int, message: str, error_code: str, **headers) -> JSONResponse:
+            return JSONResponse(
+                status_code=status_code,
+                headers=headers or None,
+                content={
+                    "success": False,
+                    "error": message,
+                    "error_code": error_code,
+                    "request_id": job_request.request_id,
+                },
+            )
+
+        driver = drivers.get(job_request.database_type)
+        if driver is None:
+            configured = ", ".join(drivers)
+            message = f"Database type mismatch. Connector is configured for {configured}"
+            return error(400, message, "INVALID_JOB")
+        try:
+            job = await run_in_threadpool(
+                app.state.jobs.submit,
+                api_key,
+                driver,
+                job_request,
+                job_request.format,
+                job_request.deadline_seconds,
+            )
+        except HTTPException as exc:
+            return error(exc.status_code, str(exc.detail), "INVALID_JOB")
+        except ValueError as exc:
+            return error(400, str(exc), "INVALID_JOB")
+        except JobsBusy as exc:
+            return error(503, str(exc), "JOBS_BUSY", **{"Retry-After": "5"})
+        return {
+            "success": True,
+            **job.as_dict(app.state.jobs.ttl_seconds),
+            "status_url": f"/jobs/{job.id}",
+            "result_url": f"/jobs/{job.id}/result",
+        }
+
+    def _job_or_404(api_key: str, job_id: str):
+        job = app.state.jobs.get(api_key, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found or expired")
+        return job
+
+    @app.get("/jobs/{job_id}")
+    async def job_status(job_id: str, api_key: str = Depends(verify_api_key)):
+        job = _job_or_404(api_key, job_id)
+        return job.as_dict(app.state.jobs.ttl_seconds)
+
+    @app.get("/jobs/{job_id}/result")
+    async def job_result(job_id: str, api_key: str = Depends(verify_api_key)):
+        job = _job_or_404(api_key, job_id)
+        if job.status != "succeeded" or job.path is None:
+            return JSONResponse(
+                status_code=409,
+                content={"success": False, **job.as_dict(app.state.jobs.ttl_seconds)},
+            )
+        return FileResponse(job.path, media_type=job.media_type, filename=job.filename)
+
+    @app.delete("/jobs/{job_id}")
+    async def cancel_job(job_id: str, api_key: str = Depends(verify_api_key)):
+        job = _job_or_404(api_key, job_id)
+        app.state.jobs.cancel(job)
+        return job.as_dict(app.state.jobs.ttl_seconds)
+
+    @app.post("/export")
+    async def export_query(export_request: ExportRequest, api_key: str = Depends(verify_api_key)):
+        # Bulk extract streamed as raw COPY output instead of a JSON envelope
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, export_request.request_id)
+
+        def error(status_code: int, message: str, error_code: str) -> JSONResponse:
+            return JSONResponse(
+                status_code=status_code,
+                content={
+                    "success": False,
+                    "error": message,
+                    "error_code": error_code,
+                    "request_id": export_request.request_id,
+                },
+            )
+
+        driver = drivers.get(export_request.database_type)
+        if driver is None:
+            configured = ", ".join(drivers)
+            return error(
+                400,
+                f"Database type mismatch. Connector is configured for {configured}",
+                "INVALID_EXPORT",
+            )
+
+        db_started = time.perf_counter()
+        stream = None
+        try:
+            stream = driver.export(export_request)
+            # Wait for the first chunk so that SQL errors still get a JSON error response
+            first = await run_in_threadpool(next, stream, b"")
+        except Exception as exc:
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+            app.state.quotas.record(api_key, time.perf_counter() - db_started, 0)
+            if isinstance(exc, HTTPException):
+                return error(exc.status_code, str(exc.detail), "INVALID_EXPORT")
+            return error(500, str(exc), "EXPORT_ERROR")
+
+        def body():
+            try:
+                yield first
+                yield from stream
+            finally:
+                if hasattr(stream, "close"):
+                    stream.close()
+                rows = getattr(stream, "result", None) or 0
+                app.state.quotas.record(api_key, time.perf_counter() - db_started, rows)
+
+        extension, media_type = {
+            "csv": ("csv", "text/csv"),
+            "binary": ("bin", "application/octet-stream"),
+        }[export_request.format]
+        filename = re.sub(r"[^A-Za-z0-9_.-]", "_", export_request.request_id) or "export"
+        return StreamingResponse(
+            body(),
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'},
+        )
+
+    @app.post("/execute", response_model=Union[ApproximateQueryResponse, QueryResponse])
+    async def execute_query(query_request: QueryRequest, api_key: str = Depends(verify_api_key)):
+        start_time = time.time()
+        try:
+            app.state.quotas.admit(api_key)
+        except QuotaExceeded as exc:
+            return _rate_limited(exc, query_request.request_id)
+
+        try:
+            driver = drivers.get(query_request.database_type)
+            if driver is None:
+                configured = ", ".join(drivers)
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Database type mismatch. Connector is configured for {configured}",
+                )
+
+            # Drivers block on I/O; keep the event loop free for other backends
+            db_started = time.perf_counter()
+            rows = 0
+            try:
+                result = await run_in_threadpool(driver.execute_cached, query_request)
+                rows = result.get("rows_affected") or 0
+            finally:
+                db_seconds = time.perf_counter() - db_started
+                app.state.quotas.record(api_key, db_seconds, rows)
+            record_shapes(driver, query_request.query, db_seconds)
+            execution_time_ms = int((time.time() - start_time) * 1000)
+            # Only requests that asked for an estimate say whether they got one
+            approximation = result.get("approximation")
+            if query_request.approximate and approximation is None:
+                approximation = {"method": "exact"}
+            known_hash = normalize_hash(query_request.if_none_match)
+            if "data_buffer" in result:
+                # Spilled results are hashed from disk only when there is a hash to
+                # compare with, and never kept for deltas
+                result_hash = None
+                if known_hash is not None:
+                    buffer = result["data_buffer"]
+                    result_hash = await run_in_threadpool(hash_chunks, buffer.json_chunks())
+                    if result_hash == known_hash:
+                        buffer.close()
+                        return _not_modified(result_hash)
+                return _buffered_query_response(
+                    result, execution_time_ms, query_request.request_id, approximation, result_hash
+                )
+            data_json = data_bytes(result)
+            result_hash = hash_chunks([data_json])
+            if result_hash == known_hash:
+                return _not_modified(result_hash)
+            if query_request.delta:
+                versions = app.state.result_versions
+                rows = row_encodings(result)
+                versions.keep(result_hash, rows)
+                changes = versions.delta(known_hash, rows) if known_hash is not None else None
+                if changes is not None:
+                    return _delta_query_response(
+                        result,
+                        execution_time_ms,
+                        query_request.request_id,
+                        approximation,
+                        result_hash,
+                        known_hash,
+                        *changes,
+                    )
+            return _raw_query_response(
+                result,
+                data_json,
+                execution_time_ms,
+                query_request.request_id,
+                approximation,
+                result_hash,
+            )
+        except QueryTooExpensive as exc:
+            execution_time_ms = int((time.time() - start_time) * 1000)
+            return _too_expensive(exc, query_request.request_id, execution_time_ms)
+        except Exception as exc:
+            execution_time_ms = int((time.time() - start_time) * 1000)
+            return JSONResponse(
+                status_code=500,
+                content={
+                    "success": False,
+                    "error": str(exc),
+                    "error_code": "QUERY_EXECUTION_ERROR",
+                    "request_id": query_request.request_id,
+                    "execution_time_ms": execution_time_ms,
+                },
+            )
+
+    return app
+
+
+def run(app: FastAPI) -> None:
+    port = int(os.getenv("PORT", 8080))
+    # Uvicorn expects lowercase log levels
+    log_level = os.getenv("LOG_LEVEL", "info").lower()
+    reload = os.getenv("RELOAD", "false").lower() == "true"
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level=log_level, reload=reload)
@@ -0,0 +1,202 @@
+"""
+Planner check before /execute runs a query on a SQL backend.
+
+The read-only check lets any SELECT through, including an accidental cross
+join of orders and order_details that can pin the database. With
+COST_GUARD_MAX_COST or COST_GUARD_MAX_ROWS set, every query is EXPLAINed
+first, without running it, and the planner's estimates are compared with
+those limits:
+
+- PostgreSQL: "Total Cost" and "Plan Rows" of the top plan node.
+- MySQL: query_cost of EXPLAIN FORMAT=JSON only. Its plans count the rows
+  each table produces into a join, not the rows a query returns after
+  GROUP BY or LIMIT, so COST_GUARD_MAX_ROWS is not enforced on MySQL.
+
+Estimates are kept per query fingerprint for COST_GUARD_CACHE_SECONDS. The
+fingerprint folds comments and whitespace but keeps literals, since a date
+range moves the estimate as much as the shape of the query does.
+
+A query over a limit is handled by COST_GUARD_ACTION:
+
+- reject (default): fails with error_code QUERY_TOO_EXPENSIVE, the
+  estimates and the limits, so the query can be rewritten.
+- limit: runs with a top-level LIMIT COST_GUARD_MAX_ROWS (a larger one is
+  lowered) when that is estimated within the limits, and is rejected
+  otherwise, as is a query ending in OFFSET or FETCH without a LIMIT. Only
+  PostgreSQL estimates fewer rows and a cheaper run under a LIMIT; MySQL
+  mostly costs the limited query like the original, so it is usually
+  rejected there.
+- replica: runs on the backend's replica (COST_GUARD_REPLICA_URL), and is
+  rejected when none is configured.
+
+Partitioned queries are checked range by range, and the scans behind an
+approximate answer are checked too; neither is downgraded, only rejected.
+
+A downgraded result says so under "cost_guard". Estimates are only as good
+as the table statistics; a query the guard lets through still has its
+timeout_ms.
+"""
+
+import hashlib
+import logging
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from bizcopilot_connector.ttlcache import TTLCache
+
+logger = logging.getLogger("connector")
+
+ACTIONS = ("reject", "limit", "replica")
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_SPACE_RE = re.compile(r"\s+")
+# Strings, quoted identifiers and comments, blanked out before looking for clauses
+_OPAQUE_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|--[^\n]*|/\*.*?\*/", re.S)
+# LIMIT n, LIMIT ALL, LIMIT n OFFSET m or MySQL's LIMIT m, n at the very end
+_TRAILING_LIMIT_RE = re.compile(
+    r"\bLIMIT\s+(?:\d+\s*,\s*)?(\d+|ALL)(?:\s+OFFSET\s+\d+)?\s*$", re.I
+)
+_PAGING_RE = re.compile(r"\b(?:OFFSET|FETCH)\b", re.I)
+
+
+class PlanEstimate(NamedTuple):
+    cost: float
+    # None when the planner does not estimate the rows returned (MySQL)
+    rows: Optional[float]
+
+
+class Verdict(NamedTuple):
+    # What to run and where; cost_guard is None when the query passed as is
+    query_text: str
+    on_replica: bool
+    cost_guard: Optional[Dict[str, Any]]
+
+
+class QueryTooExpensive(Exception):
+    error_code = "QUERY_TOO_EXPENSIVE"
+
+    def __init__(self, message: str, details: Dict[str, Any]):
+        super().__init__(message)
+        self.details = details
+
+
+def fingerprint(query_text: str) -> str:
+    """The query with comments and whitespace folded, hashed."""
+    folded = _SPACE_RE.sub(" ", _COMMENT_RE.sub(" ", query_text)).strip().rstrip(";").strip()
+    return hashlib.sha256(folded.encode()).hexdigest()[:32]
+
+
+def limited_sql(query_text: str, rows: int) -> Optional[str]:
+    """
+    query_text returning at most rows rows, by a LIMIT on the statement itself
+    rather than a derived table (which MySQL rejects when columns share a
+    name, and whose ORDER BY it may drop). None if it ends in OFFSET or FETCH
+    without a LIMIT.
+    """
+    sql = query_text.strip().rstrip(";").rstrip()
+    masked = _OPAQUE_RE.sub(lambda match: " " * len(match.group()), sql)
+
+    def top_level(position: int) -> bool:
+        return masked.count("(", 0, position) == masked.count(")", 0, position)
+
+    limit = _TRAILING_LIMIT_RE.search(masked)
+    if limit is not None and top_level(limit.start()):
+        count = limit.group(1)
+        if count.isdigit() and int(count) <= rows:
+            return sql
+        return sql[: limit.start(1)] + str(int(rows)) + sql[limit.end(1):]
+    if any(top_level(match.start()) for match in _PAGING_RE.finditer(masked)):
+        return None
+    # On a line of its own, in case the statement ends in a -- comment
+    return f"{sql}\nLIMIT {int(rows)}"
+
+
+class CostGuard:
+    def __init__(
+        self,
+        explain: Callable[[str], PlanEstimate],
+        max_cost: float,
+        max_rows: int,
+        action: str,
+        has_replica: bool,
+        cache_seconds: float,
+        cache_size: int,
+    ):
+        if action not in ACTIONS:
+            raise ValueError(f"COST_GUARD_ACTION must be one of {', '.join(ACTIONS)}")
+        self._explain = explain
+        self.max_cost = max_cost
+        self.max_rows = max_rows
+        self.action = action
+        self.has_replica = has_replica
+        self.estimates = TTLCache(cache_seconds, cache_size)
+        self.rejected = 0
+        self.downgraded = 0
+
+    def estimate(self, query_text: str) -> PlanEstimate:
+        key = fingerprint(query_text)
+        estimate = self.estimates.get(key)
+        if estimate is None:
+            estimate = self._explain(query_text)
+            self.estimates.put(key, estimate)
+        return estimate
+
+    def exceeded(self, estimate: PlanEstimate) -> List[str]:
+        """The limits estimate is over: "cost", "rows", both or neither."""
+        over = []
+        if self.max_cost > 0 and estimate.cost > self.max_cost:
+            over.append("cost")
+        if self.max_rows > 0 and estimate.rows is not None and estimate.rows > self.max_rows:
+            over.append("rows")
+        return over
+
+    def check(self, query_text: str, downgrade: bool = True) -> Verdict:
+        """
+        Where and how query_text may run, or QueryTooExpensive. Without
+        downgrade (EXPLAIN ANALYZE, which runs its query) anything over a
+        limit is rejected.
+        """
+        estimate = self.estimate(query_text)
+        over = self.exceeded(estimate)
+        if not over:
+            return Verdict(query_text, False, None)
+        details = {
+            "estimated_cost": round(estimate.cost, 2),
+            "estimated_rows": None if estimate.rows is None else round(estimate.rows),
+            "max_cost": self.max_cost or None,
+            "max_rows": self.max_rows or None,
+            "exceeded": over,
+        }
+        if downgrade and self.action == "replica" and self.has_replica:
+            self.downgraded += 1
+            return Verdict(query_text, True, {"action": "replica", **details})
+        if downgrade and self.action == "limit" and self.max_rows > 0:
+            limited = limited_sql(query_text, self.max_rows)
+            if limited is not None and limited != query_text and self._within(limited):
+                self.downgraded += 1
+                return Verdict(limited, False, {"action": "limit", **details})
+        self.rejected += 1
+        raise QueryTooExpensive(
+            f"Estimated {' and '.join(over)} of this query "
+            f"{'exceed' if len(over) > 1 else 'exceeds'} the connector's limits; "
+            "narrow the filters, add a LIMIT or aggregate first",
+            details,
+        )
+
+    def _within(self, query_text: str) -> bool:
+        try:
+            return not self.exceeded(self.estimate(query_text))
+        except Exception as exc:
+            # The rewrite failing to plan leaves the original verdict standing
+            logger.debug("Cost guard could not plan the limited query: %s", exc)
+            return False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "max_cost": self.max_cost or None,
+            "max_rows": self.max_rows or None,
+            "action": self.action,
+            "replica": self.has_replica,
+            "rejected": self.rejected,
+            "downgraded": self.downgraded,
+        }
@@ -0,0 +1,40 @@
+"""
+Driver registry.
+
+Drivers are imported on first use, so a process serving only PostgreSQL
+does not need the MySQL or MongoDB client libraries installed. Additional
+backends can be plugged in with register_driver().
+"""
+
+import importlib
+from typing import Dict
+
+from bizcopilot_connector.drivers.base import Driver
+
+_DRIVERS: Dict[str, str] = {
+    "postgresql": "bizcopilot_connector.drivers.postgresql:PostgreSQLDriver",
+    "mysql": "bizcopilot_connector.drivers.mysql:MySQLDriver",
+    "mongodb": "bizcopilot_connector.drivers.mongodb:MongoDBDriver",
+}
+
+
+def register_driver(database_type: str, target: str) -> None:
+    """Register a driver class given as "package.module:ClassName"."""
+    _DRIVERS[database_type] = target
+
+
+def available_drivers():
+    return sorted(_DRIVERS)
+
+
+def load_driver(database_type: str, database_url: str) -> Driver:
+    try:
+        target = _DRIVERS[database_type]
+    except KeyError:
+        raise ValueError(
+            f"Unknown database type {database_type!r}. "
+            f"Available: {', '.join(available_drivers())}"
+        )
+    module_name, class_name = target.split(":")
+    driver_cls = getattr(importlib.import_module(module_name), class_name)
+    return driver_cls(database_url)
@@ -0,0 +1,263 @@
+"""
+Driver plugin interface.
+
+A Driver owns the pooled engine for one database type and implements the
+backend-specific parts of the connector: executing a QueryRequest, probing
+health, warming up, and the EXPLAIN side of index advice. Everything else
+(auth, IP whitelist, routing by database_type, response envelopes) lives
+in bizcopilot_connector.core and is shared by every backend in the
+process.
+"""
+
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+
+from bizcopilot_connector import config
+from bizcopilot_connector.changes import ChangeFeed
+from bizcopilot_connector.costguard import CostGuard
+from bizcopilot_connector.health import HealthProber
+from bizcopilot_connector.indexadvice import (
+    ObservedShape,
+    PlanEvidence,
+    QueryShape,
+    ShapeRecorder,
+    advise,
+)
+from bizcopilot_connector.models import ExportRequest, QueryRequest
+from bizcopilot_connector.productindex import ProductIndex
+from bizcopilot_connector.readiness import PeriodicRefresher, ReadinessGate
+from bizcopilot_connector.resultcache import ChangeWatcher, ResultCache
+from bizcopilot_connector.rollups import RollupStore
+from bizcopilot_connector.schema import SchemaCache
+from bizcopilot_connector.ttlcache import TTLCache
+
+
+class Driver:
+    database_type: str = ""
+    # Name of the change source behind the result cache; none by default
+    change_source: str = ""
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+        # Loaded during warm-up; shape is backend-specific
+        self.schema_metadata: Dict[str, Any] = {}
+        self.health_prober = HealthProber(self.probe, config.HEALTH_INTERVAL_SECONDS)
+        self.readiness_gate = ReadinessGate(
+            [("pool", self.warm_pool), ("schema", self.load_schema_metadata)]
+        )
+        # Snapshot served by /schema, rebuilt when schema_version changes
+        self.schema_cache = SchemaCache(
+            self.schema_version,
+            self.schema_snapshot,
+            config.SCHEMA_CHECK_SECONDS,
+            config.SCHEMA_MAX_AGE_SECONDS,
+        )
+        # /sample results per (table, size)
+        self.sample_cache = TTLCache(config.SAMPLE_CACHE_SECONDS, config.SAMPLE_CACHE_SIZE)
+        # Filter/sort shapes of executed queries, for /index-advice
+        self.shape_recorder = ShapeRecorder(self.extract_shapes)
+        # Sales rollups (bizcopilot_connector.rollups); SQL drivers only
+        self.rollups: Optional[RollupStore] = None
+        # Planner check of /execute queries (bizcopilot_connector.costguard); SQL drivers only
+        self.cost_guard: Optional[CostGuard] = None
+        # orders_enriched read model (bizcopilot_connector.readmodel); MongoDB only
+        self.read_model: Optional[Any] = None
+        # Product names per tenant for /search/products (bizcopilot_connector.productindex)
+        self.product_index: Optional[ProductIndex] = None
+        self.product_index_refresher: Optional[PeriodicRefresher] = None
+        if config.PRODUCT_INDEX_REFRESH_SECONDS > 0:
+            self.product_index = ProductIndex(self.product_names)
+            self.product_index_refresher = PeriodicRefresher(
+                "product-index-refresh",
+                self.product_index.refresh,
+                config.PRODUCT_INDEX_REFRESH_SECONDS,
+                self.readiness_gate.wait,
+            )
+        # /execute results invalidated by watch_changes (bizcopilot_connector.resultcache)
+        self.result_cache: Optional[ResultCache] = None
+        self.change_watcher: Optional[ChangeWatcher] = None
+        if config.RESULT_CACHE_SECONDS > 0 and self.change_source:
+            self.result_cache = ResultCache(config.RESULT_CACHE_SECONDS, config.RESULT_CACHE_SIZE)
+            self.change_watcher = ChangeWatcher(
+                self.change_source, self.watch_changes, self.result_cache, self.readiness_gate.wait
+            )
+
+    def execute(self, query_request: QueryRequest) -> Dict[str, Any]:
+        """Run a read-only query and return {"data": [...], "rows_affected": n}."""
+        raise NotImplementedError
+
+    def execute_cached(self, query_request: QueryRequest) -> Dict[str, Any]:
+        """execute(), answered from the result cache while none of its tables changed."""
+        cache = self.result_cache
+        if cache is None or query_request.partition is not None:
+            return self.execute(query_request)
+        tables = self.tables_read(query_request)
+        if tables is None or not cache.covers(tables):
+            return self.execute(query_request)
+        key = (query_request.query, query_request.approximate)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        versions = cache.versions(tables)
+        result = self.execute(query_request)
+        # Spilled results are streamed once and closed; they cannot be reused
+        rows = result.get("rows_affected") or 0
+        if "data_buffer" not in result and rows <= config.RESULT_CACHE_MAX_ROWS:
+            cache.store(key, result, tables, versions)
+        return result
+
+    def tables_read(self, query_request: QueryRequest) -> Optional[Set[str]]:
+        """Tables query_request reads, or None if its result must not be cached."""
+        return None
+
+    def watch_changes(self, cache: ResultCache, stop: threading.Event) -> None:
+        """
+        Report writes to cache until stop is set (see ChangeWatcher): call
+        cache.watch() with the tables covered once listening, then
+        cache.invalidate(table) for every change. Raise or return on failure.
+        """
+        raise NotImplementedError
+
+    def iter_rows(self, query_request: QueryRequest) -> Iterator[Dict[str, Any]]:
+        """
+        Validate query_request now and return an iterator over its rows as
+        JSON-ready dicts. The database is only queried once iteration starts,
+        and rows are fetched in batches rather than all at once.
+        """
+        raise HTTPException(
+            status_code=400, detail=f"Row streaming is not supported for {self.database_type}"
+        )
+
+    def export(self, export_request: ExportRequest) -> Iterator[bytes]:
+        """
+        Stream a bulk export as raw bytes. The returned iterator does no work
+        until it is first advanced; it may have a close() method and a result
+        attribute holding the row count once exhausted.
+        """
+        raise HTTPException(
+            status_code=400, detail=f"Export is not supported for {self.database_type}"
+        )
+
+    def probe(self) -> Dict[str, Any]:
+        """Liveness round trip; returns extra health details (pool, replica lag)."""
+        raise NotImplementedError
+
+    def warm_pool(self) -> None:
+        """Open pooled connections and run hot statements."""
+        raise NotImplementedError
+
+    def load_schema_metadata(self) -> None:
+        raise NotImplementedError
+
+    def schema_version(self) -> str:
+        """
+        A cheap token that changes whenever tables, columns or indexes do.
+        Without one the snapshot is only rebuilt once it is too old.
+        """
+        return ""
+
+    def schema_snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Tables (or collections) for /schema, each as {"name", "type",
+        "row_estimate", "columns": [{"name", "type", "nullable"}],
+        "indexes": [{"name", "columns", "unique"}]}.
+        """
+        raise HTTPException(
+            status_code=400,
+            detail=f"Schema introspection is not supported for {self.database_type}",
+        )
+
+    def sample(self, table: str, size: int) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Up to size rows spread over a known table, without scanning it, and
+        the name of the strategy that drew them.
+        """
+        raise HTTPException(
+            status_code=400, detail=f"Sampling is not supported for {self.database_type}"
+        )
+
+    def table_sample(self, table: str, size: int, refresh: bool = False) -> Dict[str, Any]:
+        if not 1 <= size <= config.SAMPLE_MAX_ROWS:
+            raise HTTPException(
+                status_code=400, detail=f"size must be between 1 and {config.SAMPLE_MAX_ROWS}"
+            )
+        # Only tables from the catalog, so the name is safe to quote into SQL
+        if table not in self.schema_metadata:
+            raise HTTPException(status_code=404, detail=f"Unknown table: {table}")
+        if not refresh:
+            cached = self.sample_cache.get((table, size))
+            if cached is not None:
+                return {**cached, "cached": True}
+        strategy, rows = self.sample(table, size)
+        result = {
+            "table": table,
+            "strategy": strategy,
+            "sampled_at": datetime.utcnow().isoformat(),
+            "data": rows,
+            "rows_affected": len(rows),
+        }
+        self.sample_cache.put((table, size), result)
+        return {**result, "cached": False}
+
+    def changes(
+        self, table: str, column: Optional[str], watermark: Optional[str], limit: int
+    ) -> ChangeFeed:
+        """
+        Rows of table after watermark in (column, key) order, read lazily
+        (see bizcopilot_connector.changes). Raises InvalidWatermark for a
+        watermark this driver did not issue for table.
+        """
+        raise HTTPException(
+            status_code=400, detail=f"Delta sync is not supported for {self.database_type}"
+        )
+
+    def product_names(self, watermark: Any) -> Tuple[Any, Iterable[Tuple[Any, Any]]]:
+        """
+        The new watermark and the (tenant_id, product_name) pairs of order
+        lines added since watermark (all of them when it is None). Pairs may
+        repeat; the iterable is read once, after this returns.
+        """
+        raise NotImplementedError
+
+    def extract_shapes(self, query_text: str) -> List[ObservedShape]:
+        """Query shapes of an executed query; none by default."""
+        return []
+
+    def existing_indexes(self) -> Dict[str, List[List[str]]]:
+        """Table -> column lists of its indexes, in index order."""
+        return {}
+
+    def explain_candidate(
+        self, shape: QueryShape, sample: Any, columns: List[Tuple[str, int]]
+    ) -> PlanEvidence:
+        """Whether an index on columns could change the sample's plan, and why."""
+        raise NotImplementedError
+
+    def index_statement(self, table: str, columns: List[Tuple[str, int]]) -> str:
+        raise NotImplementedError
+
+    def index_advice(self, limit: int = 10) -> Dict[str, Any]:
+        return advise(self, limit)
+
+    def close(self) -> None:
+        """Release pooled connections."""
+
+    def start(self) -> None:
+        self.readiness_gate.start()
+        self.health_prober.start()
+        if self.product_index_refresher is not None:
+            self.product_index_refresher.start()
+        if self.change_watcher is not None:
+            self.change_watcher.start()
+
+    def stop(self) -> None:
+        if self.product_index_refresher is not None:
+            self.product_index_refresher.stop()
+        if self.change_watcher is not None:
+            self.change_watcher.stop()
+        self.readiness_gate.stop()
+        self.health_prober.stop()
+        self.close()
@@ -0,0 +1,580 @@
+"""
+MongoDB driver (pymongo).
+
+The query field of a QueryRequest is a JSON payload:
+  {"collection": "order_history", "operation": "find", "filter": {...}}
+with the operations and options of bizcopilot_connector.mongoquery.
+
+Documents are read as RawBSONDocument and transcoded straight to JSON
+bytes (see bizcopilot_connector.bsonjson), returned as data_json. Results
+larger than RESULT_BUFFER_MEMORY_MB, partitioned ones included, spill to
+disk and are returned as data_buffer.
+
+With READ_MODEL_REFRESH_SECONDS set, the driver also maintains the
+orders_enriched read model (bizcopilot_connector.readmodel), queried like
+any other collection. With PRODUCT_INDEX_REFRESH_SECONDS set, product
+names are indexed for /search/products from order_details documents newer
+than the last refresh's newest _id. /changes pages through a collection
+in (field, _id) order, by _id alone unless a field is named (see
+bizcopilot_connector.changes). With RESULT_CACHE_SECONDS set, /execute
+results over RESULT_CACHE_COLLECTIONS are cached until a change stream
+reports a write to one of them (see bizcopilot_connector.resultcache).
+
+Index advice checks candidates with explain(): a COLLSCAN or an in-memory
+SORT stage in the winning plan is what a new index would remove. MongoDB
+has no hypothetical indexes, so candidates are reported as unconfirmed.
+"""
+
+import json
+import threading
+from itertools import islice
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from bson import Decimal128, ObjectId, json_util
+from fastapi import HTTPException
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from bizcopilot_connector import config
+from bizcopilot_connector.approximate import approximation, scaled_proportion
+from bizcopilot_connector.bsonjson import document_to_json
+from bizcopilot_connector.changes import ChangeFeed, InvalidWatermark, Position
+from bizcopilot_connector.drivers.base import Driver
+from bizcopilot_connector.indexadvice import ObservedShape, PlanEvidence, QueryShape, mongo_shape
+from bizcopilot_connector.models import PartitionSpec, QueryRequest
+from bizcopilot_connector.mongoquery import (
+    RAW_CODEC_OPTIONS,
+    BSONBuffer,
+    MongoQuery,
+    aggregate_kwargs,
+    buffered_documents,
+    collections_read,
+    execute_mongo_query,
+    find_kwargs,
+    load_query,
+    new_aggregate_cache,
+    parse_mongo_query,
+    run_mongo_query,
+)
+from bizcopilot_connector.partitioning import (
+    format_bound,
+    iter_partitioned,
+    parse_bound,
+    split_range,
+    validate_column,
+)
+from bizcopilot_connector.readiness import PeriodicRefresher
+from bizcopilot_connector.readmodel import OrdersEnrichedModel
+from bizcopilot_connector.resultcache import ResultCache
+from bizcopilot_connector.schema import fingerprint
+
+
+# Product index refreshes re-read this much before the newest _id seen, for slow client clocks
+PRODUCT_INDEX_LOOKBACK_SECONDS = 300
+PRODUCT_INDEX_BATCH = 1000
+# A /changes page streams; this bounds how long its query may run
+CHANGES_TIMEOUT_MS = 600000
+
+
+def replica_lag_seconds(client: MongoClient) -> Optional[float]:
+    """Largest secondary lag behind the primary, if the user may read replSetGetStatus."""
+    try:
+        status = client.admin.command("replSetGetStatus")
+    except PyMongoError:
+        return None
+    members = status.get("members", [])
+    primary = next((m for m in members if m.get("stateStr") == "PRIMARY"), None)
+    if primary is None:
+        return None
+    lags = [
+        (primary["optimeDate"] - m["optimeDate"]).total_seconds()
+        for m in members
+        if m.get("stateStr") == "SECONDARY" and m.get("optimeDate")
+    ]
+    return max(lags) if lags else 0.0
+
+
+BSON_TYPES = [
+    (bool, "bool"),
+    (int, "int"),
+    (float, "double"),
+    (str, "string"),
+    (datetime, "date"),
+    (ObjectId, "objectId"),
+    (Decimal128, "decimal"),
+    (bytes, "binData"),
+    (list, "array"),
+]
+
+
+def bson_type(value: Any) -> str:
+    if value is None:
+        return "null"
+    for python_type, name in BSON_TYPES:
+        if isinstance(value, python_type):
+            return name
+    return type(value).__name__
+
+
+def sampled_fields(documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Fields seen in sampled documents, subdocuments as dotted paths, with their types."""
+    types: Dict[str, set] = {}
+    seen: Dict[str, int] = {}
+    total = 0
+
+    def visit(document: Dict[str, Any], prefix: str) -> None:
+        for key, value in document.items():
+            path = prefix + key
+            seen[path] = seen.get(path, 0) + 1
+            if isinstance(value, dict):
+                types.setdefault(path, set()).add("object")
+                visit(value, path + ".")
+            else:
+                types.setdefault(path, set()).add(bson_type(value))
+
+    for document in documents:
+        total += 1
+        visit(document, "")
+    fields = []
+    for path in types:
+        present = types[path] - {"null"}
+        fields.append(
+            {
+                "name": path,
+                "type": "|".join(sorted(present)) if present else "null",
+                "nullable": "null" in types[path] or seen[path] < total,
+            }
+        )
+    return fields
+
+
+def plan_stages(stage: Dict[str, Any]):
+    """Walk a winningPlan stage tree."""
+    yield stage
+    if "inputStage" in stage:
+        yield from plan_stages(stage["inputStage"])
+    for child in stage.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+class MongoDBDriver(Driver):
+    database_type = "mongodb"
+    change_source = "mongodb-change-stream"
+
+    def __init__(self, database_url: str):
+        self._client: Optional[MongoClient] = None
+        self._client_lock = threading.Lock()
+        self.aggregate_cache = new_aggregate_cache()
+        super().__init__(database_url)
+        self.read_model_refresher: Optional[PeriodicRefresher] = None
+        if config.READ_MODEL_REFRESH_SECONDS > 0:
+            self.read_model = OrdersEnrichedModel(
+                lambda: self.get_client().get_default_database(),
+                config.READ_MODEL_MONGODB_URI or database_url,
+                config.READ_MODEL_LOOKBACK_SECONDS,
+            )
+            self.read_model_refresher = PeriodicRefresher(
+                "read-model-refresh",
+                self.read_model.refresh,
+                config.READ_MODEL_REFRESH_SECONDS,
+                self.readiness_gate.wait,
+            )
+
+    def get_client(self) -> MongoClient:
+        """Shared client; MongoClient is thread-safe and pools its own connections."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = MongoClient(
+                        self.database_url,
+                        minPoolSize=config.POOL_MIN_SIZE,
+                        maxPoolSize=config.POOL_MAX_SIZE,
+                        serverSelectionTimeoutMS=5000,
+                    )
+        return self._client
+
+    def execute(self, query_request: QueryRequest) -> Dict[str, Any]:
+        try:
+            query = parse_mongo_query(load_query(query_request.query))
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+        db = self.get_client().get_default_database()
+        if query_request.partition is not None:
+            if query.operation != "find":
+                raise HTTPException(
+                    status_code=400, detail="Partitioned execution supports find only"
+                )
+            collection = db.get_collection(query.collection, codec_options=RAW_CODEC_OPTIONS)
+            buffer = self.find_partitioned(
+                collection, query, query_request.partition, query_request.timeout_ms
+            )
+            return buffered_documents(buffer)
+        if query_request.approximate and query.operation == "count":
+            estimated = self.approximate_count(db, query, query_request.timeout_ms)
+            if estimated is not None:
+                return estimated
+        return execute_mongo_query(db, query, query_request.timeout_ms, self.aggregate_cache)
+
+    def approximate_count(
+        self, db, query: MongoQuery, timeout_ms: Optional[int]
+    ) -> Optional[Dict[str, Any]]:
+        """A count from collection metadata, or from a $sample when it has a filter."""
+        if query.skip or query.limit or query.hint:
+            return None
+        collection = db[query.collection]
+        population = collection.estimated_document_count()
+        if not query.filter:
+            answer = approximation(
+                "collection_metadata", population, population, population,
+                source="estimated_document_count",
+            )
+        else:
+            # $sample only avoids a collection scan below 5% of the collection
+            size = min(config.APPROXIMATE_SAMPLE_ROWS, int(population * 0.049))
+            if population <= config.APPROXIMATE_SAMPLE_ROWS or size < 1000:
+                return None
+            pipeline = [
+                {"$sample": {"size": size}},
+                {"$match": query.filter},
+                {"$count": "matched"},
+            ]
+            counted = list(
+                collection.aggregate(pipeline, **aggregate_kwargs(query, timeout_ms))
+            )
+            matched = counted[0]["matched"] if counted else 0
+            bounds = {"estimate": population, "low": population, "high": population}
+            estimate, low, high = scaled_proportion(matched, size, bounds)
+            answer = approximation(
+                "sample", estimate, low, high, 0.95,
+                sampled_rows=size, matched_rows=matched, table_rows=population,
+            )
+        return {
+            "data": [{"count": answer["estimate"]}],
+            "rows_affected": 1,
+            "approximation": answer,
+        }
+
+    def iter_rows(self, query_request: QueryRequest) -> Iterator[Dict[str, Any]]:
+        try:
+            query = parse_mongo_query(load_query(query_request.query))
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        if query_request.partition is not None:
+            raise HTTPException(status_code=400, detail="Streamed queries cannot be partitioned")
+
+        def rows() -> Iterator[Dict[str, Any]]:
+            db = self.get_client().get_default_database()
+            if query.operation == "find":
+                collection = db.get_collection(query.collection, codec_options=RAW_CODEC_OPTIONS)
+                documents = collection.find(
+                    query.filter, **find_kwargs(query, query_request.timeout_ms)
+                )
+            else:
+                documents = run_mongo_query(db, query, query_request.timeout_ms)
+            # Through the transcoder so nested BSON types come out JSON-ready
+            for document in documents:
+                yield json.loads(document_to_json(document.raw))
+
+        return rows()
+
+    def find_partitioned(
+        self, collection, query: MongoQuery, partition: PartitionSpec, timeout_ms: int
+    ) -> BSONBuffer:
+        """
+        The documents of every range, merged in range order with skip and limit
+        applied; each range and the merge spill to disk like any other result.
+        """
+        try:
+            field = validate_column(partition.column)
+            ranges = split_range(
+                parse_bound(partition.start),
+                parse_bound(partition.end),
+                min(partition.partitions, config.MAX_PARTITIONS),
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+        # Ranges come back ordered by the partition field, so skip/limit apply
+        # to the merged result; each range needs at most skip + limit documents
+        kwargs = find_kwargs(query, timeout_ms)
+        kwargs["sort"] = [(field, 1)]
+        kwargs.pop("skip")
+        if query.limit:
+            kwargs["limit"] = query.skip + query.limit
+
+        def encode(bound):
+            if not partition.native_dates:
+                return format_bound(bound)
+            if isinstance(bound, datetime):
+                return bound
+            return datetime(bound.year, bound.month, bound.day)
+
+        buffers: List[BSONBuffer] = []
+
+        def run_range(lower, upper) -> BSONBuffer:
+            range_filter = {field: {"$gte": encode(lower), "$lt": encode(upper)}}
+            buffer = BSONBuffer()
+            buffers.append(buffer)
+            buffer.extend(collection.find({"$and": [query.filter, range_filter]}, **kwargs))
+            return buffer
+
+        end = query.skip + query.limit if query.limit else None
+        merged = BSONBuffer()
+        documents = iter_partitioned(run_range, ranges, config.POOL_MAX_SIZE)
+        try:
+            merged.extend(islice(documents, query.skip, end))
+        except BaseException:
+            merged.close()
+            raise
+        finally:
+            # Stops ranges still running once the limit is reached
+            documents.close()
+            for buffer in buffers:
+                buffer.close()
+        return merged
+
+    def start(self) -> None:
+        super().start()
+        if self.read_model_refresher is not None:
+            self.read_model_refresher.start()
+
+    def stop(self) -> None:
+        if self.read_model_refresher is not None:
+            self.read_model_refresher.stop()
+        super().stop()
+
+    def tables_read(self, query_request: QueryRequest) -> Optional[Set[str]]:
+        try:
+            query = parse_mongo_query(load_query(query_request.query))
+        except ValueError:
+            return None
+        return collections_read(query)
+
+    def watch_changes(self, cache: ResultCache, stop: threading.Event) -> None:
+        # Database-wide streams need a replica set (or sharded cluster) and MongoDB 4.0+
+        db = self.get_client().get_default_database()
+        names = config.RESULT_CACHE_COLLECTIONS
+        pipeline = [{"$match": {"$or": [{"ns.coll": {"$in": names}}, {"to.coll": {"$in": names}}]}}]
+        with db.watch(pipeline, max_await_time_ms=1000) as stream:
+            cache.watch(names)
+            # Ends with an invalidate event when the database is dropped or renamed
+            while not stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is None:
+                    continue
+                # Aggregation results under the result cache would outlive the write
+                self.aggregate_cache.clear()
+                for place in ("ns", "to"):
+                    name = (change.get(place) or {}).get("coll")
+                    if name is not None:
+                        cache.invalidate(name)
+
+    def product_names(self, watermark: Any) -> Tuple[Any, Iterable[Tuple[Any, Any]]]:
+        db = self.get_client().get_default_database()
+        newest = db["order_details"].find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        if newest is None:
+            return watermark, []
+        query: Dict[str, Any] = {"_id": {"$lte": newest["_id"]}}
+        if watermark is not None:
+            since = watermark.generation_time - timedelta(seconds=PRODUCT_INDEX_LOOKBACK_SECONDS)
+            query["_id"]["$gt"] = ObjectId.from_datetime(since)
+        return newest["_id"], self._product_pairs(db, query)
+
+    def _product_pairs(self, db, query: Dict[str, Any]) -> Iterator[Tuple[Any, Any]]:
+        """(tenant_id, product_name) of the matching order_details, tenants looked up per batch."""
+        details = db["order_details"].find(query, {"_id": 0, "order_id": 1, "product_name": 1})
+        batch: List[Dict[str, Any]] = []
+        for detail in details.batch_size(PRODUCT_INDEX_BATCH):
+            batch.append(detail)
+            if len(batch) >= PRODUCT_INDEX_BATCH:
+                yield from self._with_tenants(db, batch)
+                batch = []
+        yield from self._with_tenants(db, batch)
+
+    @staticmethod
+    def _with_tenants(db, details: List[Dict[str, Any]]) -> Iterator[Tuple[Any, Any]]:
+        if not details:
+            return
+        order_ids = list({detail.get("order_id") for detail in details})
+        tenants = {
+            order["id"]: order.get("tenant_id")
+            for order in db["orders"].find(
+                {"id": {"$in": order_ids}}, {"_id": 0, "id": 1, "tenant_id": 1}
+            )
+        }
+        for detail in details:
+            if detail.get("order_id") in tenants:
+                yield tenants[detail["order_id"]], detail.get("product_name")
+
+    def changes(
+        self, table: str, column: Optional[str], watermark: Optional[str], limit: int
+    ) -> ChangeFeed:
+        if table not in self.schema_metadata:
+            raise HTTPException(status_code=404, detail=f"Unknown collection: {table}")
+        start = Position.decode(watermark, json_util.loads) if watermark else None
+        if start is not None:
+            if start.table != table or (column and column != start.column):
+                raise InvalidWatermark("The watermark belongs to another collection or field")
+            column = start.column
+        column = column or "_id"
+        # Top-level fields only: the value is read back from each document
+        try:
+            validate_column(column)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid field: {column!r}")
+        if start is None:
+            query = {} if column == "_id" else {column: {"$exists": True, "$ne": None}}
+        elif column == "_id":
+            query = {"_id": {"$gt": start.value}}
+        elif start.key_value is None:
+            query = {column: {"$gte": start.value}}
+        else:
+            query = {
+                "$or": [
+                    {column: {"$gt": start.value}},
+                    {column: start.value, "_id": {"$gt": start.key_value}},
+                ]
+            }
+        sort = [("_id", 1)] if column == "_id" else [(column, 1), ("_id", 1)]
+        collection = self.get_client().get_default_database().get_collection(
+            table, codec_options=RAW_CODEC_OPTIONS
+        )
+        cursor = collection.find(query, sort=sort, limit=limit + 1, max_time_ms=CHANGES_TIMEOUT_MS)
+        return ChangeFeed(
+            table,
+            column,
+            "_id",
+            start,
+            cursor,
+            limit,
+            lambda document: (document[column], document["_id"]),
+            lambda document: document_to_json(document.raw),
+            json_util.dumps,
+        )
+
+    def sample(self, table: str, size: int) -> Tuple[str, List[Dict[str, Any]]]:
+        # $sample uses a random cursor instead of a scan when size is under 5% of the collection
+        collection = self.get_client().get_default_database().get_collection(
+            table, codec_options=RAW_CODEC_OPTIONS
+        )
+        documents = collection.aggregate([{"$sample": {"size": size}}], maxTimeMS=5000)
+        return "$sample", [json.loads(document_to_json(document.raw)) for document in documents]
+
+    def probe(self) -> Dict[str, Any]:
+        client = self.get_client()
+        client.admin.command("ping")
+        return {
+            "pool": {"min_size": config.POOL_MIN_SIZE, "max_size": config.POOL_MAX_SIZE},
+            "replica_lag_seconds": replica_lag_seconds(client),
+        }
+
+    def warm_pool(self) -> None:
+        """Connect the client (pymongo then keeps minPoolSize open) and touch hot collections."""
+        db = self.get_client().get_default_database()
+        db.command("ping")
+        for name in config.WARMUP_COLLECTIONS:
+            db[name].find_one()
+
+    def load_schema_metadata(self) -> None:
+        db = self.get_client().get_default_database()
+        # Collection name -> index names
+        self.schema_metadata = {
+            name: list(db[name].index_information()) for name in db.list_collection_names()
+        }
+
+    def schema_version(self) -> str:
+        # The collection list (names, options, UUIDs) and every collection's indexes
+        db = self.get_client().get_default_database()
+        catalog = []
+        for info in db.list_collections():
+            if info["name"].startswith("system."):
+                continue
+            indexes = []
+            if info.get("type", "collection") == "collection":
+                indexes = list(db[info["name"]].list_indexes())
+            catalog.append((info, indexes))
+        return fingerprint(catalog)
+
+    def schema_snapshot(self) -> List[Dict[str, Any]]:
+        db = self.get_client().get_default_database()
+        collections = []
+        for info in sorted(db.list_collections(), key=lambda info: info["name"]):
+            name = info["name"]
+            if name.startswith("system."):
+                continue
+            kind = info.get("type", "collection")
+            indexes = db[name].index_information() if kind == "collection" else {}
+            sample = db[name].aggregate(
+                [{"$sample": {"size": config.SCHEMA_SAMPLE_SIZE}}], maxTimeMS=10000
+            )
+            collections.append(
+                {
+                    "name": name,
+                    "type": kind,
+                    "row_estimate": (
+                        db[name].estimated_document_count() if kind == "collection" else None
+                    ),
+                    "columns": sampled_fields(sample),
+                    "indexes": [
+                        {
+                            "name": index_name_,
+                            "columns": [field for field, _ in index["key"]],
+                            "unique": bool(index.get("unique")),
+                        }
+                        for index_name_, index in indexes.items()
+                    ],
+                }
+            )
+        self.schema_metadata = {
+            collection["name"]: [index["name"] for index in collection["indexes"]]
+            for collection in collections
+        }
+        return collections
+
+    def extract_shapes(self, query_text: str) -> List[ObservedShape]:
+        try:
+            query = parse_mongo_query(load_query(query_text))
+        except ValueError:
+            return []
+        if query.operation != "aggregate":
+            return mongo_shape(query.collection, query.filter, query.sort or [])
+        # Only a leading $match (and a $sort right after it) can use an index
+        pipeline = query.pipeline
+        filter_query = pipeline[0].get("$match", {}) if pipeline else {}
+        following = pipeline[1] if filter_query and len(pipeline) > 1 else pipeline[0]
+        sort = list(following.get("$sort", {}).items())
+        return mongo_shape(query.collection, filter_query, sort)
+
+    def existing_indexes(self) -> Dict[str, List[List[str]]]:
+        db = self.get_client().get_default_database()
+        existing = {}
+        for name in db.list_collection_names():
+            indexes = db[name].index_information().values()
+            existing[name] = [[field for field, _ in index["key"]] for index in indexes]
+        return existing
+
+    def explain_candidate(
+        self, shape: QueryShape, sample: Any, columns: List[Tuple[str, int]]
+    ) -> PlanEvidence:
+        collection = self.get_client().get_default_database()[shape.table]
+        cursor = collection.find(sample["filter"], sort=sample["sort"] or None, max_time_ms=5000)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = [stage.get("stage") for stage in plan_stages(plan.get("queryPlan", plan))]
+        if "COLLSCAN" in stages:
+            return PlanEvidence(True, False, f"COLLSCAN on {shape.table}")
+        if shape.sort and "SORT" in stages:
+            return PlanEvidence(True, False, f"in-memory SORT on {shape.table}")
+        return PlanEvidence(False, False, f"winning plan is {' <- '.join(s for s in stages if s)}")
+
+    def index_statement(self, table: str, columns: List[Tuple[str, int]]) -> str:
+        keys = json.dumps(dict(columns))
+        return f"db.getCollection({json.dumps(table)}).createIndex({keys})"
+
+    def close(self) -> None:
+        if self.read_model is not None:
+            self.read_model.close()
+        if self._client is not None:
+            self._client.close()
+            self._client = None
@@ -0,0 +1,310 @@
+"""
+MySQL driver (mysql-connector-python).
+
+MySQL has no hypothetical indexes, so index advice proposes a candidate
+for a full table scan (type ALL) or a filesort on the table in the current
+plan, and reports it as unconfirmed: nothing shows the optimizer would use
+the index.
+
+MySQL cannot notify clients of writes, so the result cache polls
+information_schema.TABLES.UPDATE_TIME, which InnoDB keeps in memory for
+non-partitioned tables. UPDATE_TIME has whole-second precision: a second
+write within the second of the first is invisible to the poll, so a table
+that changed is invalidated once more on the following poll.
+"""
+
+import json
+import math
+import random
+import re
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import mysql.connector
+import mysql.connector.pooling
+
+from bizcopilot_connector import config
+from bizcopilot_connector.approximate import approximation
+from bizcopilot_connector.costguard import PlanEstimate
+from bizcopilot_connector.drivers.sql import SMALL_TABLE_ROWS, SQLDriver
+from bizcopilot_connector.indexadvice import PlanEvidence, QueryShape, table_aliases
+from bizcopilot_connector.resultcache import ResultCache
+from bizcopilot_connector.rollups import RollupDialect
+
+INTEGER_TYPES = {"tinyint", "smallint", "mediumint", "int", "integer", "bigint"}
+# Primary key ranges read for an approximate count's sample
+APPROXIMATE_SAMPLE_CHUNKS = 20
+# Tables whose UPDATE_TIME follows their writes; NULL until the first one after a restart
+_UPDATE_TIMES_SQL = (
+    "SELECT table_name, update_time FROM information_schema.tables "
+    "WHERE table_schema = DATABASE() AND table_type = 'BASE TABLE' "
+    "AND engine IN ('InnoDB', 'MyISAM') AND create_options NOT LIKE '%partitioned%'"
+)
+_UUID_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I)
+
+
+def plan_cost(plan: Any) -> float:
+    """
+    Largest query_cost anywhere in an EXPLAIN FORMAT=JSON plan; UNIONs and
+    subqueries have query blocks of their own.
+    """
+    cost = 0.0
+    if isinstance(plan, dict):
+        for key, value in plan.items():
+            cost = max(cost, float(value) if key == "query_cost" else plan_cost(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            cost = max(cost, plan_cost(value))
+    return cost
+
+
+def connection_params(database_url: str) -> Dict[str, Any]:
+    parts = database_url.replace("mysql://", "").split("@")
+    user_pass = parts[0].split(":")
+    host_port_db = parts[1].split("/")
+    host_port = host_port_db[0].split(":")
+    return {
+        "host": host_port[0],
+        "port": int(host_port[1]) if len(host_port) > 1 else 3306,
+        "user": user_pass[0],
+        "password": user_pass[1],
+        "database": host_port_db[1],
+    }
+
+
+class MySQLDriver(SQLDriver):
+    database_type = "mysql"
+    change_source = "mysql-update-time"
+    identifier_quote = "`"
+    schema_filter = "WHERE table_schema = DATABASE()"
+    index_columns_sql = (
+        "SELECT table_name, index_name, column_name, non_unique = 0 "
+        "FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() ORDER BY table_name, index_name, seq_in_index"
+    )
+    # Checksums rather than GROUP_CONCAT, which truncates at group_concat_max_len
+    schema_version_sql = (
+        "SELECT "
+        "(SELECT CONCAT(COUNT(*), '.', COALESCE(SUM(CRC32(CONCAT_WS('.', table_name, "
+        "column_name, column_type, is_nullable, ordinal_position))), 0)) "
+        "FROM information_schema.columns WHERE table_schema = DATABASE()), "
+        "(SELECT CONCAT(COUNT(*), '.', COALESCE(SUM(CRC32(CONCAT_WS('.', table_name, "
+        "index_name, column_name, seq_in_index, non_unique))), 0)) "
+        "FROM information_schema.statistics WHERE table_schema = DATABASE())"
+    )
+    table_stats_sql = (
+        "SELECT table_name, IF(table_type = 'VIEW', 'view', 'table'), table_rows "
+        "FROM information_schema.tables WHERE table_schema = DATABASE()"
+    )
+    primary_key_sql = (
+        "SELECT column_name FROM information_schema.key_column_usage "
+        "WHERE table_schema = DATABASE() AND table_name = %s "
+        "AND constraint_name = 'PRIMARY' ORDER BY ordinal_position"
+    )
+    # mysql-connector opens every pool connection up front
+    warm_connections = config.POOL_MAX_SIZE
+    rollup_dialect = RollupDialect(nocase=True)
+
+    def __init__(self, database_url: str):
+        self._pool: Optional[mysql.connector.pooling.MySQLConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        super().__init__(database_url)
+
+    def get_pool(self) -> mysql.connector.pooling.MySQLConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = mysql.connector.pooling.MySQLConnectionPool(
+                        pool_name="bizcopilot",
+                        pool_size=config.POOL_MAX_SIZE,
+                        **connection_params(self.database_url),
+                    )
+        return self._pool
+
+    def borrow(self):
+        return self.get_pool().get_connection()
+
+    def give_back(self, conn) -> None:
+        # close() hands the connection back; the pool reconnects dead ones on checkout
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+
+    def connect(self, database_url: str):
+        return mysql.connector.connect(**connection_params(database_url))
+
+    def dict_cursor(self, conn):
+        return conn.cursor(dictionary=True)
+
+    def streaming_cursor(self, conn):
+        # Unbuffered: rows are read off the socket as they are fetched
+        return conn.cursor(dictionary=True, buffered=False)
+
+    def close_streaming_cursor(self, conn, cursor) -> None:
+        # A reader that stopped early leaves rows on the wire; drain them so
+        # the connection can go back to the pool
+        conn.consume_results()
+        cursor.close()
+
+    def _update_times(self) -> Dict[str, Any]:
+        with self.pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                try:
+                    # MySQL 8 serves these from a statistics cache refreshed daily
+                    cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+                except mysql.connector.Error:
+                    pass
+                cursor.execute(_UPDATE_TIMES_SQL)
+                return {name: updated for name, updated in cursor.fetchall()}
+            finally:
+                cursor.close()
+
+    def watch_changes(self, cache: ResultCache, stop: threading.Event) -> None:
+        # At least a second apart, or a same-second write could slip past both polls
+        interval = max(1.0, config.RESULT_CACHE_POLL_SECONDS)
+        seen = self._update_times()
+        cache.watch(seen)
+        # Any table may have been written again within the second just read
+        settling: Set[str] = set(seen)
+        while not stop.wait(interval):
+            current = self._update_times()
+            changed = {name for name, updated in current.items() if seen.get(name) != updated}
+            for name in changed | settling:
+                cache.invalidate(name)
+            cache.watch(current)
+            seen, settling = current, changed
+
+    def sample(self, table: str, size: int) -> Tuple[str, List[Dict[str, Any]]]:
+        name = self.quote_identifier(table)
+        found = self.catalog_rows(
+            "SELECT table_rows FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s",
+            (table,),
+        )
+        rows_estimate = found[0][0] if found and found[0][0] is not None else 0
+        if rows_estimate < SMALL_TABLE_ROWS:
+            return "random_order", self.fetch_sample(
+                f"SELECT * FROM {name} ORDER BY RAND() LIMIT {size}"
+            )
+        key = self.primary_key(table)
+        points = self._key_points(table, key, size * 2)
+        if not points:
+            return "first_rows", self.fetch_sample(f"SELECT * FROM {name} LIMIT {size}")
+        # One primary key seek per random point, all in a single round trip
+        rows = self.fetch_sample(self._key_ranges(table, key[0], points, 1))
+        unique = {row[key[0]]: row for row in rows}
+        return "primary_key_range", list(unique.values())[:size]
+
+    def _key_ranges(self, table: str, key: str, points: List[str], rows_each: int) -> str:
+        """UNION ALL of the rows_each rows from each point up the primary key."""
+        name = self.quote_identifier(table)
+        column = self.quote_identifier(key)
+        return " UNION ALL ".join(
+            f"(SELECT * FROM {name} WHERE {column} >= {point} "
+            f"ORDER BY {column} LIMIT {rows_each})"
+            for point in points
+        )
+
+    def _key_points(self, table: str, key: List[str], count: int) -> List[str]:
+        """SQL literals spread over a single-column primary key, if its values allow it."""
+        if len(key) != 1:
+            return []
+        column = self.quote_identifier(key[0])
+        low, high = self.catalog_rows(
+            f"SELECT MIN({column}), MAX({column}) FROM {self.quote_identifier(table)}"
+        )[0]
+        if low is None:
+            return []
+        if self.schema_metadata.get(table, {}).get(key[0]) in INTEGER_TYPES:
+            return [str(random.randint(int(low), int(high))) for _ in range(count)]
+        # Random UUIDs are uniform over their own space, so fresh ones make fair points
+        if all(isinstance(v, str) and _UUID_RE.match(v) for v in (low, high)):
+            return [f"'{uuid.uuid4()}'" for _ in range(count)]
+        return []
+
+    def count_label(self, expression: str) -> str:
+        return expression
+
+    def count_estimate(self, table: str) -> Optional[Dict[str, Any]]:
+        found = self.catalog_rows(
+            "SELECT table_rows, engine FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s AND table_type = 'BASE TABLE'",
+            (table,),
+        )
+        if not found or found[0][0] is None:
+            return None
+        estimate, engine = found[0]
+        # InnoDB estimates from sampled index pages; MySQL documents 40-50% error
+        error = 0.5 if str(engine).lower() == "innodb" else 0.0
+        return approximation(
+            "catalog_statistics", estimate, estimate * (1 - error), estimate * (1 + error),
+            source="information_schema.TABLES.TABLE_ROWS", engine=engine,
+        )
+
+    def sample_source(self, table: str, population: float, rows: int) -> Optional[str]:
+        # No TABLESAMPLE: read runs of rows from random points of the primary key
+        key = self.primary_key(table)
+        points = self._key_points(table, key, APPROXIMATE_SAMPLE_CHUNKS)
+        if not points:
+            return None
+        ranges = self._key_ranges(table, key[0], points, math.ceil(rows / len(points)))
+        return f"({ranges}) AS {self.quote_identifier(table)}"
+
+    def probe(self) -> Dict[str, Any]:
+        with self.probe_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchall()
+                lag = None
+                try:
+                    # Needs REPLICATION CLIENT; not being a replica returns no row
+                    cursor.execute("SHOW REPLICA STATUS")
+                    status = cursor.fetchone()
+                    if status:
+                        lag = status.get("Seconds_Behind_Source")
+                except mysql.connector.Error:
+                    pass
+            finally:
+                cursor.close()
+        return {
+            "pool": self.pool_slots.stats(),
+            "replica_lag_seconds": float(lag) if lag is not None else None,
+        }
+
+    def explain_estimate(self, query_text: str) -> PlanEstimate:
+        with self.pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("EXPLAIN FORMAT=JSON " + query_text)
+                plan = json.loads(cursor.fetchone()[0])
+            finally:
+                cursor.close()
+        # rows_produced_per_join counts rows into a join, not rows returned
+        return PlanEstimate(plan_cost(plan), None)
+
+    def explain_candidate(
+        self, shape: QueryShape, sample: Any, columns: List[Tuple[str, int]]
+    ) -> PlanEvidence:
+        with self.pooled_connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                cursor.execute("EXPLAIN " + sample)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        names = table_aliases(sample, shape.table)
+        for row in rows:
+            if str(row.get("table") or "").lower() not in names:
+                continue
+            if row.get("type") == "ALL":
+                return PlanEvidence(
+                    True, False, f"full table scan of {shape.table} (~{row.get('rows')} rows)"
+                )
+            if shape.sort and "filesort" in str(row.get("Extra") or ""):
+                return PlanEvidence(True, False, f"filesort for ORDER BY on {shape.table}")
+            return PlanEvidence(False, False, f"already uses {row.get('key') or row.get('type')}")
+        return PlanEvidence(False, False, f"{shape.table} not found in the plan")
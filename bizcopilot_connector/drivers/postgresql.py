@@ -0,0 +1,347 @@
+"""
+PostgreSQL driver (psycopg2).
+
+/export streams COPY (SELECT ...) TO STDOUT output straight to the client
+in CSV or binary format, so rows are never turned into Python objects.
+
+Index advice confirms candidates with hypothetical indexes when the hypopg
+extension is installed. Without it a sequential scan of the table (or a
+sort the index would serve) in the current plan still yields a candidate,
+reported as unconfirmed.
+
+The result cache listens on the bizcopilot_changes channel. Tables are
+watched once a DBA gives them the notifying trigger (EXECUTE PROCEDURE
+before PostgreSQL 11):
+
+  CREATE OR REPLACE FUNCTION bizcopilot_notify_changes() RETURNS trigger
+  LANGUAGE plpgsql AS $$
+  BEGIN
+    PERFORM pg_notify('bizcopilot_changes', TG_TABLE_NAME);
+    RETURN NULL;
+  END $$;
+
+  CREATE TRIGGER bizcopilot_notify_changes
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON orders
+    FOR EACH STATEMENT EXECUTE FUNCTION bizcopilot_notify_changes();
+
+Notifications are sent on commit, and identical ones within a transaction
+are folded into one, so a bulk load costs a single invalidation.
+"""
+
+import select
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+
+from bizcopilot_connector import config
+from bizcopilot_connector.approximate import approximation
+from bizcopilot_connector.costguard import PlanEstimate
+from bizcopilot_connector.drivers.sql import (
+    SMALL_TABLE_ROWS,
+    STREAM_BATCH_ROWS,
+    SQLDriver,
+    validate_exportable,
+)
+from bizcopilot_connector.indexadvice import PlanEvidence, QueryShape, sql_plan_nodes
+from bizcopilot_connector.models import ExportRequest
+from bizcopilot_connector.resultcache import ResultCache
+from bizcopilot_connector.rollups import RollupDialect
+from bizcopilot_connector.streaming import ThreadedStream
+
+# EXPLAIN of an index advice sample must not hold a pooled connection long
+EXPLAIN_TIMEOUT_MS = 5000
+# Channel and trigger name of the result cache's change notifications
+CHANGE_CHANNEL = "bizcopilot_changes"
+NOTIFY_TRIGGER = "bizcopilot_notify_changes"
+# How often the listener looks for triggers added or dropped
+TRIGGER_CHECK_SECONDS = 60
+
+
+class PostgreSQLDriver(SQLDriver):
+    database_type = "postgresql"
+    change_source = "postgresql-listen"
+    identifier_quote = '"'
+    schema_filter = "WHERE table_schema = 'public'"
+    index_columns_sql = (
+        "SELECT t.relname, ix.relname, a.attname, i.indisunique "
+        "FROM pg_index i "
+        "JOIN pg_class t ON t.oid = i.indrelid "
+        "JOIN pg_class ix ON ix.oid = i.indexrelid "
+        "JOIN pg_namespace n ON n.oid = t.relnamespace "
+        "CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, position) "
+        "JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum "
+        "WHERE n.nspname = 'public' "
+        "ORDER BY t.relname, ix.relname, k.position"
+    )
+    # Hashes pg_catalog rather than information_schema, which is slow on big catalogs
+    schema_version_sql = (
+        "SELECT md5(coalesce(string_agg("
+        "c.relname || '.' || c.relkind || '.' || a.attname || '.' || a.atttypid || '.' "
+        "|| a.attnotnull, ',' ORDER BY c.oid, a.attnum), '')), "
+        "(SELECT md5(coalesce(string_agg(i.indexrelid::text, ',' ORDER BY i.indexrelid), '')) "
+        "FROM pg_index i JOIN pg_class t ON t.oid = i.indrelid "
+        "JOIN pg_namespace n ON n.oid = t.relnamespace WHERE n.nspname = 'public') "
+        "FROM pg_attribute a "
+        "JOIN pg_class c ON c.oid = a.attrelid "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm') "
+        "AND a.attnum > 0 AND NOT a.attisdropped"
+    )
+    table_stats_sql = (
+        "SELECT c.relname, "
+        "CASE c.relkind WHEN 'v' THEN 'view' WHEN 'm' THEN 'materialized view' "
+        "ELSE 'table' END, "
+        "CASE WHEN c.relkind IN ('r', 'p', 'm') AND c.reltuples >= 0 "
+        "THEN c.reltuples::bigint END "
+        "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm')"
+    )
+    primary_key_sql = (
+        "SELECT a.attname FROM pg_index i "
+        "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+        "WHERE i.indisprimary AND i.indrelid = to_regclass('public.' || quote_ident(%s)) "
+        "ORDER BY array_position(i.indkey::int2[], a.attnum)"
+    )
+    create_index = "CREATE INDEX CONCURRENTLY"
+    rollup_dialect = RollupDialect(fold_case=True, nulls_largest=True)
+
+    def __init__(self, database_url: str):
+        self._pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        super().__init__(database_url)
+
+    def get_pool(self) -> psycopg2.pool.ThreadedConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(
+                        config.POOL_MIN_SIZE, config.POOL_MAX_SIZE, self.database_url
+                    )
+        return self._pool
+
+    def borrow(self):
+        return self.get_pool().getconn()
+
+    def give_back(self, conn) -> None:
+        try:
+            conn.rollback()
+            discard = False
+        except psycopg2.Error:
+            discard = True
+        self.get_pool().putconn(conn, close=discard or bool(conn.closed))
+
+    def connect(self, database_url: str):
+        return psycopg2.connect(database_url)
+
+    def dict_cursor(self, conn):
+        return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+    def set_timeout(self, cursor, timeout_ms: int) -> None:
+        cursor.execute(f"SET statement_timeout = {int(timeout_ms)}")
+
+    def streaming_cursor(self, conn):
+        # Named (server-side) cursor: the client never holds the whole result
+        cursor = conn.cursor(
+            name=f"stream_{uuid.uuid4().hex}", cursor_factory=psycopg2.extras.RealDictCursor
+        )
+        cursor.itersize = STREAM_BATCH_ROWS
+        return cursor
+
+    def _notifying_tables(self, cursor) -> Set[str]:
+        cursor.execute(
+            "SELECT DISTINCT c.relname FROM pg_trigger t "
+            "JOIN pg_class c ON c.oid = t.tgrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND t.tgname = %s AND t.tgenabled <> 'D'",
+            (NOTIFY_TRIGGER,),
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+    def watch_changes(self, cache: ResultCache, stop: threading.Event) -> None:
+        # Not pooled: LISTEN holds the connection for as long as the cache is used
+        conn = psycopg2.connect(self.database_url)
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            cursor.execute(f"LISTEN {CHANGE_CHANNEL}")
+            cache.watch(self._notifying_tables(cursor))
+            checked = time.monotonic()
+            while not stop.is_set():
+                if select.select([conn], [], [], 1.0)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        cache.invalidate(conn.notifies.pop(0).payload)
+                if time.monotonic() - checked >= TRIGGER_CHECK_SECONDS:
+                    cache.watch(self._notifying_tables(cursor))
+                    checked = time.monotonic()
+        finally:
+            conn.close()
+
+    def export(self, export_request: ExportRequest) -> Iterator[bytes]:
+        query_text = validate_exportable(export_request.query)
+        if export_request.format == "csv":
+            options = "FORMAT csv, HEADER " + ("true" if export_request.header else "false")
+        else:
+            options = "FORMAT binary"
+        copy_sql = f"COPY ({query_text}) TO STDOUT WITH ({options})"
+
+        def produce(out) -> int:
+            with self.pooled_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    # COPY (query) has no read-only check of its own
+                    cursor.execute("SET TRANSACTION READ ONLY")
+                    self.set_timeout(cursor, int(export_request.timeout_ms))
+                    cursor.copy_expert(copy_sql, out)
+                    return cursor.rowcount
+                finally:
+                    cursor.close()
+
+        return ThreadedStream(produce)
+
+    def sample(self, table: str, size: int) -> Tuple[str, List[Dict[str, Any]]]:
+        name = self.quote_identifier(table)
+        found = self.catalog_rows(
+            "SELECT c.reltuples, c.relpages, c.relkind FROM pg_class c "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND c.relname = %s",
+            (table,),
+        )
+        rows_estimate, pages, kind = found[0] if found else (-1, 0, "v")
+        if kind not in ("r", "p", "m"):
+            # Views cannot be block-sampled
+            return "first_rows", self.fetch_sample(f"SELECT * FROM {name} LIMIT {size}")
+        if rows_estimate < SMALL_TABLE_ROWS or pages < 2 * size:
+            return "random_order", self.fetch_sample(
+                f"SELECT * FROM {name} ORDER BY random() LIMIT {size}"
+            )
+        # SYSTEM reads whole random pages; about two pages per wanted row keeps
+        # rows from a handful of neighbours out, then a random pick among them
+        percent = min(100.0, 100.0 * 2 * size / pages)
+        while True:
+            rows = self.fetch_sample(
+                f"SELECT * FROM {name} TABLESAMPLE SYSTEM ({percent:.6f}) "
+                f"ORDER BY random() LIMIT {size}"
+            )
+            if len(rows) >= size or percent >= 100.0:
+                return "tablesample_system", rows
+            percent = min(100.0, percent * 10)
+
+    def count_estimate(self, table: str) -> Optional[Dict[str, Any]]:
+        found = self.catalog_rows(
+            "SELECT c.reltuples, coalesce(s.n_mod_since_analyze, 0), "
+            "greatest(s.last_analyze, s.last_autoanalyze) "
+            "FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid "
+            "WHERE n.nspname = 'public' AND c.relname = %s AND c.relkind IN ('r', 'm')",
+            (table,),
+        )
+        # reltuples is -1 until the table is first analysed
+        if not found or found[0][0] < 0:
+            return None
+        estimate, drift, analyzed_at = found[0]
+        # Every row written since ANALYZE can have moved the count by one
+        return approximation(
+            "catalog_statistics", estimate, max(0.0, estimate - drift), estimate + drift,
+            source="pg_class.reltuples",
+            analyzed_at=analyzed_at.isoformat() if analyzed_at else None,
+            modified_since_analyze=drift,
+        )
+
+    def sample_source(self, table: str, population: float, rows: int) -> Optional[str]:
+        # Random pages rather than rows: cheap, but rows on one page are alike,
+        # so the interval is optimistic for filters that follow insertion order
+        percent = min(100.0, 100.0 * rows / max(population, 1.0))
+        name = self.quote_identifier(table)
+        return f"(SELECT * FROM {name} TABLESAMPLE SYSTEM ({percent:.6f})) AS {name}"
+
+    def probe(self) -> Dict[str, Any]:
+        with self.probe_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    "SELECT pg_is_in_recovery(), "
+                    "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                )
+                in_recovery, lag = cursor.fetchone()
+            finally:
+                cursor.close()
+        return {
+            "pool": self.pool_slots.stats(),
+            "replica": bool(in_recovery),
+            "replica_lag_seconds": float(lag) if in_recovery and lag is not None else None,
+        }
+
+    def explain_estimate(self, query_text: str) -> PlanEstimate:
+        with self.pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self.set_timeout(cursor, EXPLAIN_TIMEOUT_MS)
+                cursor.execute("EXPLAIN (FORMAT JSON) " + query_text)
+                plan = cursor.fetchone()[0][0]["Plan"]
+            finally:
+                cursor.close()
+        return PlanEstimate(float(plan["Total Cost"]), float(plan["Plan Rows"]))
+
+    def explain_candidate(
+        self, shape: QueryShape, sample: Any, columns: List[Tuple[str, int]]
+    ) -> PlanEvidence:
+        with self.pooled_connection() as conn:
+            cursor = conn.cursor()
+            hypothetical = False
+            try:
+                self.set_timeout(cursor, EXPLAIN_TIMEOUT_MS)
+                try:
+                    statement = self.index_statement(shape.table, columns)
+                    cursor.execute(
+                        "SELECT indexname FROM hypopg_create_index(%s)",
+                        (statement.replace(" CONCURRENTLY", ""),),
+                    )
+                    hypothetical = True
+                except psycopg2.Error:
+                    conn.rollback()
+                    self.set_timeout(cursor, EXPLAIN_TIMEOUT_MS)
+                cursor.execute("EXPLAIN (FORMAT JSON) " + sample)
+                plan = cursor.fetchone()[0][0]["Plan"]
+            finally:
+                if hypothetical:
+                    # Hypothetical indexes live in the backend, not the transaction
+                    conn.rollback()
+                    cursor.execute("SELECT hypopg_reset()")
+                cursor.close()
+
+        nodes = list(sql_plan_nodes(plan))
+        if hypothetical:
+            used = [
+                n for n in nodes
+                if n.get("Relation Name") == shape.table and n.get("Index Name", "").startswith("<")
+            ]
+            if used:
+                return PlanEvidence(
+                    True, True, f"planner picks the hypothetical index ({used[0]['Node Type']})"
+                )
+            return PlanEvidence(
+                False, False, "planner ignores a hypothetical index on these columns"
+            )
+        seq_scans = [
+            n for n in nodes
+            if n["Node Type"] == "Seq Scan" and n.get("Relation Name") == shape.table
+        ]
+        if seq_scans:
+            rows = int(seq_scans[0].get("Plan Rows", 0))
+            return PlanEvidence(True, False, f"Seq Scan on {shape.table} (~{rows} rows)")
+        if shape.sort and any(n["Node Type"] in ("Sort", "Incremental Sort") for n in nodes):
+            return PlanEvidence(True, False, f"explicit Sort for ORDER BY on {shape.table}")
+        return PlanEvidence(
+            False, False, f"{plan['Node Type']} without a scan or sort this index would replace"
+        )
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
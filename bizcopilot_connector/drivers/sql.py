@@ -0,0 +1,741 @@
+"""
+Shared behaviour of the SQL drivers: read-only validation, pooled
+execution, range-partitioned execution and index advice. Subclasses
+supply the pool and the dialect details.
+
+Rows are read from a server-side cursor in batches into a RowBuffer, so a
+result larger than RESULT_BUFFER_MEMORY_MB spills to disk instead of
+growing the worker. With ROLLUP_REFRESH_SECONDS set, sales rollups are
+maintained in the background and, with ROLLUP_REWRITE, answer matching
+aggregate queries (see bizcopilot_connector.rollups). With
+PRODUCT_INDEX_REFRESH_SECONDS set, distinct product names per tenant are
+indexed for /search/products, re-reading orders from a few days before
+the latest order_date each time. /changes pages through a table in
+(column, primary key) order (see bizcopilot_connector.changes). With
+RESULT_CACHE_SECONDS set, /execute results are cached per query text until
+a table they read is written (see bizcopilot_connector.resultcache). With
+COST_GUARD_MAX_COST or COST_GUARD_MAX_ROWS set, /execute queries are
+EXPLAINed first and expensive ones rejected or downgraded (see
+bizcopilot_connector.costguard).
+"""
+
+import hashlib
+import logging
+import os
+import re
+from collections import Counter
+import uuid
+from contextlib import ExitStack, contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException
+from pydantic_core import to_json
+
+from bizcopilot_connector import config
+from bizcopilot_connector.approximate import (
+    CountQuery,
+    HyperLogLog,
+    approximation,
+    distinct_from_sample,
+    parse_count_query,
+    scaled_proportion,
+)
+from bizcopilot_connector.changes import ChangeFeed, InvalidWatermark, Position
+from bizcopilot_connector.costguard import CostGuard, PlanEstimate, Verdict
+from bizcopilot_connector.drivers.base import Driver
+from bizcopilot_connector.indexadvice import ObservedShape, index_name, sql_shapes
+from bizcopilot_connector.models import PartitionSpec, QueryRequest
+from bizcopilot_connector.partitioning import (
+    check_partitionable,
+    iter_partitioned,
+    parse_bound,
+    split_range,
+    validate_column,
+    wrap_sql,
+)
+from bizcopilot_connector.pooling import PoolSlots
+from bizcopilot_connector.readiness import PeriodicRefresher
+from bizcopilot_connector.resultcache import sql_tables_read
+from bizcopilot_connector.rollups import RollupDialect, RollupStore
+from bizcopilot_connector.spill import RowBuffer, buffered_result
+
+logger = logging.getLogger("connector")
+
+# Rows fetched per round trip from a server-side cursor
+STREAM_BATCH_ROWS = 2000
+# Rollup refreshes aggregate whole days of orders
+ROLLUP_TIMEOUT_MS = 600000
+# /sample must stay cheap; a sample query running longer than this is cut off
+SAMPLE_TIMEOUT_MS = 5000
+# Below this many (estimated) rows a table is small enough to sort randomly
+SMALL_TABLE_ROWS = 10000
+# Days of orders re-read by each product index refresh, for late order lines
+PRODUCT_INDEX_LOOKBACK_DAYS = 2
+# A /changes page streams; this bounds how long its query may run
+CHANGES_TIMEOUT_MS = 600000
+# /changes columns used when the caller names none, in order of preference
+CHANGE_COLUMNS = ("updated_at", "created_at")
+
+# EXPLAIN ANALYZE runs its query; plain EXPLAIN does not
+_EXPLAIN_ANALYZE_RE = re.compile(r"^EXPLAIN\s+ANALYZE\s+", re.I)
+
+_PRODUCT_NAMES_SQL = (
+    "SELECT DISTINCT o.tenant_id, d.product_name "
+    "FROM order_details d JOIN orders o ON o.id = d.order_id{where}"
+)
+
+
+def watermark_value(value: Any) -> Any:
+    """A column value as JSON that compares the same when sent back as a parameter."""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        raise HTTPException(status_code=400, detail="Binary columns cannot be used for /changes")
+    return value
+
+
+def validate_single_statement(query: str) -> str:
+    query_text = query.strip()
+    if ";" in query_text.rstrip().rstrip(";"):
+        raise HTTPException(status_code=400, detail="Multiple statements are not allowed")
+    return query_text
+
+
+def validate_read_only(query_request: QueryRequest) -> str:
+    """Return the stripped query text, or raise if it is not a single read-only statement."""
+    query_text = validate_single_statement(query_request.query)
+
+    query_upper = query_text.upper()
+    if query_upper.startswith("EXPLAIN"):
+        if not re.match(r"^EXPLAIN(\s+ANALYZE)?\s+(SELECT|WITH)\b", query_upper):
+            raise HTTPException(
+                status_code=400,
+                detail="Only EXPLAIN SELECT/WITH queries are allowed",
+            )
+        if query_request.partition is not None:
+            raise HTTPException(status_code=400, detail="EXPLAIN queries cannot be partitioned")
+        is_select = True
+    else:
+        is_select = query_upper.startswith("SELECT") or query_upper.startswith("WITH")
+    if not is_select:
+        raise HTTPException(
+            status_code=400,
+            detail="Only SELECT/WITH/EXPLAIN queries are allowed",
+        )
+    return query_text
+
+
+def validate_exportable(query: str) -> str:
+    """A single SELECT/WITH statement, without the trailing semicolon COPY rejects."""
+    query_text = validate_single_statement(query).rstrip().rstrip(";")
+    if not re.match(r"^(SELECT|WITH)\b", query_text, re.I):
+        raise HTTPException(status_code=400, detail="Only SELECT/WITH queries can be exported")
+    return query_text
+
+
+class SQLDriver(Driver):
+    identifier_quote = '"'
+    # WHERE clause selecting this database's tables in information_schema.columns
+    schema_filter = ""
+    # Connections opened (and warmed) up front
+    warm_connections = config.POOL_MIN_SIZE
+    # Rows of (table_name, index_name, column_name, is_unique) in index column order
+    index_columns_sql = ""
+    # One row that changes with any table, column or index DDL (/schema)
+    schema_version_sql = ""
+    # Rows of (table_name, table_type, row_estimate)
+    table_stats_sql = ""
+    # Rows of (column_name) of one table's primary key in key order; %s is the table
+    primary_key_sql = ""
+    create_index = "CREATE INDEX"
+    rollup_dialect = RollupDialect()
+
+    def __init__(self, database_url: str):
+        # Pool drivers raise instead of blocking when exhausted
+        self.pool_slots = PoolSlots(config.POOL_MAX_SIZE)
+        # The health prober's own connection (probe_connection)
+        self._probe_conn = None
+        super().__init__(database_url)
+        self.rollup_refresher: Optional[PeriodicRefresher] = None
+        if config.ROLLUP_REFRESH_SECONDS > 0:
+            source = self.source_identity()
+            filename = f"bizcopilot-rollups-{self.database_type}-{source[:16]}.sqlite3"
+            self.rollups = RollupStore(
+                os.path.join(config.ROLLUP_DIR, filename), config.ROLLUP_LOOKBACK_DAYS, source
+            )
+            self.rollup_refresher = PeriodicRefresher(
+                "rollup-refresh",
+                lambda: self.rollups.refresh(self.fetch_source),
+                config.ROLLUP_REFRESH_SECONDS,
+                self.readiness_gate.wait,
+            )
+        self.replica_url = (
+            config.COST_GUARD_REPLICA_URLS.get(self.database_type) or config.COST_GUARD_REPLICA_URL
+        )
+        # Replica connections are opened per query; only queries the guard moved use them
+        self.replica_slots = PoolSlots(config.POOL_MAX_SIZE)
+        if config.COST_GUARD_MAX_COST > 0 or config.COST_GUARD_MAX_ROWS > 0:
+            self.cost_guard = CostGuard(
+                self.explain_estimate,
+                config.COST_GUARD_MAX_COST,
+                config.COST_GUARD_MAX_ROWS,
+                config.COST_GUARD_ACTION,
+                bool(self.replica_url),
+                config.COST_GUARD_CACHE_SECONDS,
+                config.COST_GUARD_CACHE_SIZE,
+            )
+
+    def borrow(self):
+        """Take a raw connection from the driver's pool."""
+        raise NotImplementedError
+
+    def give_back(self, conn) -> None:
+        """Return a connection to the pool, discarding it if it is broken."""
+        raise NotImplementedError
+
+    def source_identity(self) -> str:
+        """Hash of the database's type, host, port and name, without credentials."""
+        url = urlsplit(self.database_url)
+        identity = f"{self.database_type}://{url.hostname or ''}:{url.port or ''}{url.path}"
+        return hashlib.sha256(identity.encode()).hexdigest()[:32]
+
+    def connect(self, database_url: str):
+        """A new connection to database_url, outside the pool."""
+        raise NotImplementedError
+
+    def dict_cursor(self, conn):
+        raise NotImplementedError
+
+    def set_timeout(self, cursor, timeout_ms: int) -> None:
+        """Apply a per-statement timeout; a no-op where the dialect has none."""
+
+    def streaming_cursor(self, conn):
+        """A dict cursor that fetches rows from the server in batches."""
+        return self.dict_cursor(conn)
+
+    def close_streaming_cursor(self, conn, cursor) -> None:
+        cursor.close()
+
+    @contextmanager
+    def pooled_connection(self):
+        """Borrow a pooled connection, waiting for a free slot instead of failing."""
+        with self.pool_slots:
+            conn = self.borrow()
+            try:
+                yield conn
+            finally:
+                self.give_back(conn)
+
+    @contextmanager
+    def probe_connection(self):
+        """
+        The health prober's connection, kept outside the pool: a pool taken up
+        by long queries must not stall the probe and age /health into a 503.
+        Probes run one at a time (HealthProber); a failed one reconnects next.
+        """
+        if self._probe_conn is None:
+            self._probe_conn = self.connect(self.database_url)
+        try:
+            yield self._probe_conn
+            # No transaction (or snapshot) stays open between probes
+            self._probe_conn.rollback()
+        except BaseException:
+            self.close_probe_connection()
+            raise
+
+    def close_probe_connection(self) -> None:
+        conn, self._probe_conn = self._probe_conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    @contextmanager
+    def replica_connection(self):
+        with self.replica_slots:
+            conn = self.connect(self.replica_url)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    def fetch_rows(
+        self, conn, query_text: str, timeout_ms: int, params: Tuple[Any, ...] = ()
+    ) -> Iterator[Dict[str, Any]]:
+        """Run query_text on conn and yield its rows, fetched in batches."""
+        setup = conn.cursor()
+        try:
+            self.set_timeout(setup, timeout_ms)
+        finally:
+            setup.close()
+        # A server-side cursor cannot be declared for EXPLAIN; its output is small
+        explain = query_text.lstrip()[:7].upper() == "EXPLAIN"
+        cursor = self.dict_cursor(conn) if explain else self.streaming_cursor(conn)
+        try:
+            if params:
+                cursor.execute(query_text, params)
+            else:
+                cursor.execute(query_text)
+            while True:
+                batch = cursor.fetchmany(STREAM_BATCH_ROWS)
+                if not batch:
+                    break
+                for row in batch:
+                    yield dict(row)
+        finally:
+            if explain:
+                cursor.close()
+            else:
+                self.close_streaming_cursor(conn, cursor)
+
+    def fetch_source(self, query_text: str) -> Iterator[Dict[str, Any]]:
+        """Rows of an internal read (rollup and index refreshes) on a pooled connection."""
+        with self.pooled_connection() as conn:
+            yield from self.fetch_rows(conn, query_text, ROLLUP_TIMEOUT_MS)
+
+    def fetch_buffered(
+        self, query_text: str, timeout_ms: int, on_replica: bool = False
+    ) -> RowBuffer:
+        buffer = RowBuffer()
+        connection = self.replica_connection() if on_replica else self.pooled_connection()
+        try:
+            with connection as conn:
+                buffer.extend(self.fetch_rows(conn, query_text, timeout_ms))
+        except BaseException:
+            buffer.close()
+            raise
+        return buffer
+
+    def execute(self, query_request: QueryRequest) -> Dict[str, Any]:
+        query_text = validate_read_only(query_request)
+        timeout_ms = int(query_request.timeout_ms)
+        if query_request.partition is not None:
+            return self.execute_partitioned(query_text, query_request.partition, timeout_ms)
+        if query_request.approximate:
+            estimated = self.approximate(query_text, timeout_ms)
+            if estimated is not None:
+                return estimated
+        if self.rollups is not None and config.ROLLUP_REWRITE:
+            try:
+                answered = self.rollups.answer(query_text, self.rollup_dialect)
+            except Exception as exc:
+                logger.warning("Rollup rewrite failed, querying the source: %s", exc)
+                answered = None
+            if answered is not None:
+                return answered
+        verdict = self.guard_cost(query_text)
+        result = buffered_result(
+            self.fetch_buffered(verdict.query_text, timeout_ms, verdict.on_replica)
+        )
+        if verdict.cost_guard is not None:
+            result["cost_guard"] = verdict.cost_guard
+        return result
+
+    def guard_cost(self, query_text: str, downgrade: bool = True) -> Verdict:
+        """
+        Where and how query_text may run; raises QueryTooExpensive. Queries
+        the connector derives (partition ranges, approximation scans) are
+        checked without downgrade, since their output is not the caller's rows.
+        """
+        if self.cost_guard is None:
+            return Verdict(query_text, False, None)
+        analyze = _EXPLAIN_ANALYZE_RE.match(query_text)
+        if analyze is not None:
+            # Only the query itself has a plan to check, and its output is the plan
+            self.cost_guard.check(query_text[analyze.end():], downgrade=False)
+        elif query_text[:7].upper() != "EXPLAIN":
+            return self.cost_guard.check(query_text, downgrade)
+        return Verdict(query_text, False, None)
+
+    def _guard_scan(self, sql: str) -> None:
+        # An approximation reads these rows into a sketch or sample; only the
+        # reading costs, so they are planned as a count of what is read
+        self.guard_cost(f"SELECT COUNT(*) FROM ({sql}) AS scanned", downgrade=False)
+
+    def explain_estimate(self, query_text: str) -> PlanEstimate:
+        """
+        The planner's total cost and result rows for query_text (rows None if
+        it does not estimate them), without running it.
+        """
+        raise NotImplementedError
+
+    def count_label(self, expression: str) -> str:
+        """Column name the database gives an unaliased COUNT(...)."""
+        return "count"
+
+    def count_estimate(self, table: str) -> Optional[Dict[str, Any]]:
+        """Row count of table from catalog statistics as an approximation(), if known."""
+        return None
+
+    def sample_source(self, table: str, population: float, rows: int) -> Optional[str]:
+        """
+        A derived table of about rows random rows of table, aliased as the
+        table, or None if it cannot be sampled without a scan.
+        """
+        return None
+
+    def approximate(self, query_text: str, timeout_ms: int) -> Optional[Dict[str, Any]]:
+        """An estimated result for a count query (see bizcopilot_connector.approximate)."""
+        plan = parse_count_query(query_text)
+        # Known tables and columns only, so the names are safe to quote into SQL
+        if plan is None or plan.table not in self.schema_metadata:
+            return None
+        if plan.column is not None and plan.column not in self.schema_metadata[plan.table]:
+            return None
+        population = self.count_estimate(plan.table)
+        if population is None:
+            return None
+        if plan.where is None and plan.column is None:
+            answer = population
+        elif population["estimate"] <= config.APPROXIMATE_SAMPLE_ROWS:
+            # Small enough that the exact query is cheap
+            return None
+        elif plan.column is None:
+            answer = self._estimate_filtered_count(plan, population, timeout_ms)
+        else:
+            answer = self._estimate_distinct(plan, population, timeout_ms)
+        if answer is None:
+            return None
+        label = plan.label or self.count_label(plan.expression)
+        return {"data": [{label: answer["estimate"]}], "rows_affected": 1, "approximation": answer}
+
+    def _estimate_filtered_count(
+        self, plan: CountQuery, population: Dict[str, Any], timeout_ms: int
+    ) -> Optional[Dict[str, Any]]:
+        source = self.sample_source(
+            plan.table, population["estimate"], config.APPROXIMATE_SAMPLE_ROWS
+        )
+        if source is None:
+            return None
+        sql = (
+            "SELECT COUNT(*) AS sampled, "
+            f"SUM(CASE WHEN {plan.where} THEN 1 ELSE 0 END) AS matched FROM {source}"
+        )
+        self.guard_cost(sql, downgrade=False)
+        with self.fetch_buffered(sql, timeout_ms) as buffer:
+            row = next(iter(buffer))
+        sampled, matched = int(row["sampled"]), int(row["matched"] or 0)
+        if sampled == 0:
+            return None
+        estimate, low, high = scaled_proportion(matched, sampled, population)
+        return approximation(
+            "sample", estimate, low, high, 0.95,
+            sampled_rows=sampled, matched_rows=matched, table_rows=population["estimate"],
+        )
+
+    def _estimate_distinct(
+        self, plan: CountQuery, population: Dict[str, Any], timeout_ms: int
+    ) -> Optional[Dict[str, Any]]:
+        column = self.quote_identifier(plan.column)
+        if population["estimate"] <= config.APPROXIMATE_SCAN_ROWS:
+            # Stream the column into a sketch: constant memory here, no sort there
+            where = f" WHERE {plan.where}" if plan.where else ""
+            sql = f"SELECT {column} AS value FROM {self.quote_identifier(plan.table)}{where}"
+            self._guard_scan(sql)
+            sketch = HyperLogLog()
+            scanned = 0
+            with self.pooled_connection() as conn:
+                for row in self.fetch_rows(conn, sql, timeout_ms):
+                    scanned += 1
+                    if row["value"] is not None:
+                        sketch.add(row["value"])
+            estimate = sketch.count()
+            margin = 1.96 * sketch.relative_error * estimate
+            return approximation(
+                "hyperloglog", estimate, max(0.0, estimate - margin), estimate + margin, 0.95,
+                scanned_rows=scanned,
+            )
+        source = self.sample_source(
+            plan.table, population["estimate"], config.APPROXIMATE_SAMPLE_ROWS
+        )
+        if source is None:
+            return None
+        sql = (
+            f"SELECT CASE WHEN {plan.where or '1 = 1'} THEN 1 ELSE 0 END AS matched, "
+            f"{column} AS value FROM {source}"
+        )
+        self._guard_scan(sql)
+        frequencies: Counter = Counter()
+        sampled = 0
+        with self.pooled_connection() as conn:
+            for row in self.fetch_rows(conn, sql, timeout_ms):
+                sampled += 1
+                if row["matched"] and row["value"] is not None:
+                    frequencies[row["value"]] += 1
+        if sampled == 0:
+            return None
+        matched = sum(frequencies.values())
+        estimate, low, high = distinct_from_sample(
+            frequencies, matched, population["estimate"] * matched / sampled
+        )
+        return approximation(
+            "sample_gee", estimate, low, high,
+            sampled_rows=sampled, matched_rows=matched, table_rows=population["estimate"],
+        )
+
+    def iter_rows(self, query_request: QueryRequest) -> Iterator[Dict[str, Any]]:
+        query_text = validate_read_only(query_request)
+        if query_request.partition is not None:
+            raise HTTPException(status_code=400, detail="Streamed queries cannot be partitioned")
+        timeout_ms = int(query_request.timeout_ms)
+
+        def rows() -> Iterator[Dict[str, Any]]:
+            with self.pooled_connection() as conn:
+                yield from self.fetch_rows(conn, query_text, timeout_ms)
+
+        return rows()
+
+    def execute_partitioned(
+        self, query_text: str, partition: PartitionSpec, timeout_ms: int
+    ) -> Dict[str, Any]:
+        try:
+            validate_column(partition.column)
+            check_partitionable(query_text)
+            ranges = split_range(
+                parse_bound(partition.start),
+                parse_bound(partition.end),
+                min(partition.partitions, config.MAX_PARTITIONS),
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+        range_sql = {
+            (lower, upper): wrap_sql(
+                query_text, partition.column, lower, upper, quote=self.identifier_quote
+            )
+            for lower, upper in ranges
+        }
+        # Every range is checked before any of them runs
+        for sql in range_sql.values():
+            self.guard_cost(sql, downgrade=False)
+        buffers: List[RowBuffer] = []
+
+        def run_range(lower, upper) -> RowBuffer:
+            buffer = self.fetch_buffered(range_sql[(lower, upper)], timeout_ms)
+            buffers.append(buffer)
+            return buffer
+
+        merged = RowBuffer()
+        try:
+            merged.extend(iter_partitioned(run_range, ranges, config.POOL_MAX_SIZE))
+        except BaseException:
+            merged.close()
+            raise
+        finally:
+            for buffer in buffers:
+                buffer.close()
+        return buffered_result(merged)
+
+    def product_names(self, watermark: Any) -> Tuple[Any, Iterable[Tuple[Any, Any]]]:
+        latest = self.catalog_rows("SELECT MAX(order_date) FROM orders")[0][0]
+        if isinstance(latest, datetime):
+            latest = latest.date()
+        elif isinstance(latest, str):
+            latest = date.fromisoformat(latest[:10])
+        # Future-dated orders must not push the window past today
+        if latest is not None:
+            latest = min(latest, date.today())
+        where = ""
+        if watermark is not None:
+            since = watermark - timedelta(days=PRODUCT_INDEX_LOOKBACK_DAYS)
+            where = f" WHERE o.order_date >= '{since.isoformat()}'"
+        rows = self.fetch_source(_PRODUCT_NAMES_SQL.format(where=where))
+        pairs = ((row["tenant_id"], row["product_name"]) for row in rows)
+        return max(filter(None, (latest, watermark)), default=None), pairs
+
+    def primary_key(self, table: str) -> List[str]:
+        if not self.primary_key_sql:
+            return []
+        return [row[0] for row in self.catalog_rows(self.primary_key_sql, (table,))]
+
+    def changes(
+        self, table: str, column: Optional[str], watermark: Optional[str], limit: int
+    ) -> ChangeFeed:
+        columns = self.schema_metadata.get(table)
+        if columns is None:
+            raise HTTPException(status_code=404, detail=f"Unknown table: {table}")
+        start = Position.decode(watermark) if watermark else None
+        if start is not None:
+            if start.table != table or (column and column != start.column):
+                raise InvalidWatermark("The watermark belongs to another table or column")
+            column, key = start.column, start.key
+        else:
+            column = column or next((c for c in CHANGE_COLUMNS if c in columns), None)
+            if column is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{table} has no {' or '.join(CHANGE_COLUMNS)}; pass column",
+                )
+            key_columns = self.primary_key(table)
+            if len(key_columns) != 1:
+                raise HTTPException(
+                    status_code=400, detail=f"{table} needs a single-column primary key"
+                )
+            key = key_columns[0]
+        # Columns from the catalog only, so the names are safe to quote into SQL
+        if column not in columns or key not in columns:
+            raise HTTPException(status_code=400, detail=f"Unknown column of {table}: {column}")
+        name = self.quote_identifier(table)
+        ordered, tiebreak = self.quote_identifier(column), self.quote_identifier(key)
+        params: Tuple[Any, ...] = ()
+        if start is None:
+            where = f"{ordered} IS NOT NULL"
+        elif column == key:
+            where, params = f"{ordered} > %s", (start.value,)
+        elif start.key_value is None:
+            where, params = f"{ordered} >= %s", (start.value,)
+        else:
+            where = f"({ordered} > %s OR ({ordered} = %s AND {tiebreak} > %s))"
+            params = (start.value, start.value, start.key_value)
+        order_by = ordered if column == key else f"{ordered}, {tiebreak}"
+        sql = f"SELECT * FROM {name} WHERE {where} ORDER BY {order_by} LIMIT {int(limit) + 1}"
+
+        def rows() -> Iterator[Dict[str, Any]]:
+            with self.pooled_connection() as conn:
+                yield from self.fetch_rows(conn, sql, CHANGES_TIMEOUT_MS, params)
+
+        return ChangeFeed(
+            table,
+            column,
+            key,
+            start,
+            rows(),
+            limit,
+            lambda row: (watermark_value(row[column]), watermark_value(row[key])),
+            to_json,
+        )
+
+    def start(self) -> None:
+        super().start()
+        if self.rollup_refresher is not None:
+            self.rollup_refresher.start()
+
+    def stop(self) -> None:
+        if self.rollup_refresher is not None:
+            self.rollup_refresher.stop()
+        super().stop()
+        self.close_probe_connection()
+
+    def warm_pool(self) -> None:
+        with ExitStack() as stack:
+            count = min(self.warm_connections, config.POOL_MAX_SIZE)
+            conns = [stack.enter_context(self.pooled_connection()) for _ in range(count)]
+            for conn in conns:
+                cursor = conn.cursor()
+                try:
+                    for query in ["SELECT 1"] + config.WARMUP_QUERIES:
+                        cursor.execute(query)
+                        cursor.fetchall()
+                finally:
+                    cursor.close()
+
+    def catalog_rows(self, query: str, params: Tuple[Any, ...] = ()) -> List[Tuple[Any, ...]]:
+        with self.pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    def _column_rows(self) -> List[Tuple[Any, ...]]:
+        return self.catalog_rows(
+            "SELECT table_name, column_name, data_type, is_nullable "
+            f"FROM information_schema.columns {self.schema_filter} "
+            "ORDER BY table_name, ordinal_position"
+        )
+
+    def _set_schema_metadata(self, rows: List[Tuple[Any, ...]]) -> None:
+        metadata: Dict[str, Dict[str, str]] = {}
+        for table_name, column_name, data_type, _ in rows:
+            metadata.setdefault(table_name, {})[column_name] = data_type
+        self.schema_metadata = metadata
+        self.shape_recorder.clear_cache()
+
+    def load_schema_metadata(self) -> None:
+        self._set_schema_metadata(self._column_rows())
+
+    def schema_version(self) -> str:
+        if not self.schema_version_sql:
+            return ""
+        return ":".join(str(value) for value in self.catalog_rows(self.schema_version_sql)[0])
+
+    def schema_snapshot(self) -> List[Dict[str, Any]]:
+        column_rows = self._column_rows()
+        # The snapshot read the same catalog, so index advice gets it too
+        self._set_schema_metadata(column_rows)
+        tables: Dict[str, Dict[str, Any]] = {}
+
+        def table(name: str) -> Dict[str, Any]:
+            if name not in tables:
+                tables[name] = {
+                    "name": name, "type": "table", "row_estimate": None,
+                    "columns": [], "indexes": [],
+                }
+            return tables[name]
+
+        for table_name, table_type, row_estimate in self.catalog_rows(self.table_stats_sql):
+            entry = table(table_name)
+            entry["type"] = table_type
+            entry["row_estimate"] = int(row_estimate) if row_estimate is not None else None
+        for table_name, column_name, data_type, is_nullable in column_rows:
+            table(table_name)["columns"].append(
+                {"name": column_name, "type": data_type, "nullable": is_nullable == "YES"}
+            )
+        indexes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for row in self.catalog_rows(self.index_columns_sql):
+            table_name, index_name_, column_name, unique = row
+            index = indexes.get((table_name, index_name_))
+            if index is None:
+                index = {"name": index_name_, "columns": [], "unique": bool(unique)}
+                indexes[(table_name, index_name_)] = index
+                table(table_name)["indexes"].append(index)
+            index["columns"].append(column_name)
+        return [tables[name] for name in sorted(tables)]
+
+    def quote_identifier(self, name: str) -> str:
+        q = self.identifier_quote
+        return q + name.replace(q, q + q) + q
+
+    def fetch_sample(self, query_text: str) -> List[Dict[str, Any]]:
+        with self.fetch_buffered(query_text, SAMPLE_TIMEOUT_MS) as buffer:
+            return list(buffer)
+
+    def tables_read(self, query_request: QueryRequest) -> Optional[Set[str]]:
+        # EXPLAIN output describes a run, not the data
+        if query_request.query.lstrip().upper().startswith("EXPLAIN"):
+            return None
+        return sql_tables_read(query_request.query, self.schema_metadata)
+
+    def extract_shapes(self, query_text: str) -> List[ObservedShape]:
+        if query_text.lstrip()[:7].upper() == "EXPLAIN":
+            return []
+        return sql_shapes(query_text, self.schema_metadata)
+
+    def existing_indexes(self) -> Dict[str, List[List[str]]]:
+        indexes: Dict[Tuple[str, str], List[str]] = {}
+        for table_name, index_name_, column_name, _ in self.catalog_rows(self.index_columns_sql):
+            indexes.setdefault((table_name, index_name_), []).append(column_name)
+        existing: Dict[str, List[List[str]]] = {}
+        for (table_name, _), column_names in indexes.items():
+            existing.setdefault(table_name, []).append(column_names)
+        return existing
+
+    def index_statement(self, table: str, columns: List[Tuple[str, int]]) -> str:
+        q = self.identifier_quote
+        column_list = ", ".join(
+            f"{q}{name}{q}" + (" DESC" if direction < 0 else "") for name, direction in columns
+        )
+        name = index_name(table, columns)
+        return f"{self.create_index} {q}{name}{q} ON {q}{table}{q} ({column_list})"
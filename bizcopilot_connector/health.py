@@ -0,0 +1,99 @@
+"""
+Cached health probing.
+
+A HealthProber runs a probe function (liveness round trip, pool stats,
+replica lag) on an interval in a daemon thread and keeps the last result.
+/health answers from that snapshot without touching the database; a deep
+check calls refresh() to probe inline.
+
+Serverless handlers have no long-lived thread, so they call get() instead,
+which only probes when the cached result is older than the interval.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("connector")
+
+
+class HealthProber:
+    def __init__(
+        self,
+        probe: Callable[[], Dict[str, Any]],
+        interval_seconds: float = 10.0,
+        stale_after_seconds: Optional[float] = None,
+    ):
+        self._probe = probe
+        self.interval_seconds = interval_seconds
+        # A snapshot older than this is reported unhealthy (the prober is stuck)
+        self.stale_after_seconds = stale_after_seconds or interval_seconds * 3
+        self._state: Dict[str, Any] = {
+            "status": "unknown",
+            "error": "No health probe has completed yet",
+            "checked_at": None,
+        }
+        self._checked_monotonic: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="health-prober", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_seconds)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.interval_seconds)
+
+    def refresh(self) -> Dict[str, Any]:
+        """Probe now and store the result."""
+        with self._refresh_lock:
+            started = time.perf_counter()
+            try:
+                details = self._probe() or {}
+                state = {"status": "healthy", **details}
+            except Exception as exc:
+                logger.warning("Health probe failed: %s", exc)
+                state = {"status": "unhealthy", "error": str(exc)}
+            state["probe_latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+            state["checked_at"] = datetime.utcnow().isoformat()
+            with self._lock:
+                self._state = state
+                self._checked_monotonic = time.monotonic()
+            return dict(state)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the cached state without probing."""
+        with self._lock:
+            state = dict(self._state)
+            checked = self._checked_monotonic
+        if checked is not None:
+            age = time.monotonic() - checked
+            state["age_seconds"] = round(age, 3)
+            if age > self.stale_after_seconds and state["status"] == "healthy":
+                state["status"] = "unhealthy"
+                state["error"] = "Health state is stale"
+        return state
+
+    def get(self, max_age_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Return the cached state, probing first if it is older than max_age_seconds."""
+        max_age = self.interval_seconds if max_age_seconds is None else max_age_seconds
+        with self._lock:
+            checked = self._checked_monotonic
+        if checked is None or time.monotonic() - checked > max_age:
+            self.refresh()
+        return self.snapshot()
@@ -0,0 +1,375 @@
+"""
+Index advice from observed query shapes.
+
+Every successful /execute is reduced to one shape per table or collection:
+the columns it filters on by equality, the columns it filters on by range,
+and its sort. Shapes are counted with their latency. /index-advice turns
+the most expensive shapes into composite index candidates (equality
+columns, then sort, then range: the usual ESR order), drops candidates an
+existing index already covers, and asks the database to EXPLAIN a sample
+query so that only candidates that could change the plan (a sequential or
+collection scan, or an in-memory sort today) are recommended. A candidate
+is "confirmed" only when the planner was shown the index and picked it,
+which takes PostgreSQL's hypopg extension; a scan or sort in today's plan
+does not prove the planner would use the index instead.
+
+SQL shapes come from a lightweight scan of the statement, not a full
+parser: qualified and unqualified column references in WHERE, JOIN ... ON
+and ORDER BY are resolved against the tables in FROM/JOIN, using the
+driver's schema metadata when it is loaded. Anything it cannot attribute
+to one table is ignored.
+"""
+
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from bizcopilot_connector import config
+
+# Longest composite index recommended
+MAX_INDEX_COLUMNS = 4
+
+
+class QueryShape(NamedTuple):
+    table: str
+    equality: Tuple[str, ...]
+    ranges: Tuple[str, ...]
+    sort: Tuple[Tuple[str, int], ...]
+
+
+# (shape, driver-specific sample used to EXPLAIN it)
+ObservedShape = Tuple[QueryShape, Any]
+
+
+class PlanEvidence(NamedTuple):
+    # Whether the sample's plan has a scan or sort an index on the columns could serve
+    applies: bool
+    # Whether the planner picked the index itself (a hypothetical one)
+    confirmed: bool
+    detail: str
+
+
+class ShapeStats:
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.sample: Any = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "queries": self.count,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 2) if self.count else 0,
+            "max_ms": round(self.max_seconds * 1000, 2),
+            "total_ms": round(self.total_seconds * 1000, 2),
+        }
+
+
+class ShapeRecorder:
+    """
+    Thread-safe shape counters. Extraction is memoised per query text, so a
+    dashboard re-running the same statement is only parsed once.
+    """
+
+    def __init__(
+        self,
+        extract: Callable[[str], List[ObservedShape]],
+        max_shapes: int = config.INDEX_ADVISOR_MAX_SHAPES,
+    ):
+        self._extract = lru_cache(maxsize=1024)(extract)
+        self.max_shapes = max_shapes
+        self.stats: Dict[QueryShape, ShapeStats] = {}
+        self._lock = threading.Lock()
+
+    def clear_cache(self) -> None:
+        """Forget memoised extractions, e.g. once schema metadata has loaded."""
+        self._extract.cache_clear()
+
+    def record(self, query_text: str, seconds: float) -> None:
+        observed = self._extract(query_text)
+        with self._lock:
+            for shape, sample in observed:
+                stats = self.stats.get(shape)
+                if stats is None:
+                    if len(self.stats) >= self.max_shapes:
+                        # Make room by forgetting the cheapest shape
+                        cheapest = min(self.stats, key=lambda s: self.stats[s].total_seconds)
+                        del self.stats[cheapest]
+                    stats = self.stats[shape] = ShapeStats()
+                stats.count += 1
+                stats.total_seconds += seconds
+                stats.max_seconds = max(stats.max_seconds, seconds)
+                stats.sample = sample
+
+    def top(self, limit: int) -> List[Tuple[QueryShape, ShapeStats]]:
+        with self._lock:
+            ranked = sorted(self.stats.items(), key=lambda item: -item[1].total_seconds)
+        return ranked[:limit]
+
+
+def candidate_columns(shape: QueryShape) -> List[Tuple[str, int]]:
+    """Equality, then sort, then range columns; each column once."""
+    columns: List[Tuple[str, int]] = []
+    seen = set()
+    for name, direction in (
+        [(c, 1) for c in shape.equality] + list(shape.sort) + [(c, 1) for c in shape.ranges]
+    ):
+        if name not in seen:
+            seen.add(name)
+            columns.append((name, direction))
+    return columns[:MAX_INDEX_COLUMNS]
+
+
+def is_covered(columns: List[Tuple[str, int]], existing: List[List[str]]) -> bool:
+    """True if an existing index starts with the candidate's columns."""
+    names = [name for name, _ in columns]
+    return any(index[: len(names)] == names for index in existing)
+
+
+def index_name(table: str, columns: List[Tuple[str, int]]) -> str:
+    return "idx_" + "_".join([table] + [name for name, _ in columns])[:59]
+
+
+def advise(driver, limit: int = 10) -> Dict[str, Any]:
+    """
+    Recommendations for driver's most expensive shapes. The driver supplies
+    existing_indexes(), explain_candidate() and index_statement().
+    """
+    existing = driver.existing_indexes()
+    recommendations: Dict[Tuple[str, Tuple[Tuple[str, int], ...]], Dict[str, Any]] = {}
+    skipped = []
+    for shape, stats in driver.shape_recorder.top(limit * 5):
+        columns = candidate_columns(shape)
+        if not columns:
+            continue
+        summary = {
+            "table": shape.table,
+            "columns": [name for name, _ in columns],
+            **stats.as_dict(),
+        }
+        key = (shape.table, tuple(columns))
+        if key in recommendations:
+            recommendation = recommendations[key]
+            for field in ("queries", "total_ms"):
+                recommendation[field] = round(recommendation[field] + summary[field], 2)
+            continue
+        if is_covered(columns, existing.get(shape.table, [])):
+            skipped.append({**summary, "reason": "covered by an existing index"})
+            continue
+        try:
+            evidence = driver.explain_candidate(shape, stats.sample, columns)
+        except Exception as exc:
+            skipped.append({**summary, "reason": f"EXPLAIN failed: {exc}"})
+            continue
+        if not evidence.applies:
+            skipped.append({**summary, "reason": f"plan would not change: {evidence.detail}"})
+            continue
+        recommendations[key] = {
+            **summary,
+            "plan": evidence.detail,
+            "confirmed": evidence.confirmed,
+            "statement": driver.index_statement(shape.table, columns),
+        }
+        if len(recommendations) >= limit:
+            break
+    return {
+        "shapes_observed": len(driver.shape_recorder.stats),
+        "recommendations": list(recommendations.values()),
+        "skipped": skipped,
+    }
+
+
+# --- SQL shape extraction ---------------------------------------------------
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+# What a string literal is masked to: a LIKE pattern led by a wildcard, or anything else
+_WILDCARD_LITERAL = "'%'"
+_LITERAL = "''"
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_IDENT = r"[A-Za-z_][A-Za-z0-9_$]*"
+_TABLE_RE = re.compile(
+    rf"\b(?:FROM|JOIN)\s+((?:{_IDENT}\.)?{_IDENT})(?:\s+(?:AS\s+)?({_IDENT}))?", re.I
+)
+_CLAUSE_END = (
+    r"(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bHAVING\b|\bLIMIT\b|\bOFFSET\b|\bUNION\b"
+    r"|\bWINDOW\b|\bFETCH\b|\bFOR\b|$)"
+)
+_WHERE_RE = re.compile(rf"\bWHERE\b(.*?){_CLAUSE_END}", re.I | re.S)
+_ON_RE = re.compile(
+    r"\bON\b(.*?)(?=\bJOIN\b|\bWHERE\b|\bLEFT\b|\bRIGHT\b|\bINNER\b|\bFULL\b|\bCROSS\b"
+    r"|\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\)|$)",
+    re.I | re.S,
+)
+_ORDER_RE = re.compile(r"\bORDER\s+BY\b(.*?)(?=\bLIMIT\b|\bOFFSET\b|\bFETCH\b|\)|$)", re.I | re.S)
+_PREDICATE_RE = re.compile(
+    rf"(?:({_IDENT})\.)?({_IDENT})\s*(<>|!=|>=|<=|=|<|>|\bNOT\s+IN\b|\bIN\b|\bBETWEEN\b"
+    rf"|\bNOT\s+LIKE\b|\bI?LIKE\b)\s*('%'|'')?",
+    re.I,
+)
+_JOIN_KEY_RE = re.compile(rf"({_IDENT})\.({_IDENT})\s*=\s*({_IDENT})\.({_IDENT})")
+_SORT_ITEM_RE = re.compile(rf"^\s*(?:({_IDENT})\.)?({_IDENT})(?:\s+(ASC|DESC))?\s*$", re.I)
+_RANGE_OPERATORS = {">", "<", ">=", "<=", "BETWEEN"}
+_EQUALITY_OPERATORS = {"=", "IN"}
+_KEYWORDS = {
+    "WHERE", "JOIN", "ON", "LEFT", "RIGHT", "INNER", "OUTER", "FULL", "CROSS", "GROUP",
+    "ORDER", "LIMIT", "OFFSET", "UNION", "HAVING", "AND", "OR", "NOT", "USING", "LATERAL",
+    "WINDOW", "NATURAL", "AS", "FETCH", "FOR",
+}
+
+
+def _table_refs(sql: str) -> Dict[str, str]:
+    """alias (or table name) -> table name, for every FROM/JOIN table."""
+    aliases: Dict[str, str] = {}
+    for qualified, alias in _TABLE_RE.findall(sql):
+        table = qualified.split(".")[-1]
+        if table.upper() in _KEYWORDS or table.upper() == "SELECT":
+            continue
+        aliases[table.lower()] = table
+        if alias and alias.upper() not in _KEYWORDS:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def table_aliases(query_text: str, table: str) -> set:
+    """Lower-cased names table goes by in query_text (its own name and any aliases)."""
+    sql = _STRING_RE.sub("''", query_text).replace('"', "").replace("`", "")
+    return {alias for alias, name in _table_refs(sql).items() if name == table} | {table.lower()}
+
+
+def _mask_literal(match: re.Match) -> str:
+    return _WILDCARD_LITERAL if match.group()[1:2] in ("%", "_") else _LITERAL
+
+
+def sql_plan_nodes(node: Dict[str, Any]):
+    """Walk a PostgreSQL EXPLAIN (FORMAT JSON) plan tree."""
+    yield node
+    for child in node.get("Plans", []):
+        yield from sql_plan_nodes(child)
+
+
+def sql_shapes(
+    query_text: str, schema_metadata: Dict[str, Dict[str, Any]]
+) -> List[ObservedShape]:
+    """Per-table shapes of a read-only SQL statement; the sample is the statement."""
+    masked = _STRING_RE.sub(_mask_literal, query_text)
+    sql = _COMMENT_RE.sub(" ", masked).replace('"', "").replace("`", "")
+    aliases = _table_refs(sql)
+    if schema_metadata:
+        # Also drops false hits such as EXTRACT(YEAR FROM order_date)
+        aliases = {alias: t for alias, t in aliases.items() if t in schema_metadata}
+    if not aliases:
+        return []
+    tables = sorted(set(aliases.values()))
+
+    def resolve(qualifier: Optional[str], column: str) -> Optional[str]:
+        if qualifier:
+            table = aliases.get(qualifier.lower())
+        elif len(tables) == 1:
+            table = tables[0]
+        else:
+            owners = [t for t in tables if column in schema_metadata.get(t, {})]
+            table = owners[0] if len(owners) == 1 else None
+        if table is None or column.upper() in _KEYWORDS:
+            return None
+        if schema_metadata and column not in schema_metadata.get(table, {}):
+            return None
+        return table
+
+    equality: Dict[str, set] = {t: set() for t in tables}
+    ranges: Dict[str, set] = {t: set() for t in tables}
+    for clause in _WHERE_RE.findall(sql):
+        if re.search(r"\bOR\b", clause, re.I):
+            # Disjunctions are not served by a single composite index
+            continue
+        for qualifier, column, operator, literal in _PREDICATE_RE.findall(clause):
+            operator = " ".join(operator.upper().split())
+            table = resolve(qualifier, column)
+            if table is None:
+                continue
+            if operator in _EQUALITY_OPERATORS:
+                equality[table].add(column)
+            elif operator in _RANGE_OPERATORS:
+                ranges[table].add(column)
+            elif operator == "LIKE" and literal == _LITERAL:
+                # Only a fixed prefix is a btree range; ILIKE and '%...' scan anyway
+                ranges[table].add(column)
+    # Join keys are their own shapes: a lookup index on the inner side of the join
+    join_keys = set()
+    for clause in _ON_RE.findall(sql):
+        for left_alias, left_column, right_alias, right_column in _JOIN_KEY_RE.findall(clause):
+            for qualifier, column in ((left_alias, left_column), (right_alias, right_column)):
+                table = resolve(qualifier, column)
+                if table is not None:
+                    join_keys.add(QueryShape(table, (column,), (), ()))
+
+    sort: Dict[str, List[Tuple[str, int]]] = {}
+    order_clauses = _ORDER_RE.findall(sql)
+    if order_clauses:
+        items = []
+        for item in order_clauses[-1].split(","):
+            match = _SORT_ITEM_RE.match(item)
+            table = match and resolve(match.group(1), match.group(2))
+            if not table:
+                items = []
+                break
+            direction = -1 if (match.group(3) or "").upper() == "DESC" else 1
+            items.append((table, match.group(2), direction))
+        # An index can only serve a sort that stays within one table
+        if items and len({table for table, _, _ in items}) == 1:
+            sort[items[0][0]] = [(column, direction) for _, column, direction in items]
+
+    observed = []
+    for table in tables:
+        shape = QueryShape(
+            table,
+            tuple(sorted(equality[table])),
+            tuple(sorted(ranges[table] - equality[table])),
+            tuple(sort.get(table, ())),
+        )
+        if shape.equality or shape.ranges or shape.sort:
+            observed.append((shape, query_text))
+    observed.extend((shape, query_text) for shape in sorted(join_keys))
+    return observed
+
+
+# --- MongoDB shape extraction -----------------------------------------------
+
+_MONGO_RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte", "$regex"}
+_MONGO_EQUALITY_OPERATORS = {"$eq", "$in"}
+
+
+def _filter_fields(filter_query: Dict[str, Any], equality: set, ranges: set) -> None:
+    for field, condition in filter_query.items():
+        if field == "$and" and isinstance(condition, list):
+            for clause in condition:
+                if isinstance(clause, dict):
+                    _filter_fields(clause, equality, ranges)
+            continue
+        if field.startswith("$"):
+            # $or, $expr, $text, ... cannot be served by one composite index
+            continue
+        if not isinstance(condition, dict) or not any(k.startswith("$") for k in condition):
+            equality.add(field)
+        elif _MONGO_EQUALITY_OPERATORS & set(condition):
+            equality.add(field)
+        elif _MONGO_RANGE_OPERATORS & set(condition):
+            ranges.add(field)
+
+
+def mongo_shape(
+    collection: str, filter_query: Dict[str, Any], sort: List[Tuple[str, int]]
+) -> List[ObservedShape]:
+    """The shape of a find (or a pipeline's leading $match/$sort); the sample re-runs it."""
+    equality: set = set()
+    ranges: set = set()
+    _filter_fields(filter_query, equality, ranges)
+    shape = QueryShape(
+        collection,
+        tuple(sorted(equality)),
+        tuple(sorted(ranges - equality)),
+        tuple((field, int(direction)) for field, direction in sort),
+    )
+    if not (shape.equality or shape.ranges or shape.sort):
+        return []
+    return [(shape, {"filter": filter_query, "sort": list(shape.sort)})]
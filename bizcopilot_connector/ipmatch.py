@@ -0,0 +1,54 @@
+"""
+Compiled IP whitelist.
+
+The whitelist is compiled once at startup into sorted, non-overlapping
+integer intervals per address family, so a lookup is one bisect instead of
+a linear scan over ipaddress network objects. Verdicts are memoised per raw
+client IP string in a bounded LRU, which also skips ipaddress parsing for
+repeat callers.
+"""
+
+import bisect
+import ipaddress
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+
+def _merge(intervals: List[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+    starts: List[int] = []
+    ends: List[int] = []
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+class IPWhitelist:
+    def __init__(self, networks: Iterable[ipaddress._BaseNetwork], cache_size: int = 4096):
+        by_version: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        for net in networks:
+            by_version[net.version].append(
+                (int(net.network_address), int(net.broadcast_address))
+            )
+        self._tables = {version: _merge(intervals) for version, intervals in by_version.items()}
+        self._empty = not any(by_version.values())
+        self.allows = lru_cache(maxsize=cache_size)(self._allows)
+
+    def __bool__(self) -> bool:
+        return not self._empty
+
+    def _allows(self, client_ip: str) -> bool:
+        """Raises ValueError for a malformed address (not cached)."""
+        ip = ipaddress.ip_address(client_ip)
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        starts, ends = self._tables[ip.version]
+        value = int(ip)
+        index = bisect.bisect_right(starts, value) - 1
+        return index >= 0 and value <= ends[index]
+
+    def cache_info(self):
+        return self.allows.cache_info()
@@ -0,0 +1,359 @@
+"""
+Asynchronous query jobs.
+
+POST /jobs validates a query and queues it on a bounded worker pool. The
+worker streams the driver's rows (Driver.iter_rows, server-side cursors)
+straight into a result file on local disk as NDJSON, CSV or Parquet, so a
+long extraction neither holds a request worker nor its whole result in
+memory. Clients poll GET /jobs/{id} and download GET /jobs/{id}/result.
+
+Every job has a deadline counted from submission; a job still queued or
+writing when it passes fails with "deadline exceeded". Finished jobs and
+their files are removed JOB_RESULT_TTL_SECONDS after they finish.
+
+Each JobManager writes into a subdirectory of JOB_DIR of its own, removed
+when it stops, so connectors sharing JOB_DIR never touch each other's
+files; a process that dies without stopping leaves its subdirectory
+behind. The job registry lives in the process's memory, so /jobs needs a
+single worker process: another one cannot see the job.
+
+Parquet needs pyarrow, which is optional; without it only NDJSON and CSV
+are offered.
+"""
+
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from bizcopilot_connector.models import QueryRequest
+
+logger = logging.getLogger("connector")
+
+# Rows written between deadline/cancellation checks
+CHECK_EVERY_ROWS = 1000
+PARQUET_BATCH_ROWS = 10000
+
+
+class JobAborted(Exception):
+    pass
+
+
+class JobsBusy(Exception):
+    pass
+
+
+def _json_default(value: Any) -> str:
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def write_ndjson(rows: Iterator[Dict[str, Any]], path: str, progress: Callable[[int], None]) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8") as out:
+        for row in rows:
+            out.write(json.dumps(row, default=_json_default, ensure_ascii=False))
+            out.write("\n")
+            count += 1
+            if count % CHECK_EVERY_ROWS == 0:
+                progress(count)
+    return count
+
+
+def write_csv(rows: Iterator[Dict[str, Any]], path: str, progress: Callable[[int], None]) -> int:
+    """Columns come from the first row; nested values are written as JSON."""
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(out, fieldnames=list(row), extrasaction="ignore")
+                writer.writeheader()
+            writer.writerow(
+                {
+                    key: json.dumps(value, default=_json_default)
+                    if isinstance(value, (dict, list))
+                    else value
+                    for key, value in row.items()
+                }
+            )
+            count += 1
+            if count % CHECK_EVERY_ROWS == 0:
+                progress(count)
+    return count
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def write_parquet(
+    rows: Iterator[Dict[str, Any]], path: str, progress: Callable[[int], None]
+) -> int:
+    """Written in row groups; the schema is inferred from the first batch."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    count = 0
+    writer = None
+    batch = []
+
+    def flush():
+        nonlocal writer
+        if writer is None:
+            table = pa.Table.from_pylist(batch)
+            writer = pq.ParquetWriter(path, table.schema)
+        else:
+            table = pa.Table.from_pylist(batch, schema=writer.schema)
+        writer.write_table(table)
+        batch.clear()
+
+    try:
+        for row in rows:
+            batch.append(row)
+            count += 1
+            if count % CHECK_EVERY_ROWS == 0:
+                progress(count)
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                flush()
+        if batch:
+            flush()
+        if writer is None:
+            pq.write_table(pa.table({}), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+# format -> (writer, media type, file extension)
+FORMATS = {
+    "ndjson": (write_ndjson, "application/x-ndjson", "ndjson"),
+    "csv": (write_csv, "text/csv", "csv"),
+    "parquet": (write_parquet, "application/vnd.apache.parquet", "parquet"),
+}
+
+
+class Job:
+    def __init__(self, api_key: str, query_request: QueryRequest, fmt: str, deadline: float):
+        self.id = uuid.uuid4().hex
+        self.api_key = api_key
+        self.request_id = query_request.request_id
+        self.database_type = query_request.database_type
+        self.format = fmt
+        self.status = "queued"
+        self.created_at = time.time()
+        self.deadline = deadline
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.rows = 0
+        self.error: Optional[str] = None
+        self.path: Optional[str] = None
+        self.cancelled = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed", "cancelled")
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.format][1]
+
+    @property
+    def filename(self) -> str:
+        return f"{self.request_id or self.id}.{FORMATS[self.format][2]}"
+
+    def as_dict(self, ttl_seconds: float) -> Dict[str, Any]:
+        def iso(timestamp: Optional[float]) -> Optional[str]:
+            return datetime.utcfromtimestamp(timestamp).isoformat() if timestamp else None
+
+        state = {
+            "job_id": self.id,
+            "request_id": self.request_id,
+            "database_type": self.database_type,
+            "status": self.status,
+            "format": self.format,
+            "rows": self.rows,
+            "created_at": iso(self.created_at),
+            "started_at": iso(self.started_at),
+            "finished_at": iso(self.finished_at),
+            "deadline": iso(self.deadline),
+            "expires_at": iso(self.finished_at + ttl_seconds) if self.finished_at else None,
+        }
+        if self.error:
+            state["error"] = self.error
+        if self.path and os.path.exists(self.path):
+            state["size_bytes"] = os.path.getsize(self.path)
+        return state
+
+
+class JobManager:
+    def __init__(
+        self,
+        directory: str,
+        workers: int = 2,
+        max_pending: int = 100,
+        default_deadline_seconds: float = 3600,
+        ttl_seconds: float = 3600,
+        on_finish: Optional[Callable[[str, float, int], None]] = None,
+    ):
+        self.directory = directory
+        # This manager's own subdirectory of directory, made by start()
+        self.results_dir: Optional[str] = None
+        self.workers = workers
+        self.max_pending = max_pending
+        self.default_deadline_seconds = default_deadline_seconds
+        self.ttl_seconds = ttl_seconds
+        # Called with (api_key, seconds, rows) when a job stops, for quota accounting
+        self.on_finish = on_finish
+        self.jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stop = threading.Event()
+        self._cleaner: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self.results_dir = tempfile.mkdtemp(prefix="jobs-", dir=self.directory)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._stop.clear()
+        self._cleaner = threading.Thread(target=self._clean_loop, name="job-cleaner", daemon=True)
+        self._cleaner.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            for job in self.jobs.values():
+                job.cancelled.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self.results_dir is not None:
+            # Nothing can look these results up once the registry is gone
+            shutil.rmtree(self.results_dir, ignore_errors=True)
+            self.results_dir = None
+
+    def submit(
+        self,
+        api_key: str,
+        driver,
+        query_request: QueryRequest,
+        fmt: str,
+        deadline_seconds: Optional[float] = None,
+    ) -> Job:
+        """Validate and queue; raises ValueError, JobsBusy, or the driver's HTTPException."""
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown result format: {fmt}")
+        if fmt == "parquet" and not parquet_available():
+            raise ValueError("Parquet results need pyarrow, which is not installed")
+        if self._executor is None:
+            raise JobsBusy("The job runner is not started")
+        deadline_seconds = min(
+            deadline_seconds or self.default_deadline_seconds, self.default_deadline_seconds
+        )
+        with self._lock:
+            pending = sum(1 for job in self.jobs.values() if not job.finished)
+            if pending >= self.max_pending:
+                raise JobsBusy(f"{pending} jobs are already queued or running")
+        # The statement timeout is the whole deadline; the writer enforces the rest
+        query_request = query_request.model_copy(
+            update={"timeout_ms": int(deadline_seconds * 1000)}
+        )
+        rows = driver.iter_rows(query_request)
+        job = Job(api_key, query_request, fmt, time.time() + deadline_seconds)
+        with self._lock:
+            self.jobs[job.id] = job
+        self._executor.submit(self._run, job, rows)
+        return job
+
+    def get(self, api_key: str, job_id: str) -> Optional[Job]:
+        """A job is only visible to the API key that submitted it."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None or job.api_key != api_key:
+            return None
+        return job
+
+    def cancel(self, job: Job) -> None:
+        job.cancelled.set()
+        if job.finished:
+            self._remove(job)
+
+    def _run(self, job: Job, rows: Iterator[Dict[str, Any]]) -> None:
+        writer = FORMATS[job.format][0]
+        partial = os.path.join(self.results_dir, f"{job.id}.part")
+        started = time.perf_counter()
+
+        def progress(count: int) -> None:
+            job.rows = count
+            if job.cancelled.is_set():
+                raise JobAborted("cancelled")
+            if time.time() > job.deadline:
+                raise JobAborted("deadline exceeded")
+
+        try:
+            progress(0)
+            job.status = "running"
+            job.started_at = time.time()
+            job.rows = writer(rows, partial, progress)
+            final = os.path.join(self.results_dir, f"{job.id}.{FORMATS[job.format][2]}")
+            os.replace(partial, final)
+            job.path = final
+            job.status = "succeeded"
+        except JobAborted as exc:
+            job.status = "cancelled" if str(exc) == "cancelled" else "failed"
+            job.error = str(exc)
+        except Exception as exc:
+            logger.warning("Job %s failed: %s", job.id, exc)
+            job.status = "failed"
+            job.error = str(exc)
+        finally:
+            close = getattr(rows, "close", None)
+            if close is not None:
+                close()
+            if os.path.exists(partial):
+                os.remove(partial)
+            job.finished_at = time.time()
+            if job.cancelled.is_set() and job.status != "cancelled":
+                self._remove(job)
+            if self.on_finish is not None:
+                self.on_finish(job.api_key, time.perf_counter() - started, job.rows)
+
+    def _remove(self, job: Job) -> None:
+        with self._lock:
+            self.jobs.pop(job.id, None)
+        if job.path and os.path.exists(job.path):
+            os.remove(job.path)
+
+    def cleanup(self) -> None:
+        """Drop finished jobs, and their files, older than the TTL."""
+        horizon = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [
+                job for job in self.jobs.values()
+                if job.finished and job.finished_at and job.finished_at < horizon
+            ]
+        for job in expired:
+            self._remove(job)
+
+    def _clean_loop(self) -> None:
+        interval = max(1.0, min(60.0, self.ttl_seconds / 2))
+        while not self._stop.wait(interval):
+            try:
+                self.cleanup()
+            except Exception:
+                logger.exception("Job cleanup failed")
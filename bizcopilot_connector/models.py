@@ -0,0 +1,86 @@
+"""
+Request/response models for the connector HTTP API.
+"""
+
+from typing import Any, Dict, List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class PartitionSpec(BaseModel):
+    column: str = Field(..., description="Date/timestamp column to split on, e.g. order_date")
+    start: str = Field(..., description="Inclusive lower bound (ISO date or datetime)")
+    end: str = Field(..., description="Exclusive upper bound (ISO date or datetime)")
+    partitions: int = Field(4, ge=1, description="Number of sub-ranges to run in parallel")
+    native_dates: bool = Field(
+        False, description="MongoDB only: compare as BSON dates instead of strings"
+    )
+
+
+class QueryRequest(BaseModel):
+    query_type: str = Field(..., description="Type of query: SELECT / find (read-only)")
+    query: str = Field(..., description="SQL query, or JSON payload with collection and operation")
+    database_type: str = Field(..., description="Database type: postgresql, mysql or mongodb")
+    request_id: str = Field(..., description="Unique request ID for tracking")
+    timeout_ms: Optional[int] = Field(30000, description="Query timeout in milliseconds")
+    partition: Optional[PartitionSpec] = Field(
+        None, description="Opt-in parallel range-partitioned execution"
+    )
+    approximate: bool = Field(
+        False, description="Allow estimated answers for COUNT and COUNT(DISTINCT) queries"
+    )
+    if_none_match: Optional[str] = Field(
+        None, description="result_hash of the client's copy; 304 with no body if unchanged"
+    )
+    delta: bool = Field(
+        False, description="Answer with the rows added and removed since if_none_match"
+    )
+
+
+class SubscriptionRequest(QueryRequest):
+    interval_seconds: float = Field(
+        5.0, gt=0, description="How often the query is re-run while nothing reports a write"
+    )
+
+
+class JobRequest(QueryRequest):
+    format: Literal["ndjson", "csv", "parquet"] = Field(
+        "ndjson", description="Result file format; parquet needs pyarrow"
+    )
+    deadline_seconds: Optional[float] = Field(
+        None, gt=0, description="Fail the job if it has not finished by then"
+    )
+
+
+class ExportRequest(BaseModel):
+    query: str = Field(..., description="Read-only SELECT/WITH query to export")
+    database_type: str = Field("postgresql", description="Database type (postgresql only)")
+    request_id: str = Field(..., description="Unique request ID for tracking")
+    format: Literal["csv", "binary"] = Field("csv", description="COPY format")
+    header: bool = Field(True, description="CSV only: first line holds column names")
+    timeout_ms: Optional[int] = Field(600000, description="Export timeout in milliseconds")
+
+
+class QueryResponse(BaseModel):
+    success: bool
+    data: Optional[List[Dict[str, Any]]] = None
+    rows_affected: Optional[int] = None
+    execution_time_ms: int
+    request_id: str
+    result_hash: Optional[str] = None
+    # With delta: {"base", "added", "removed"} instead of data
+    delta: Optional[Dict[str, Any]] = None
+    # Set when the cost guard limited the query or moved it to the replica
+    cost_guard: Optional[Dict[str, Any]] = None
+
+
+class ApproximateQueryResponse(QueryResponse):
+    # Method, estimate and low/high bounds; {"method": "exact"} if nothing was estimated
+    approximation: Dict[str, Any]
+
+
+class ErrorResponse(BaseModel):
+    success: bool = False
+    error: str
+    error_code: str
+    request_id: Optional[str] = None
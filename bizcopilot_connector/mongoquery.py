@@ -0,0 +1,342 @@
+"""
+Read-only MongoDB operation model shared by the FastAPI driver and the
+Vercel handler.
+
+A query is a JSON payload; options may be given at the top level or under
+"options", in camelCase or snake_case:
+
+  {"collection": "order_history", "operation": "find",
+   "filter": {"status": "paid"}, "projection": {"total": 1, "created_at": 1},
+   "sort": {"created_at": -1}, "skip": 0, "limit": 50,
+   "hint": "status_1_created_at_-1", "batchSize": 500, "maxTimeMS": 2000}
+
+Query text is read as MongoDB Extended JSON, so filters can compare native
+types: {"order_date": {"$gte": {"$date": "2026-01-01T00:00:00Z"}}}.
+
+Operations are find, findone, count and aggregate. Projection, sort,
+skip, limit and hint are pushed down to the server, so clients need not
+pull whole documents. A count with an empty filter is answered from
+collection metadata (estimated_document_count) instead of a collection
+scan.
+
+Aggregation is guarded:
+
+  {"collection": "order_history", "operation": "aggregate",
+   "pipeline": [{"$match": {...}}, {"$group": {...}}], "allowDiskUse": true}
+
+Stages that write ($out, $merge) are rejected at any depth, a trailing
+$limit (the request's limit, else AGGREGATE_DEFAULT_LIMIT) is appended
+when the pipeline does not end with one, and allowDiskUse is honoured only
+if AGGREGATE_ALLOW_DISK_USE permits it. Results are cached by pipeline
+fingerprint for AGGREGATE_CACHE_SECONDS, so dashboards re-running the same
+analytics within that window do not hit the database again; pipelines
+using $sample, $rand, $sampleRate, $$NOW or $$CLUSTER_TIME are not cached.
+
+Documents are read as RawBSONDocument; see bizcopilot_connector.bsonjson.
+Their bytes are collected in a BSONBuffer, which spills to disk past
+RESULT_BUFFER_MEMORY_MB; a spilled result is streamed rather than cached.
+"""
+
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import bson
+from bson import json_util
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pydantic import BaseModel, Field
+
+from bizcopilot_connector import config
+from bizcopilot_connector.bsonjson import document_to_json, documents_to_json_array
+from bizcopilot_connector.spill import SpillBuffer
+from bizcopilot_connector.ttlcache import TTLCache
+
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+_OPERATION_ALIASES = {
+    "find": "find",
+    "findone": "findone",
+    "find_one": "findone",
+    "count": "count",
+    "countdocuments": "count",
+    "count_documents": "count",
+    "aggregate": "aggregate",
+}
+_OPTION_ALIASES = {
+    "batchSize": "batch_size",
+    "maxTimeMS": "max_time_ms",
+    "allowDiskUse": "allow_disk_use",
+}
+_WRITE_STAGES = {"$out", "$merge"}
+# A pipeline using any of these gives a different answer on every run
+_VOLATILE_OPERATORS = {"$rand", "$sample", "$sampleRate"}
+_VOLATILE_VARIABLES = {"$$NOW", "$$CLUSTER_TIME"}
+
+
+class MongoQuery(BaseModel):
+    collection: str = Field(..., min_length=1)
+    operation: str = "find"
+    filter: Dict[str, Any] = Field(default_factory=dict)
+    projection: Optional[Union[Dict[str, Any], List[str]]] = None
+    sort: Optional[List[Tuple[str, int]]] = None
+    skip: int = Field(0, ge=0)
+    limit: Optional[int] = Field(None, ge=0, description="None or 0 = no limit")
+    hint: Optional[Union[str, List[Tuple[str, Any]]]] = None
+    batch_size: Optional[int] = Field(None, ge=0)
+    max_time_ms: Optional[int] = Field(None, ge=0)
+    pipeline: List[Dict[str, Any]] = Field(default_factory=list)
+    allow_disk_use: bool = False
+
+
+def _sort_spec(sort: Any) -> Optional[List[Tuple[str, int]]]:
+    """{"a": 1, "b": -1} or [["a", 1], ["b", -1]] -> [("a", 1), ("b", -1)]."""
+    if sort is None:
+        return None
+    pairs = list(sort.items()) if isinstance(sort, dict) else [tuple(pair) for pair in sort]
+    for field, direction in pairs:
+        if direction not in (1, -1):
+            raise ValueError(f"Sort direction for {field!r} must be 1 or -1")
+    return pairs
+
+
+def _hint_spec(hint: Any) -> Any:
+    """Index name, or an index key pattern given as a dict or pairs."""
+    if isinstance(hint, dict):
+        return list(hint.items())
+    if isinstance(hint, list):
+        return [tuple(pair) for pair in hint]
+    return hint
+
+
+def _check_read_only(value: Any) -> None:
+    """Reject write stages anywhere, including $facet, $lookup and $unionWith sub-pipelines."""
+    if isinstance(value, dict):
+        for key, nested in value.items():
+            if key in _WRITE_STAGES:
+                raise ValueError(f"Aggregation stage {key} is not allowed (read-only connector)")
+            _check_read_only(nested)
+    elif isinstance(value, list):
+        for nested in value:
+            _check_read_only(nested)
+
+
+def collections_read(query: MongoQuery) -> Optional[Set[str]]:
+    """
+    Collections a query reads, including those of $lookup, $graphLookup and
+    $unionWith stages at any depth; None if its result is not repeatable.
+    """
+    names = {query.collection}
+
+    def walk(value: Any) -> bool:
+        if isinstance(value, str):
+            return value not in _VOLATILE_VARIABLES
+        if isinstance(value, list):
+            return all(walk(nested) for nested in value)
+        if not isinstance(value, dict):
+            return True
+        for key, nested in value.items():
+            if key in _VOLATILE_OPERATORS:
+                return False
+            if key in ("$lookup", "$graphLookup") and isinstance(nested, dict):
+                if isinstance(nested.get("from"), str):
+                    names.add(nested["from"])
+            elif key == "$unionWith":
+                source = nested.get("coll") if isinstance(nested, dict) else nested
+                if isinstance(source, str):
+                    names.add(source)
+            if not walk(nested):
+                return False
+        return True
+
+    if not all(walk(part) for part in (query.filter, query.projection, query.pipeline)):
+        return None
+    return names
+
+
+def _pipeline_spec(pipeline: Any, limit: Optional[int]) -> List[Dict[str, Any]]:
+    if not isinstance(pipeline, list):
+        raise ValueError("Aggregation pipeline must be a list of stages")
+    for stage in pipeline:
+        if not isinstance(stage, dict) or len(stage) != 1 or not next(iter(stage)).startswith("$"):
+            raise ValueError(f"Invalid aggregation stage: {stage!r}")
+    _check_read_only(pipeline)
+    if not pipeline or "$limit" not in pipeline[-1]:
+        pipeline = pipeline + [{"$limit": limit or config.AGGREGATE_DEFAULT_LIMIT}]
+    return pipeline
+
+
+def load_query(text: str) -> Dict[str, Any]:
+    """Query text as Extended JSON ($date, $oid, ... become BSON values)."""
+    return json_util.loads(text)
+
+
+def parse_mongo_query(payload: Dict[str, Any], default_limit: Optional[int] = None) -> MongoQuery:
+    """
+    Build a MongoQuery from a request payload; default_limit caps a find
+    that sets no limit. Raises ValueError (including pydantic's
+    ValidationError) for anything that is not a supported read.
+    """
+    fields = {**payload.get("options", {}), **payload}
+    fields.pop("options", None)
+    for alias, name in _OPTION_ALIASES.items():
+        if alias in fields:
+            fields[name] = fields.pop(alias)
+
+    operation = str(fields.get("operation") or "find")
+    if operation.lower() not in _OPERATION_ALIASES:
+        allowed = ", ".join(sorted(set(_OPERATION_ALIASES.values())))
+        raise ValueError(f"Only read operations are allowed: {allowed}")
+    fields["operation"] = _OPERATION_ALIASES[operation.lower()]
+    fields["filter"] = fields.get("filter") or fields.pop("query", None) or {}
+    if fields["operation"] == "aggregate":
+        # Older clients send the pipeline as the filter
+        pipeline = fields.get("pipeline")
+        if pipeline is None and isinstance(fields["filter"], list):
+            pipeline = fields["filter"]
+        fields["filter"] = {}
+        fields["pipeline"] = _pipeline_spec(pipeline or [], fields.get("limit"))
+    fields["sort"] = _sort_spec(fields.get("sort"))
+    fields["hint"] = _hint_spec(fields.get("hint"))
+    if fields.get("limit") is None and fields["operation"] == "find":
+        fields["limit"] = default_limit
+    known = MongoQuery.model_fields
+    return MongoQuery(**{name: value for name, value in fields.items() if name in known})
+
+
+def effective_max_time_ms(query: MongoQuery, timeout_ms: Optional[int]) -> Optional[int]:
+    """The tighter of the query's maxTimeMS and the request timeout."""
+    limits = [value for value in (query.max_time_ms, timeout_ms) if value]
+    return min(limits) if limits else None
+
+
+def find_kwargs(query: MongoQuery, timeout_ms: Optional[int]) -> Dict[str, Any]:
+    """Keyword arguments for Collection.find, with every option pushed down."""
+    kwargs: Dict[str, Any] = {"projection": query.projection, "skip": query.skip}
+    if query.operation == "findone":
+        kwargs["limit"] = 1
+    elif query.limit:
+        kwargs["limit"] = query.limit
+    if query.sort:
+        kwargs["sort"] = query.sort
+    if query.hint:
+        kwargs["hint"] = query.hint
+    if query.batch_size:
+        kwargs["batch_size"] = query.batch_size
+    max_time_ms = effective_max_time_ms(query, timeout_ms)
+    if max_time_ms:
+        kwargs["max_time_ms"] = max_time_ms
+    return kwargs
+
+
+def count(collection, query: MongoQuery, timeout_ms: Optional[int]) -> int:
+    options: Dict[str, Any] = {}
+    max_time_ms = effective_max_time_ms(query, timeout_ms)
+    if max_time_ms:
+        options["maxTimeMS"] = max_time_ms
+    if not query.filter and not query.skip and not query.limit and not query.hint:
+        # Collection metadata; no scan
+        return collection.estimated_document_count(**options)
+    if query.skip:
+        options["skip"] = query.skip
+    if query.limit:
+        options["limit"] = query.limit
+    if query.hint:
+        options["hint"] = query.hint
+    return collection.count_documents(query.filter, **options)
+
+
+def aggregate_kwargs(query: MongoQuery, timeout_ms: Optional[int]) -> Dict[str, Any]:
+    kwargs: Dict[str, Any] = {
+        "allowDiskUse": query.allow_disk_use and config.AGGREGATE_ALLOW_DISK_USE
+    }
+    if query.hint:
+        kwargs["hint"] = query.hint
+    if query.batch_size:
+        kwargs["batchSize"] = query.batch_size
+    max_time_ms = effective_max_time_ms(query, timeout_ms)
+    if max_time_ms:
+        kwargs["maxTimeMS"] = max_time_ms
+    return kwargs
+
+
+def iter_mongo_query(
+    db, query: MongoQuery, timeout_ms: Optional[int]
+) -> Iterable[RawBSONDocument]:
+    """Run a parsed query against db; every operation yields raw documents."""
+    collection = db.get_collection(query.collection, codec_options=RAW_CODEC_OPTIONS)
+    if query.operation == "count":
+        total = count(collection, query, timeout_ms)
+        return [RawBSONDocument(bson.encode({"count": total}))]
+    if query.operation == "aggregate":
+        return collection.aggregate(query.pipeline, **aggregate_kwargs(query, timeout_ms))
+    return collection.find(query.filter, **find_kwargs(query, timeout_ms))
+
+
+def run_mongo_query(db, query: MongoQuery, timeout_ms: Optional[int]) -> List[RawBSONDocument]:
+    return list(iter_mongo_query(db, query, timeout_ms))
+
+
+class BSONBuffer(SpillBuffer):
+    """Raw BSON documents, stored as their bytes and transcoded to JSON on the way out."""
+
+    def encode(self, document: Any) -> bytes:
+        return getattr(document, "raw", document)
+
+    def to_json(self, record: bytes) -> bytes:
+        return document_to_json(record)
+
+
+def buffered_documents(buffer: BSONBuffer) -> Dict[str, Any]:
+    """
+    A driver result for buffer: encoded as data_json while it is in memory,
+    as data_buffer for the response to stream and close once it has spilled.
+    """
+    if buffer.spilled:
+        return {"data_buffer": buffer, "rows_affected": len(buffer)}
+    with buffer:
+        return {"data_json": documents_to_json_array(buffer), "rows_affected": len(buffer)}
+
+
+def pipeline_fingerprint(query: MongoQuery) -> str:
+    """Stable hash of what determines an aggregation's result (stage key order included)."""
+    spec = [query.collection, query.pipeline, query.hint, query.allow_disk_use]
+    # Canonical Extended JSON keeps an ObjectId or date apart from a string of the same text
+    canonical = json_util.dumps(spec, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class AggregateCache(TTLCache):
+    """Bounded LRU of encoded aggregation results, each valid for ttl_seconds."""
+
+
+def new_aggregate_cache() -> AggregateCache:
+    return AggregateCache(config.AGGREGATE_CACHE_SECONDS, config.AGGREGATE_CACHE_SIZE)
+
+
+def execute_mongo_query(
+    db, query: MongoQuery, timeout_ms: Optional[int], cache: AggregateCache
+) -> Dict[str, Any]:
+    """
+    Run a query and encode its rows: {"data_json": bytes, "rows_affected": n},
+    or {"data_buffer": BSONBuffer, "rows_affected": n} once the result has
+    spilled to disk; the caller streams and closes the buffer. Repeatable
+    aggregation results that fit in memory are served from and stored in cache.
+    """
+    key = None
+    # $sample, $rand, $$NOW and the like must run every time
+    if query.operation == "aggregate" and collections_read(query) is not None:
+        key = pipeline_fingerprint(query)
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    buffer = BSONBuffer()
+    try:
+        buffer.extend(iter_mongo_query(db, query, timeout_ms))
+    except BaseException:
+        buffer.close()
+        raise
+    result = buffered_documents(buffer)
+    if key is not None and "data_json" in result:
+        cache.put(key, result)
+    return result
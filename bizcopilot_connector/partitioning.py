@@ -0,0 +1,154 @@
+"""
+Range-partitioned execution for large date-range scans.
+
+A query over [start, end) on a date/timestamp column is split into N
+contiguous sub-ranges. Each sub-range runs on its own pooled connection in
+a thread pool and the rows are yielded back in range order, so the merged
+result is ordered by the partition column.
+
+Each range filters the query's result rows, so only a query whose rows
+stand on their own can be split: a top-level LIMIT, OFFSET or FETCH, a
+DISTINCT, GROUP BY, HAVING, an aggregate or a window function would be
+applied per range and the merged rows would be wrong. Such queries are
+refused (check_partitionable); aggregate over the ranges client-side, or
+run them unpartitioned.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Iterator, List, Tuple, Union
+
+Bound = Union[date, datetime]
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+# Strings, quoted identifiers and comments, blanked out before looking for clauses
+_OPAQUE_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|--[^\n]*|/\*.*?\*/", re.S)
+# Clauses and calls whose meaning changes when they run once per range
+_PER_RANGE_RES = (
+    ("LIMIT", re.compile(r"\bLIMIT\b", re.I)),
+    ("OFFSET", re.compile(r"\bOFFSET\b", re.I)),
+    ("FETCH", re.compile(r"\bFETCH\s+(?:FIRST|NEXT)\b", re.I)),
+    ("DISTINCT", re.compile(r"\bDISTINCT\b", re.I)),
+    ("GROUP BY", re.compile(r"\bGROUP\s+BY\b", re.I)),
+    ("HAVING", re.compile(r"\bHAVING\b", re.I)),
+    ("a window function", re.compile(r"\bOVER\s*\(|\bOVER\s+[A-Za-z_]", re.I)),
+    (
+        "an aggregate",
+        re.compile(
+            r"\b(?:COUNT|SUM|AVG|MIN|MAX|STDDEV(?:_POP|_SAMP)?|VARIANCE|VAR_POP|VAR_SAMP"
+            r"|BIT_AND|BIT_OR|BIT_XOR|BOOL_AND|BOOL_OR|EVERY|GROUP_CONCAT|JSON_ARRAYAGG"
+            r"|JSON_OBJECTAGG|PERCENTILE_CONT|PERCENTILE_DISC|MODE|\w+_AGG)\s*\(",
+            re.I,
+        ),
+    ),
+)
+
+
+def validate_column(name: str) -> str:
+    """Reject anything that is not a plain column/field identifier."""
+    if not _IDENTIFIER_RE.match(name or ""):
+        raise ValueError(f"Invalid partition column: {name!r}")
+    return name
+
+
+def check_partitionable(query_text: str) -> None:
+    """
+    Raise ValueError if the statement's own result rows would change when it
+    runs once per range: anything that limits, deduplicates, groups or
+    aggregates outside a subquery.
+    """
+    masked = _OPAQUE_RE.sub(lambda match: " " * len(match.group()), query_text)
+    depths = []
+    depth = 0
+    for char in masked:
+        if char == "(":
+            depth += 1
+        depths.append(depth)
+        if char == ")":
+            depth -= 1
+    for name, pattern in _PER_RANGE_RES:
+        if any(depths[match.start()] == 0 for match in pattern.finditer(masked)):
+            raise ValueError(
+                f"Queries with {name} outside a subquery cannot be partitioned: each range "
+                "would apply it separately; run the query without partition"
+            )
+
+
+def parse_bound(value: str) -> Bound:
+    """Parse an ISO date ("2026-01-01") or datetime ("2026-01-01 08:00")."""
+    value = value.strip()
+    if len(value) == 10:
+        return date.fromisoformat(value)
+    return datetime.fromisoformat(value)
+
+
+def split_range(start: Bound, end: Bound, partitions: int) -> List[Tuple[Bound, Bound]]:
+    """
+    Split the half-open range [start, end) into at most `partitions`
+    contiguous sub-ranges. Dates are split on whole days, datetimes on
+    whole seconds, so no sub-range is ever empty.
+    """
+    if type(start) is not type(end):
+        raise ValueError("Partition start and end must both be dates or both be datetimes")
+    if end <= start:
+        raise ValueError("Partition end must be after start")
+    if partitions < 1:
+        raise ValueError("Partition count must be at least 1")
+
+    unit = timedelta(days=1) if not isinstance(start, datetime) else timedelta(seconds=1)
+    total_units = max(1, (end - start) // unit)
+    partitions = min(partitions, total_units)
+    step, extra = divmod(total_units, partitions)
+
+    ranges = []
+    lower = start
+    for index in range(partitions):
+        upper = lower + unit * (step + (1 if index < extra else 0))
+        ranges.append((lower, upper if index < partitions - 1 else end))
+        lower = upper
+    return ranges
+
+
+def format_bound(value: Bound) -> str:
+    """Format a bound the way date strings are stored (e.g. order_history.created_at)."""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value.isoformat()
+
+
+def iter_partitioned(
+    run_range: Callable[[Bound, Bound], List[Any]],
+    ranges: List[Tuple[Bound, Bound]],
+    max_workers: int,
+) -> Iterator[Any]:
+    """
+    Run `run_range` for every sub-range in parallel and yield rows in range
+    order. Rows of a partition are yielded as soon as it and every earlier
+    partition have finished.
+    """
+    workers = max(1, min(max_workers, len(ranges)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="partition") as executor:
+        futures = [executor.submit(run_range, lower, upper) for lower, upper in ranges]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def wrap_sql(query_text: str, column: str, lower: Bound, upper: Bound, quote: str = '"') -> str:
+    """
+    Restrict a read-only SELECT to one sub-range by wrapping it in a derived
+    table. The planner pushes the range predicate down into the inner query,
+    so an index on the column is still used. Bounds are parsed date values,
+    so inlining their ISO form is safe.
+    """
+    inner = query_text.strip().rstrip(";")
+    quoted = f"{quote}{validate_column(column)}{quote}"
+    return (
+        f"SELECT * FROM ({inner}) AS _partition "
+        f"WHERE {quoted} >= '{format_bound(lower)}' AND {quoted} < '{format_bound(upper)}' "
+        f"ORDER BY {quoted}"
+    )
@@ -0,0 +1,35 @@
+"""
+Borrow accounting for driver connection pools.
+
+psycopg2's ThreadedConnectionPool and mysql-connector's MySQLConnectionPool
+raise as soon as they are exhausted. PoolSlots puts a bounded semaphore in
+front of them so borrowers wait instead, and keeps a usage count that the
+health prober can report without touching the pool internals.
+"""
+
+import threading
+from typing import Dict
+
+
+class PoolSlots:
+    def __init__(self, size: int):
+        self.size = size
+        self._semaphore = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+
+    def __enter__(self) -> "PoolSlots":
+        self._semaphore.acquire()
+        with self._lock:
+            self._in_use += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        with self._lock:
+            self._in_use -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_use = self._in_use
+        return {"max_size": self.size, "in_use": in_use, "available": self.size - in_use}
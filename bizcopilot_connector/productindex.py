@@ -0,0 +1,186 @@
+"""
+In-memory trigram index of product names per tenant, for /search/products.
+
+order_details.product_name mixes Indonesian and English spellings ("Es
+Kopi Susu", "Iced Latte", "Matcha Latte"), so finding a product by name
+means ILIKE '%...%' over the largest table. A ProductIndex keeps every
+distinct (tenant_id, product_name) instead, with an inverted index from
+trigrams to names, and answers fuzzy lookups in memory. Callers then
+filter with the exact names: product_name IN (...).
+
+Names are matched the way pg_trgm does it: lower-cased, accents folded,
+split into words, each word padded with two spaces in front and one
+behind ("  es ", "  kopi "). Matches are ranked by score, the share of
+the query's trigrams found in the name (so "latte" finds "Iced Latte"),
+then by similarity, trigrams shared over trigrams in either.
+
+Refreshes are incremental: the driver's source returns the names seen
+since the last watermark and the new watermark; names are only ever
+added. The index is rebuilt from scratch when the process restarts.
+"""
+
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+ADD_BATCH_NAMES = 1000
+
+_NOT_ALPHANUMERIC_RE = re.compile(r"[^0-9a-z]+")
+
+# source(watermark) -> (new watermark, rows of (tenant_id, product_name))
+Source = Callable[[Any], Tuple[Any, Iterable[Tuple[Any, Any]]]]
+
+
+def normalize(text: str) -> List[str]:
+    """Lower-cased, accent-free words of text."""
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return [word for word in _NOT_ALPHANUMERIC_RE.split(folded) if word]
+
+
+def trigrams(text: str) -> Set[str]:
+    grams: Set[str] = set()
+    for word in normalize(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class _TenantNames:
+    """Names of one tenant and, per trigram, the ids of the names holding it."""
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.gram_counts = array("H")
+        self.ids: Dict[str, int] = {}
+        self.postings: Dict[str, array] = {}
+
+    def add(self, name: str) -> bool:
+        if name in self.ids:
+            return False
+        grams = trigrams(name)
+        name_id = len(self.names)
+        self.ids[name] = name_id
+        self.names.append(name)
+        self.gram_counts.append(min(len(grams), 0xFFFF))
+        for gram in grams:
+            posting = self.postings.get(gram)
+            if posting is None:
+                posting = self.postings[gram] = array("I")
+            posting.append(name_id)
+        return True
+
+    def matches(self, grams: Set[str], min_score: float) -> Iterable[Tuple[float, float, str]]:
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for name_id in self.postings.get(gram, ()):
+                shared[name_id] = shared.get(name_id, 0) + 1
+        wanted = len(grams)
+        for name_id, count in shared.items():
+            score = count / wanted
+            if score >= min_score:
+                similarity = count / (wanted + self.gram_counts[name_id] - count)
+                yield score, similarity, self.names[name_id]
+
+
+class ProductIndex:
+    def __init__(self, source: Source):
+        self._source = source
+        self._tenants: Dict[Optional[str], _TenantNames] = {}
+        self._watermark: Any = None
+        self.last_refresh: Optional[Dict[str, Any]] = None
+        # Held while names are added or searched; never while the source is read
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.last_refresh is not None
+
+    def _add(self, rows: List[Tuple[Any, Any]]) -> int:
+        added = 0
+        with self._lock:
+            for tenant_id, name in rows:
+                tenant = None if tenant_id is None else str(tenant_id)
+                names = self._tenants.get(tenant)
+                if names is None:
+                    names = self._tenants[tenant] = _TenantNames()
+                added += names.add(name)
+        return added
+
+    def refresh(self) -> Dict[str, Any]:
+        with self._refresh_lock:
+            started = time.perf_counter()
+            watermark, rows = self._source(self._watermark)
+            added = 0
+            batch: List[Tuple[Any, Any]] = []
+            for tenant_id, name in rows:
+                if isinstance(name, str) and name:
+                    batch.append((tenant_id, name))
+                if len(batch) >= ADD_BATCH_NAMES:
+                    added += self._add(batch)
+                    batch = []
+            added += self._add(batch)
+            self._watermark = watermark
+            self.last_refresh = {
+                "refreshed_at": datetime.utcnow().isoformat(),
+                "names_added": added,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+            return dict(self.last_refresh)
+
+    def search(
+        self,
+        text: str,
+        tenant_id: Optional[str] = None,
+        limit: int = 10,
+        min_score: float = 0.3,
+    ) -> List[Dict[str, Any]]:
+        """
+        Names matching text best first, each as {"product_name", "score",
+        "similarity", "tenant_ids"}; every tenant's names without tenant_id.
+        """
+        grams = trigrams(text)
+        if not grams:
+            return []
+        best: Dict[str, Tuple[float, float]] = {}
+        owners: Dict[str, List[Optional[str]]] = {}
+        with self._lock:
+            if tenant_id is None:
+                tenants = list(self._tenants.items())
+            elif tenant_id in self._tenants:
+                tenants = [(tenant_id, self._tenants[tenant_id])]
+            else:
+                tenants = []
+            for tenant, names in tenants:
+                for score, similarity, name in names.matches(grams, min_score):
+                    if (score, similarity) > best.get(name, (-1.0, -1.0)):
+                        best[name] = (score, similarity)
+                    owners.setdefault(name, []).append(tenant)
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))
+        return [
+            {
+                "product_name": name,
+                "score": round(score, 4),
+                "similarity": round(similarity, 4),
+                "tenant_ids": owners[name],
+            }
+            for name, (score, similarity) in ranked[:limit]
+        ]
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            tenants = len(self._tenants)
+            names = sum(len(t.names) for t in self._tenants.values())
+            grams = sum(len(t.postings) for t in self._tenants.values())
+        return {
+            "tenants": tenants,
+            "names": names,
+            "trigrams": grams,
+            "watermark": None if self._watermark is None else str(self._watermark),
+            "last_refresh": self.last_refresh,
+        }
@@ -0,0 +1,145 @@
+"""
+Per-API-key request rate limiting and database-time quotas.
+
+Every key has a policy with a token bucket (requests per second plus a
+burst) and a rolling budget of database time and rows returned over a
+window. A caller that is out of tokens or over budget is rejected with
+QuotaExceeded before its query reaches the database; the query that tips
+a caller over budget still completes, and is charged afterwards.
+
+A limit of 0 means unlimited, so the defaults keep the old behaviour.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from bizcopilot_connector import config
+
+
+class KeyPolicy(BaseModel):
+    name: str = Field("default", description="Label used in logs and errors")
+    rate_per_second: float = Field(config.RATE_LIMIT_PER_SECOND, ge=0)
+    burst: int = Field(config.RATE_LIMIT_BURST, ge=0, description="Bucket size; 0 = max(1, rate)")
+    db_seconds: float = Field(config.QUOTA_DB_SECONDS, ge=0, description="DB time per window")
+    rows: int = Field(config.QUOTA_ROWS, ge=0, description="Rows returned per window")
+    window_seconds: float = Field(config.QUOTA_WINDOW_SECONDS, gt=0)
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, error_code: str, message: str, retry_after: float):
+        super().__init__(message)
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = float(burst or max(1.0, rate_per_second))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Take one token; return 0 on success, else seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RollingBudget:
+    def __init__(self, policy: KeyPolicy):
+        self.policy = policy
+        self.events: Deque[Tuple[float, float, int]] = deque()
+        self.db_seconds = 0.0
+        self.rows = 0
+
+    def _prune(self, now: float) -> None:
+        horizon = now - self.policy.window_seconds
+        while self.events and self.events[0][0] < horizon:
+            _, db_seconds, rows = self.events.popleft()
+            self.db_seconds -= db_seconds
+            self.rows -= rows
+
+    def check(self, now: float) -> Optional[str]:
+        self._prune(now)
+        if self.policy.db_seconds and self.db_seconds >= self.policy.db_seconds:
+            return f"database time budget of {self.policy.db_seconds}s"
+        if self.policy.rows and self.rows >= self.policy.rows:
+            return f"row budget of {self.policy.rows} rows"
+        return None
+
+    def retry_after(self, now: float) -> float:
+        if not self.events:
+            return 0.0
+        return max(0.0, self.events[0][0] + self.policy.window_seconds - now)
+
+    def record(self, now: float, db_seconds: float, rows: int) -> None:
+        self.events.append((now, db_seconds, rows))
+        self.db_seconds += db_seconds
+        self.rows += rows
+
+
+class QuotaManager:
+    def __init__(self, policies: Dict[str, KeyPolicy]):
+        self.policies = policies
+        self._buckets = {
+            key: TokenBucket(p.rate_per_second, p.burst)
+            for key, p in policies.items()
+            if p.rate_per_second
+        }
+        self._budgets = {key: RollingBudget(p) for key, p in policies.items()}
+        self._lock = threading.Lock()
+
+    def policy(self, api_key: str) -> Optional[KeyPolicy]:
+        return self.policies.get(api_key)
+
+    def admit(self, api_key: str) -> None:
+        """Raise QuotaExceeded if the key may not run another query right now."""
+        policy = self.policies[api_key]
+        now = time.monotonic()
+        with self._lock:
+            budget = self._budgets[api_key]
+            exhausted = budget.check(now)
+            if exhausted:
+                raise QuotaExceeded(
+                    "QUOTA_EXCEEDED",
+                    f"API key '{policy.name}' has used its {exhausted} "
+                    f"per {policy.window_seconds:g}s",
+                    budget.retry_after(now),
+                )
+            bucket = self._buckets.get(api_key)
+            wait = bucket.take(now) if bucket else 0.0
+            if wait:
+                raise QuotaExceeded(
+                    "RATE_LIMITED",
+                    f"API key '{policy.name}' is limited to {policy.rate_per_second:g} requests/s",
+                    wait,
+                )
+
+    def record(self, api_key: str, db_seconds: float, rows: int) -> None:
+        with self._lock:
+            self._budgets[api_key].record(time.monotonic(), db_seconds, rows)
+
+
+def load_policies() -> Dict[str, KeyPolicy]:
+    """
+    CONNECTOR_API_KEY gets the default policy. CONNECTOR_API_KEYS adds more
+    keys as JSON, e.g. {"key-a": {"name": "bizcopilot", "rate_per_second": 5,
+    "db_seconds": 120}}; omitted fields fall back to the defaults. With only
+    CONNECTOR_API_KEYS set, the built-in default key is not accepted.
+    """
+    policies = {}
+    if config.API_KEY_SET or not config.API_KEYS_JSON:
+        policies[config.API_KEY] = KeyPolicy()
+    if config.API_KEYS_JSON:
+        for key, spec in json.loads(config.API_KEYS_JSON).items():
+            policies[key] = KeyPolicy(**(spec or {}))
+    return policies
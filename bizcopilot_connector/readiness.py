@@ -0,0 +1,118 @@
+"""
+Startup warm-up and readiness gate.
+
+A ReadinessGate runs named warm-up steps (open the pool's minimum
+connections, run hot statements, load schema metadata) in a background
+thread once the app starts. Steps that fail are retried until they pass;
+steps that already passed are not repeated. /ready reports 200 only after
+every step has succeeded, so orchestrators hold traffic until the
+instance is warm.
+
+A PeriodicRefresher runs a background refresh (sales rollups, read models)
+on an interval once the gate is ready.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("connector")
+
+
+class ReadinessGate:
+    def __init__(self, steps: List[Tuple[str, Callable[[], Any]]], retry_seconds: float = 5.0):
+        self._steps = steps
+        self.retry_seconds = retry_seconds
+        self._results: Dict[str, Dict[str, Any]] = {
+            name: {"status": "pending"} for name, _ in steps
+        }
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            failed = False
+            for name, step in self._steps:
+                if self._results[name]["status"] == "done":
+                    continue
+                started = time.perf_counter()
+                try:
+                    step()
+                    result = {"status": "done"}
+                except Exception as exc:
+                    logger.warning("Warm-up step %s failed: %s", name, exc)
+                    result = {"status": "failed"}
+                    failed = True
+                result["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                with self._lock:
+                    self._results[name] = result
+                if failed:
+                    break
+            if not failed:
+                logger.info("Connector warm-up complete")
+                self._ready.set()
+                return
+            self._stop.wait(self.retry_seconds)
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = {name: dict(result) for name, result in self._results.items()}
+        return {"status": "ready" if self.ready else "warming", "steps": steps}
+
+
+class PeriodicRefresher:
+    """Call refresh every interval_seconds in a daemon thread, starting once wait_ready passes."""
+
+    def __init__(
+        self,
+        name: str,
+        refresh: Callable[[], Any],
+        interval_seconds: float,
+        wait_ready: Callable[[float], bool],
+    ):
+        self.name = name
+        self._refresh = refresh
+        self.interval_seconds = interval_seconds
+        self._wait_ready = wait_ready
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set() and not self._wait_ready(1.0):
+            pass
+        while not self._stop.is_set():
+            try:
+                self._refresh()
+            except Exception as exc:
+                logger.warning("%s failed: %s", self.name, exc)
+            self._stop.wait(self.interval_seconds)
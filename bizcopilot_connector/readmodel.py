@@ -0,0 +1,269 @@
+"""
+Denormalized orders_enriched read model for MongoDB.
+
+order_history only holds order_id, status and a created_at string (with
+unpadded hours, so "2026-02-04 9:58" sorts after "2026-02-04 10:00"),
+and orders, order_details and tenants are separate collections. Every
+analytic question therefore needs $lookup joins. orders_enriched holds
+one document per order with everything pre-joined and native dates:
+
+  {"_id": order id, "order_id", "tenant_id", "tenant_code", "tenant_name",
+   "order_date": Date, "day": "2026-01-04", "month": "2026-01",
+   "total", "payment_method",
+   "items": [{"product_name", "qty", "price", "subtotal"}],
+   "item_count", "qty",
+   "status", "status_at": Date,
+   "status_history": [{"status", "at": Date}],
+   "refreshed_at": Date}
+
+It is indexed on (tenant_id, order_date) and order_date, so per-tenant
+date-range questions become a single-collection index scan, and it is
+queried like any other collection through /execute.
+
+Refreshes are incremental. The watermark is the largest _id seen in each
+source collection (ObjectIds are assigned in insertion order). Orders
+touched by newer orders, order_details or order_history documents are
+rebuilt and upserted. The watermark is moved back by
+READ_MODEL_LOOKBACK_SECONDS each time to cover ObjectIds from clients
+with slightly slow clocks. An order that disappeared from orders is
+removed when one of its documents changes; plain deletions are not seen.
+
+The model is the only thing the connector writes, through
+READ_MODEL_MONGODB_URI (by default the connector's own URI). That user
+needs write access to orders_enriched and orders_enriched_state only.
+"""
+
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReplaceOne
+
+READ_MODEL = "orders_enriched"
+STATE_COLLECTION = "orders_enriched_state"
+# Source collection -> field holding the order id
+SOURCES = {"orders": "id", "order_details": "order_id", "order_history": "order_id"}
+BATCH_ORDERS = 500
+
+_TIMESTAMP_RE = re.compile(
+    r"^(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{1,2})(?::(\d{1,2}))?)?"
+)
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """'2026-01-04', '2026-01-04 18:01' or '2026-02-04 9:58' as a datetime; dates pass through."""
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        return None
+    match = _TIMESTAMP_RE.match(value.strip())
+    if match is None:
+        return None
+    try:
+        return datetime(*(int(part) for part in match.groups() if part is not None))
+    except ValueError:
+        return None
+
+
+def enrich(
+    order: Dict[str, Any],
+    details: List[Dict[str, Any]],
+    history: List[Dict[str, Any]],
+    tenant: Dict[str, Any],
+    refreshed_at: datetime,
+) -> Dict[str, Any]:
+    order_date = parse_timestamp(order.get("order_date"))
+    events = [
+        {"status": entry.get("status"), "at": parse_timestamp(entry.get("created_at"))}
+        for entry in history
+    ]
+    # Undated entries first, so the last one is the latest known status
+    events.sort(key=lambda event: (event["at"] is not None, event["at"] or datetime.min))
+    items = [
+        {
+            "product_name": detail.get("product_name"),
+            "qty": detail.get("qty"),
+            "price": detail.get("price"),
+            "subtotal": detail.get("subtotal"),
+        }
+        for detail in details
+    ]
+    return {
+        "_id": order["id"],
+        "order_id": order["id"],
+        "tenant_id": order.get("tenant_id"),
+        "tenant_code": tenant.get("code"),
+        "tenant_name": tenant.get("name"),
+        "order_date": order_date,
+        "day": order_date.strftime("%Y-%m-%d") if order_date else None,
+        "month": order_date.strftime("%Y-%m") if order_date else None,
+        "total": order.get("total"),
+        "payment_method": order.get("payment_method"),
+        "items": items,
+        "item_count": len(items),
+        "qty": sum(item["qty"] for item in items if isinstance(item["qty"], (int, float))),
+        "status": events[-1]["status"] if events else None,
+        "status_at": events[-1]["at"] if events else None,
+        "status_history": events,
+        "refreshed_at": refreshed_at,
+    }
+
+
+class OrdersEnrichedModel:
+    def __init__(
+        self,
+        source_db: Callable[[], Any],
+        target_uri: str,
+        lookback_seconds: float = 300,
+    ):
+        # source_db returns the connector's (read-only) database handle
+        self._source_db = source_db
+        self.target_uri = target_uri
+        self.lookback_seconds = lookback_seconds
+        self._client: Optional[MongoClient] = None
+        self._lock = threading.Lock()
+        self._indexed = False
+
+    def target_db(self):
+        if self._client is None:
+            self._client = MongoClient(self.target_uri, serverSelectionTimeoutMS=5000)
+        return self._client.get_default_database()
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    def _ensure_indexes(self, target) -> None:
+        if self._indexed:
+            return
+        collection = target[READ_MODEL]
+        collection.create_index([("tenant_id", ASCENDING), ("order_date", ASCENDING)])
+        collection.create_index([("order_date", ASCENDING)])
+        self._indexed = True
+
+    def _state(self, target) -> Dict[str, Any]:
+        return target[STATE_COLLECTION].find_one({"_id": READ_MODEL}) or {}
+
+    def _changed_orders(self, source, state: Dict[str, Any], heads: Dict[str, ObjectId]):
+        """Order ids to rebuild; every order on the first refresh."""
+        watermarks = state.get("watermarks") or {}
+        if not watermarks:
+            for document in source["orders"].find({}, {"id": 1}).batch_size(BATCH_ORDERS * 4):
+                if document.get("id") is not None:
+                    yield document["id"]
+            return
+        seen: Set[Any] = set()
+        for name, key in SOURCES.items():
+            if name not in heads:
+                continue
+            mark = watermarks.get(name)
+            query: Dict[str, Any] = {"_id": {"$lte": heads[name]}}
+            if mark is not None:
+                since = mark.generation_time - timedelta(seconds=self.lookback_seconds)
+                query["_id"]["$gt"] = ObjectId.from_datetime(since)
+            for document in source[name].find(query, {key: 1}):
+                order_id = document.get(key)
+                if order_id is not None and order_id not in seen:
+                    seen.add(order_id)
+                    yield order_id
+
+    def _rebuild(self, source, target, order_ids: List[Any], tenants, refreshed_at) -> int:
+        orders = {o["id"]: o for o in source["orders"].find({"id": {"$in": order_ids}})}
+        details: Dict[Any, List[Dict[str, Any]]] = {}
+        for detail in source["order_details"].find({"order_id": {"$in": list(orders)}}):
+            details.setdefault(detail["order_id"], []).append(detail)
+        history: Dict[Any, List[Dict[str, Any]]] = {}
+        for entry in source["order_history"].find({"order_id": {"$in": list(orders)}}):
+            history.setdefault(entry["order_id"], []).append(entry)
+        writes = [
+            ReplaceOne(
+                {"_id": order_id},
+                enrich(
+                    order,
+                    details.get(order_id, []),
+                    history.get(order_id, []),
+                    tenants.get(order.get("tenant_id"), {}),
+                    refreshed_at,
+                ),
+                upsert=True,
+            )
+            for order_id, order in orders.items()
+        ]
+        if writes:
+            target[READ_MODEL].bulk_write(writes, ordered=False)
+        missing = [order_id for order_id in order_ids if order_id not in orders]
+        if missing:
+            target[READ_MODEL].delete_many({"_id": {"$in": missing}})
+        return len(writes)
+
+    def refresh(self) -> Dict[str, Any]:
+        with self._lock:
+            started = time.perf_counter()
+            source = self._source_db()
+            target = self.target_db()
+            self._ensure_indexes(target)
+            state = self._state(target)
+            # Everything up to these _ids is covered by this refresh
+            heads = {}
+            for name in SOURCES:
+                newest = source[name].find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+                if newest is not None:
+                    heads[name] = newest["_id"]
+            tenants = {t.get("id"): t for t in source["tenants"].find({}, {"_id": 0})}
+            refreshed_at = datetime.utcnow()
+
+            rebuilt = 0
+            changed = self._changed_orders(source, state, heads)
+            for batch in _batches(changed, BATCH_ORDERS):
+                rebuilt += self._rebuild(source, target, batch, tenants, refreshed_at)
+
+            summary = {
+                "refreshed_at": refreshed_at,
+                "orders_rebuilt": rebuilt,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+            watermarks = {**(state.get("watermarks") or {}), **heads}
+            target[STATE_COLLECTION].replace_one(
+                {"_id": READ_MODEL},
+                {"watermarks": watermarks, "last_refresh": summary},
+                upsert=True,
+            )
+            return self._describe(summary)
+
+    @staticmethod
+    def _describe(summary: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if summary is None:
+            return None
+        return {
+            **summary,
+            "refreshed_at": summary["refreshed_at"].isoformat(),
+        }
+
+    def status(self) -> Dict[str, Any]:
+        target = self.target_db()
+        state = self._state(target)
+        watermarks = state.get("watermarks") or {}
+        return {
+            "collection": READ_MODEL,
+            "documents": target[READ_MODEL].estimated_document_count(),
+            "watermarks": {
+                name: mark.generation_time.isoformat() for name, mark in watermarks.items()
+            },
+            "lookback_seconds": self.lookback_seconds,
+            "last_refresh": self._describe(state.get("last_refresh")),
+        }
+
+
+def _batches(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,295 @@
+"""
+/execute results kept until the data they read changes.
+
+Every entry is tagged with the tables (collections on MongoDB) its query
+reads, and the driver's change source invalidates a table's entries when
+that table is written:
+
+- PostgreSQL LISTENs on bizcopilot_changes, which a statement-level
+  trigger on each table notifies with the table's name. The trigger is
+  installed by a DBA (the connector stays read-only), and only tables
+  that have it are watched.
+- MySQL polls information_schema.TABLES.UPDATE_TIME every
+  RESULT_CACHE_POLL_SECONDS, so a write is noticed up to that long after
+  it commits.
+- MongoDB opens a change stream on RESULT_CACHE_COLLECTIONS. Change
+  streams need a replica set; on a standalone server nothing is watched.
+
+A query is only cached if every table it reads is watched and the result
+is repeatable: no NOW(), RANDOM() or the like, no views or functions in
+FROM. Whenever the change source disconnects, everything is dropped and
+nothing is cached until it is back, since writes made meanwhile would go
+unnoticed. Entries also expire after RESULT_CACHE_SECONDS.
+
+A result read while one of its tables was being written must not be
+stored after the invalidation for that write: versions() is taken before
+the query runs, and store() refuses the result if any of them moved. A
+table's version also moves when it starts being watched, since a write
+made before the change source was listening is never reported.
+
+Listeners (live subscriptions) are told the name of every table
+invalidated, or None when the whole cache is dropped.
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+
+from bizcopilot_connector.ttlcache import TTLCache
+
+logger = logging.getLogger("connector")
+
+# Wait between attempts to (re)connect a change source
+RECONNECT_SECONDS = 5.0
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+# PostgreSQL reads these strings as the current date or time: 'now'::timestamp
+_VOLATILE_LITERAL_RE = re.compile(r"'\s*(?:now|today|tomorrow|yesterday)\s*'", re.I)
+_VOLATILE_RE = re.compile(
+    r"\b(?:NOW|SYSDATE|CURDATE|CURTIME|CURRENT_DATE|CURRENT_TIME|CURRENT_TIMESTAMP"
+    r"|LOCALTIME|LOCALTIMESTAMP|CLOCK_TIMESTAMP|STATEMENT_TIMESTAMP|TRANSACTION_TIMESTAMP"
+    r"|TIMEOFDAY|UTC_DATE|UTC_TIME|UTC_TIMESTAMP|UNIX_TIMESTAMP|RAND|RANDOM|UUID|UUID_SHORT"
+    r"|GEN_RANDOM_UUID|NEXTVAL|CURRVAL|LASTVAL|LAST_INSERT_ID|TABLESAMPLE)\b",
+    re.I,
+)
+_IDENT = r"[A-Za-z_][A-Za-z0-9_$]*"
+_RELATION = rf"({_IDENT}(?:\s*\.\s*{_IDENT})?)(\s*\()?"
+_NOT_AN_ALIAS = (
+    r"WHERE|GROUP|ORDER|HAVING|LIMIT|OFFSET|FETCH|FOR|WINDOW|UNION|EXCEPT|INTERSECT"
+    r"|JOIN|LEFT|RIGHT|INNER|OUTER|FULL|CROSS|NATURAL|ON|USING"
+)
+_FIRST_RELATION_RE = re.compile(rf"\b(?:FROM|JOIN)\s+{_RELATION}", re.I)
+# A further comma-separated relation: FROM orders o, tenants t
+_NEXT_RELATION_RE = re.compile(
+    rf"(?:\s+(?:AS\s+)?(?!(?:{_NOT_AN_ALIAS})\b){_IDENT})?\s*,\s*{_RELATION}", re.I
+)
+_CTE_RE = re.compile(
+    rf"(?:\bWITH(?:\s+RECURSIVE)?|,)\s*({_IDENT})\s*(?:\([^)]*\))?\s+AS\s+"
+    r"(?:NOT\s+)?(?:MATERIALIZED\s+)?\(",
+    re.I,
+)
+
+
+def sql_tables_read(
+    query_text: str, schema_metadata: Dict[str, Dict[str, Any]]
+) -> Optional[Set[str]]:
+    """
+    Tables of schema_metadata that query_text reads, or None if its result
+    cannot be cached: it calls a volatile function, or reads from anything
+    else (a view missing from the catalog, a function, another schema).
+    """
+    if _VOLATILE_LITERAL_RE.search(query_text):
+        return None
+    sql = _COMMENT_RE.sub(" ", _STRING_RE.sub("''", query_text)).replace('"', "")
+    sql = sql.replace("`", "")
+    if _VOLATILE_RE.search(sql):
+        return None
+    tables = {name.lower(): name for name in schema_metadata}
+    columns = {column.lower() for shape in schema_metadata.values() for column in shape}
+    ctes = {name.lower() for name in _CTE_RE.findall(sql)}
+    read: Set[str] = set()
+    for match in _FIRST_RELATION_RE.finditer(sql):
+        while match is not None:
+            name, call = match.groups()
+            if call:
+                return None
+            parts = [part.strip().lower() for part in name.split(".")]
+            if len(parts) == 2 and parts[0] != "public":
+                return None
+            if parts[-1] in tables:
+                read.add(tables[parts[-1]])
+            elif parts[-1] not in ctes and parts[-1] not in columns:
+                # Column names follow FROM in EXTRACT(MONTH FROM order_date)
+                return None
+            match = _NEXT_RELATION_RE.match(sql, match.end())
+    return read or None
+
+
+class ResultCache(TTLCache):
+    """TTLCache whose entries are tagged with tables and dropped when those change."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        # Tables whose writes are being reported; only these are cached
+        self.watched: FrozenSet[str] = frozenset()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._versions: Dict[str, int] = {}
+        # Bumped whenever the change source disconnects
+        self._generation = 0
+        self._tables_of: Dict[Hashable, FrozenSet[str]] = {}
+        self._keys_of: Dict[str, Set[Hashable]] = {}
+        # Called outside the lock, from the change source's thread
+        self._listeners: List[Callable[[Optional[str]], None]] = []
+
+    def add_listener(self, listener: Callable[[Optional[str]], None]) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[Optional[str]], None]) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def covers(self, tables: Iterable[str]) -> bool:
+        return self.watched.issuperset(tables)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def versions(self, tables: Iterable[str]) -> Tuple[int, Tuple[int, ...]]:
+        with self._lock:
+            return self._current(tables)
+
+    def store(
+        self,
+        key: Hashable,
+        value: Any,
+        tables: Iterable[str],
+        versions: Tuple[int, Tuple[int, ...]],
+    ) -> bool:
+        """Cache value unless one of tables changed since versions was taken."""
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return False
+        tables = frozenset(tables)
+        with self._lock:
+            if not self.watched.issuperset(tables) or self._current(tables) != versions:
+                return False
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._tables_of[key] = tables
+            for table in tables:
+                self._keys_of.setdefault(table, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            return True
+
+    def invalidate(self, table: str) -> None:
+        with self._lock:
+            self._invalidate(table)
+        self._notify([table])
+
+    def watch(self, tables: Iterable[str]) -> None:
+        """Set the watched tables; entries of tables no longer watched are dropped."""
+        tables = frozenset(tables)
+        with self._lock:
+            dropped = self.watched - tables
+            for table in dropped:
+                self._invalidate(table)
+            # A write may have landed before the source was listening; results
+            # read before now must not be stored for a newly watched table
+            for table in tables - self.watched:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self.watched = tables
+        self._notify(dropped)
+
+    def unwatch(self) -> None:
+        """Forget everything; called when the change source is lost."""
+        with self._lock:
+            self._generation += 1
+            self.watched = frozenset()
+            self._entries.clear()
+            self._tables_of.clear()
+            self._keys_of.clear()
+        self._notify([None])
+
+    def _notify(self, tables: Iterable[Optional[str]]) -> None:
+        listeners = list(self._listeners)
+        for table in tables:
+            for listener in listeners:
+                try:
+                    listener(table)
+                except Exception:
+                    logger.debug("Result cache listener failed", exc_info=True)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "watched": sorted(self.watched),
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries,
+            }
+
+    def _current(self, tables: Iterable[str]) -> Tuple[int, Tuple[int, ...]]:
+        return self._generation, tuple(self._versions.get(t, 0) for t in sorted(tables))
+
+    def _invalidate(self, table: str) -> None:
+        self._versions[table] = self._versions.get(table, 0) + 1
+        self.invalidations += 1
+        for key in self._keys_of.pop(table, set()):
+            self._drop(key)
+
+    def _drop(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+        for table in self._tables_of.pop(key, ()):
+            keys = self._keys_of.get(table)
+            if keys is not None:
+                keys.discard(key)
+
+
+class ChangeWatcher:
+    """
+    Run a driver's change source in a daemon thread once wait_ready passes.
+    watch(cache, stop) blocks until stop is set or the source fails; it calls
+    cache.watch() once it is listening and cache.invalidate() per change.
+    It is restarted after RECONNECT_SECONDS, with the cache emptied.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        watch: Callable[[ResultCache, threading.Event], None],
+        cache: ResultCache,
+        wait_ready: Callable[[float], bool],
+    ):
+        self.name = name
+        self._watch = watch
+        self.cache = cache
+        self._wait_ready = wait_ready
+        self.last_error: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set() and not self._wait_ready(1.0):
+            pass
+        while not self._stop.is_set():
+            try:
+                self._watch(self.cache, self._stop)
+            except Exception as exc:
+                self.last_error = str(exc)
+                logger.warning("%s failed: %s", self.name, exc)
+            finally:
+                self.cache.unwatch()
+            self._stop.wait(RECONNECT_SECONDS)
+
+    def status(self) -> Dict[str, Any]:
+        return {**self.cache.status(), "source": self.name, "last_error": self.last_error}
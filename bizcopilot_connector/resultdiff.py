@@ -0,0 +1,108 @@
+"""
+Result hashes and deltas for /execute.
+
+Every /execute response carries result_hash, a hash of its "data" array
+as sent. A client that sends it back as if_none_match gets 304 Not
+Modified with no body while the result is unchanged; the query still
+runs, but nothing is transferred.
+
+With "delta": true the connector also keeps the rows of the result,
+encoded, under its hash for RESULT_DELTA_SECONDS (results of up to
+RESULT_DELTA_MAX_ROWS rows). A later request with delta and that hash as
+if_none_match is answered with only the rows added and removed since,
+when that is smaller than the result. Rows are compared as multisets of
+their JSON encodings, so a delta says nothing about order; clients apply
+it to their copy and sort again if they need to. A hash that has expired
+gets the full result.
+"""
+
+import hashlib
+import json
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic_core import to_json
+
+from bizcopilot_connector.ttlcache import TTLCache
+
+
+class ResultHash:
+    """result_hash of a data array fed to it chunk by chunk."""
+
+    def __init__(self):
+        self._digest = hashlib.sha256()
+
+    def update(self, chunk: bytes) -> bytes:
+        self._digest.update(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()[:32]
+
+
+def hash_chunks(chunks: Iterable[bytes]) -> str:
+    result_hash = ResultHash()
+    for chunk in chunks:
+        result_hash.update(chunk)
+    return result_hash.hexdigest()
+
+
+def normalize_hash(value: Optional[str]) -> Optional[str]:
+    """A hash as sent back by a client, which may quote it like an ETag."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    return value.strip('"') or None
+
+
+def data_bytes(result: Dict[str, Any]) -> bytes:
+    """The "data" array of an in-memory driver result, as sent."""
+    if "data_json" in result:
+        return result["data_json"]
+    return to_json(result.get("data"))
+
+
+def row_encodings(result: Dict[str, Any]) -> List[bytes]:
+    """Each row of an in-memory driver result as JSON, for diffing."""
+    if "data_json" in result:
+        # Encoded straight from BSON; re-encoded the same way every time
+        rows = json.loads(result["data_json"])
+        return [json.dumps(row, separators=(",", ":"), ensure_ascii=False).encode() for row in rows]
+    return [to_json(row) for row in result.get("data") or []]
+
+
+def diff_rows(old: List[bytes], new: List[bytes]) -> Tuple[List[bytes], List[bytes]]:
+    """Rows of new missing from old (added) and of old missing from new (removed)."""
+    before = Counter(old)
+    after = Counter(new)
+    return list((after - before).elements()), list((before - after).elements())
+
+
+class ResultVersions(TTLCache):
+    """Encoded rows of recent results by result hash, for deltas."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_rows: int):
+        super().__init__(ttl_seconds, max_entries)
+        self.max_rows = max_rows
+
+    def keep(self, result_hash: str, rows: List[bytes]) -> None:
+        if len(rows) <= self.max_rows:
+            self.put(result_hash, rows)
+
+    def delta(
+        self, base_hash: str, rows: List[bytes]
+    ) -> Optional[Tuple[List[bytes], List[bytes]]]:
+        """Added and removed rows since base_hash, or None if a full result is smaller."""
+        base = self.get(base_hash)
+        if base is None:
+            return None
+        added, removed = diff_rows(base, rows)
+        if len(added) + len(removed) >= len(rows):
+            return None
+        return added, removed
+
+
+def json_array(rows: List[bytes]) -> bytes:
+    return b"[" + b",".join(rows) + b"]"
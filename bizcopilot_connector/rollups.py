@@ -0,0 +1,626 @@
+"""
+Incrementally maintained sales rollups for the SQL connectors.
+
+Daily revenue, order counts and top products per tenant are the common
+BizCopilot questions, and each of them aggregates raw orders and
+order_details (schema.sql). A RollupStore keeps two additive tables in a
+local SQLite file instead:
+
+  daily_sales    (tenant_id, day, orders, revenue_cents)
+  product_daily  (tenant_id, day, product_name, qty, revenue_cents, lines)
+
+The source database stays read-only; the rollups are built from GROUP BY
+queries run through the driver like any other read.
+
+Refreshes are incremental. The store keeps a high-water mark on
+order_date, and each refresh re-aggregates only the days from
+(watermark - ROLLUP_LOOKBACK_DAYS) onward, replacing those days in one
+transaction. Order ids are random UUIDs and say nothing about insertion
+order, so late rows are caught by the lookback window rather than an id
+cursor; an order back-dated before the window is not picked up.
+
+Queries of the following form can be answered from the rollups instead of
+the source (ROLLUP_REWRITE, off by default since answers are as of the
+last refresh):
+
+  SELECT o.order_date, SUM(o.total) AS revenue
+  FROM orders o WHERE o.tenant_id = '...' AND o.order_date >= '2026-01-01'
+  GROUP BY o.order_date ORDER BY o.order_date
+
+Dimensions are orders.tenant_id, orders.order_date and
+order_details.product_name (the latter through an inner join on
+order_details.order_id = orders.id). Measures are COUNT(*) and
+SUM(orders.total) on orders, COUNT(*), SUM(order_details.qty) and
+SUM(order_details.subtotal) on the join, and must be aliased. WHERE may
+only compare dimensions with literals. Anything else runs on the source.
+
+A store belongs to one source database: the SQL drivers name its file
+after a hash of the database's host, port and name, and the store records
+that hash. A store recorded for another source is neither refreshed nor
+read (RollupSourceMismatch), so two connectors sharing ROLLUP_DIR never
+serve each other's aggregates.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS daily_sales (
+    tenant_id TEXT,
+    day TEXT NOT NULL,
+    orders INTEGER NOT NULL,
+    revenue_cents INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS daily_sales_tenant_day ON daily_sales (tenant_id, day);
+CREATE INDEX IF NOT EXISTS daily_sales_day ON daily_sales (day);
+CREATE TABLE IF NOT EXISTS product_daily (
+    tenant_id TEXT,
+    day TEXT NOT NULL,
+    product_name TEXT,
+    qty INTEGER NOT NULL,
+    revenue_cents INTEGER NOT NULL,
+    lines INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS product_daily_tenant_day ON product_daily (tenant_id, day);
+CREATE INDEX IF NOT EXISTS product_daily_day ON product_daily (day);
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_ORDERS_SQL = (
+    "SELECT o.tenant_id, o.order_date, COUNT(*) AS orders, SUM(o.total) AS revenue "
+    "FROM orders o{where} GROUP BY o.tenant_id, o.order_date"
+)
+_PRODUCTS_SQL = (
+    "SELECT o.tenant_id, o.order_date, d.product_name, SUM(d.qty) AS qty, "
+    "SUM(d.subtotal) AS revenue, COUNT(*) AS line_count "
+    "FROM order_details d JOIN orders o ON o.id = d.order_id{where} "
+    "GROUP BY o.tenant_id, o.order_date, d.product_name"
+)
+
+INSERT_BATCH_ROWS = 1000
+
+_DAY_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def _cents(value: Any) -> int:
+    if value is None:
+        return 0
+    return int((Decimal(str(value)) * 100).to_integral_value())
+
+
+def _day(value: Any) -> str:
+    if isinstance(value, datetime):
+        value = value.date()
+    return value.isoformat() if isinstance(value, date) else str(value)[:10]
+
+
+def _text(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def _money(cents: Optional[int]) -> Optional[Decimal]:
+    """Cents back to the DECIMAL(12,2) the source would have returned."""
+    return None if cents is None else Decimal(cents).scaleb(-2)
+
+
+class RollupDialect(NamedTuple):
+    """How the source database would have shaped the same answer."""
+
+    # Unquoted aliases come back lower-cased (PostgreSQL)
+    fold_case: bool = False
+    # Text compares and groups case-insensitively (MySQL's default collations)
+    nocase: bool = False
+    # NULL sorts after every value (PostgreSQL) rather than before (MySQL)
+    nulls_largest: bool = False
+
+
+class RollupSourceMismatch(Exception):
+    """The store on disk was built from another source database."""
+
+
+class RollupPlan(NamedTuple):
+    sql: str
+    params: List[Any]
+    money_columns: List[str]
+
+
+class RollupStore:
+    def __init__(self, path: str, lookback_days: int = 2, source: Optional[str] = None):
+        self.path = path
+        self.lookback_days = lookback_days
+        # Identity of the source database, recorded in rollup_state
+        self.source = source
+        self.last_refresh: Optional[Dict[str, Any]] = None
+        self._write_lock = threading.Lock()
+        self._initialised = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_schema(self) -> None:
+        if self._initialised:
+            return
+        conn = self._connect()
+        try:
+            # Readers keep seeing the previous rollups while a refresh writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            if self.source is not None:
+                # An empty store is claimed; one filled before sources were recorded is not
+                with conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO rollup_state SELECT 'source', ? WHERE NOT EXISTS "
+                        "(SELECT 1 FROM rollup_state WHERE name = 'watermark')",
+                        [self.source],
+                    )
+                recorded = conn.execute(
+                    "SELECT value FROM rollup_state WHERE name = 'source'"
+                ).fetchone()
+                if recorded is None or recorded["value"] != self.source:
+                    raise RollupSourceMismatch(
+                        f"Rollup store {self.path} was built from another database"
+                    )
+        finally:
+            conn.close()
+        self._initialised = True
+
+    def _read(self, sql: str, params: Iterable[Any] = ()) -> List[sqlite3.Row]:
+        self._ensure_schema()
+        conn = self._connect()
+        try:
+            return conn.execute(sql, list(params)).fetchall()
+        finally:
+            conn.close()
+
+    def watermark(self) -> Optional[date]:
+        rows = self._read("SELECT value FROM rollup_state WHERE name = 'watermark'")
+        return date.fromisoformat(rows[0]["value"]) if rows else None
+
+    def refresh(self, fetch: Callable[[str], Iterable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Bring the rollups up to date; fetch runs a read-only query on the
+        source and yields its rows as dicts.
+        """
+        with self._write_lock:
+            self._ensure_schema()
+            started = time.perf_counter()
+            watermark = self.watermark()
+            since = watermark - timedelta(days=self.lookback_days) if watermark else None
+            where = f" WHERE o.order_date >= '{since.isoformat()}'" if since else ""
+            latest: Optional[str] = None
+
+            def batches(rows, to_row):
+                nonlocal latest
+                batch = []
+                for row in rows:
+                    values = to_row(row)
+                    if latest is None or values[1] > latest:
+                        latest = values[1]
+                    batch.append(values)
+                    if len(batch) >= INSERT_BATCH_ROWS:
+                        yield batch
+                        batch = []
+                if batch:
+                    yield batch
+
+            conn = self._connect()
+            counts = {"daily_sales": 0, "product_daily": 0}
+            try:
+                # One transaction: readers see the old days or the new ones, never a mix
+                with conn:
+                    for table in counts:
+                        if since is None:
+                            conn.execute(f"DELETE FROM {table}")
+                        else:
+                            conn.execute(
+                                f"DELETE FROM {table} WHERE day >= ?", [since.isoformat()]
+                            )
+                    for batch in batches(
+                        fetch(_ORDERS_SQL.format(where=where)),
+                        lambda row: (
+                            _text(row["tenant_id"]),
+                            _day(row["order_date"]),
+                            int(row["orders"]),
+                            _cents(row["revenue"]),
+                        ),
+                    ):
+                        conn.executemany("INSERT INTO daily_sales VALUES (?, ?, ?, ?)", batch)
+                        counts["daily_sales"] += len(batch)
+                    for batch in batches(
+                        fetch(_PRODUCTS_SQL.format(where=where)),
+                        lambda row: (
+                            _text(row["tenant_id"]),
+                            _day(row["order_date"]),
+                            _text(row["product_name"]),
+                            int(row["qty"] or 0),
+                            _cents(row["revenue"]),
+                            int(row["line_count"]),
+                        ),
+                    ):
+                        conn.executemany(
+                            "INSERT INTO product_daily VALUES (?, ?, ?, ?, ?, ?)", batch
+                        )
+                        counts["product_daily"] += len(batch)
+                    # Future-dated orders must not push the window past today
+                    candidates = [d for d in (latest, watermark and watermark.isoformat()) if d]
+                    if candidates:
+                        new_watermark = min(max(candidates), date.today().isoformat())
+                        conn.execute(
+                            "INSERT OR REPLACE INTO rollup_state VALUES ('watermark', ?)",
+                            [new_watermark],
+                        )
+            finally:
+                conn.close()
+            self.last_refresh = {
+                "refreshed_at": datetime.utcnow().isoformat(),
+                "since": since.isoformat() if since else None,
+                "rows_written": counts,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+            return dict(self.last_refresh)
+
+    def status(self) -> Dict[str, Any]:
+        watermark = self.watermark()
+        counts = {
+            table: self._read(f"SELECT COUNT(*) AS n FROM {table}")[0]["n"]
+            for table in ("daily_sales", "product_daily")
+        }
+        return {
+            "watermark": watermark.isoformat() if watermark else None,
+            "lookback_days": self.lookback_days,
+            "rows": counts,
+            "last_refresh": self.last_refresh,
+        }
+
+    @staticmethod
+    def _filters(
+        tenant_id: Optional[str], start: Optional[str], end: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        """start is inclusive and end exclusive, as ISO dates."""
+        clauses, params = [], []
+        if tenant_id is not None:
+            clauses.append("tenant_id = ?")
+            params.append(tenant_id)
+        for bound, op in ((start, ">="), (end, "<")):
+            if bound is None:
+                continue
+            if not _DAY_RE.match(bound):
+                raise ValueError(f"Expected an ISO date (YYYY-MM-DD), got {bound!r}")
+            clauses.append(f"day {op} ?")
+            params.append(bound)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def sales(
+        self,
+        tenant_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        granularity: str = "day",
+    ) -> List[Dict[str, Any]]:
+        """Orders and revenue per tenant and day or month."""
+        period = {"day": "day", "month": "substr(day, 1, 7)"}.get(granularity)
+        if period is None:
+            raise ValueError("granularity must be day or month")
+        where, params = self._filters(tenant_id, start, end)
+        rows = self._read(
+            f"SELECT tenant_id, {period} AS period, SUM(orders) AS orders, "
+            f"SUM(revenue_cents) AS revenue_cents FROM daily_sales{where} "
+            "GROUP BY tenant_id, period ORDER BY tenant_id, period",
+            params,
+        )
+        return [
+            {
+                "tenant_id": row["tenant_id"],
+                granularity: row["period"],
+                "orders": row["orders"],
+                "revenue": _money(row["revenue_cents"]),
+            }
+            for row in rows
+        ]
+
+    def top_products(
+        self,
+        tenant_id: Optional[str] = None,
+        start: Optional[str] = None,
+        end: Optional[str] = None,
+        limit: int = 10,
+        order_by: str = "revenue",
+    ) -> List[Dict[str, Any]]:
+        """Best-selling products by revenue or quantity."""
+        measure = {"revenue": "revenue_cents", "qty": "qty"}.get(order_by)
+        if measure is None:
+            raise ValueError("order_by must be revenue or qty")
+        where, params = self._filters(tenant_id, start, end)
+        rows = self._read(
+            "SELECT product_name, SUM(qty) AS qty, SUM(revenue_cents) AS revenue_cents, "
+            f"SUM(lines) AS lines FROM product_daily{where} "
+            f"GROUP BY product_name ORDER BY SUM({measure}) DESC, product_name LIMIT ?",
+            params + [max(1, limit)],
+        )
+        return [
+            {
+                "product_name": row["product_name"],
+                "qty": row["qty"],
+                "revenue": _money(row["revenue_cents"]),
+                "order_lines": row["lines"],
+            }
+            for row in rows
+        ]
+
+    def answer(self, query_text: str, dialect: RollupDialect) -> Optional[Dict[str, Any]]:
+        """The query's result from the rollups, or None if they cannot answer it."""
+        plan = rewrite(query_text, dialect)
+        if plan is None or self.watermark() is None:
+            return None
+        data = []
+        for row in self._read(plan.sql, plan.params):
+            item = dict(row)
+            for name in plan.money_columns:
+                item[name] = _money(item[name])
+            data.append(item)
+        return {"data": data, "rows_affected": len(data)}
+
+
+# Query rewrite
+
+_IDENT = r'(?:"[^"]+"|`[^`]+`|\w+)'
+_REF = rf"(?:(?P<{{0}}q>{_IDENT})\s*\.\s*)?(?P<{{0}}c>{_IDENT})"
+_LITERAL = r"(?:DATE\s+)?'(?P<{0}>[^']*)'"
+
+_QUERY_RE = re.compile(
+    r"^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+(?P<from>.+?)"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"\s+GROUP\s+BY\s+(?P<group>.+?)"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+))?\s*;?\s*$",
+    re.I | re.S,
+)
+_JOIN_WORDS = r"(?:INNER|LEFT|RIGHT|FULL|CROSS|NATURAL|OUTER|JOIN|ON)\b"
+_TABLE = r"(?P<{0}>{1})(?:\s+(?:AS\s+)?(?!" + _JOIN_WORDS + r")(?P<{0}_alias>{1}))?"
+_FROM_RE = re.compile(
+    "^"
+    + _TABLE.format("first", _IDENT)
+    + r"(?:\s+(?:INNER\s+)?JOIN\s+"
+    + _TABLE.format("second", _IDENT)
+    + r"\s+ON\s+"
+    + _REF.format("l")
+    + r"\s*=\s*"
+    + _REF.format("r")
+    + ")?$",
+    re.I | re.S,
+)
+_AGGREGATE_RE = re.compile(
+    r"^(?P<expr>(?P<fn>SUM|COUNT)\s*\(\s*(?:(?P<star>\*)|" + _REF.format("a") + r")\s*\))"
+    rf"\s+(?:AS\s+)?(?P<alias>{_IDENT})$",
+    re.I | re.S,
+)
+_DIMENSION_RE = re.compile(
+    "^" + _REF.format("d") + rf"(?:\s+(?:AS\s+)?(?P<alias>{_IDENT}))?$", re.I | re.S
+)
+_PREDICATE_RE = re.compile(
+    _REF.format("p")
+    + r"\s*(?:(?P<op>=|>=|<=|>|<)\s*"
+    + _LITERAL.format("value")
+    + r"|\s+BETWEEN\s+"
+    + _LITERAL.format("low")
+    + r"\s+AND\s+"
+    + _LITERAL.format("high")
+    + r")\s*(?:AND\s+|$)",
+    re.I | re.S,
+)
+_ORDER_ITEM_RE = re.compile(r"^(?P<expr>.+?)(?:\s+(?P<dir>ASC|DESC))?$", re.I | re.S)
+
+_TABLE_COLUMNS = {
+    "orders": {"id", "tenant_id", "order_date", "total", "payment_method"},
+    "order_details": {"id", "order_id", "product_name", "qty", "price", "subtotal"},
+}
+_DIMENSIONS = {
+    ("orders", "tenant_id"): "tenant_id",
+    ("orders", "order_date"): "day",
+    ("order_details", "product_name"): "product_name",
+}
+# (function, source column or "*") -> (rollup column, is money)
+_MEASURES = {
+    "daily_sales": {
+        ("count", "*"): ("orders", False),
+        ("count", ("orders", "id")): ("orders", False),
+        ("sum", ("orders", "total")): ("revenue_cents", True),
+    },
+    "product_daily": {
+        ("count", "*"): ("lines", False),
+        ("count", ("order_details", "id")): ("lines", False),
+        ("sum", ("order_details", "qty")): ("qty", False),
+        ("sum", ("order_details", "subtotal")): ("revenue_cents", True),
+    },
+}
+
+
+def _unquote(name: str) -> Tuple[str, bool]:
+    if name[:1] in ('"', "`"):
+        return name[1:-1], True
+    return name, False
+
+
+def _split_items(text: str) -> List[str]:
+    return [item.strip() for item in text.split(",")]
+
+
+def _quote_sqlite(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def rewrite(query_text: str, dialect: RollupDialect = RollupDialect()) -> Optional[RollupPlan]:
+    """Translate a supported aggregate over orders/order_details into SQLite over the rollups."""
+    match = _QUERY_RE.match(query_text)
+    if match is None:
+        return None
+    source = _FROM_RE.match(match["from"].strip())
+    if source is None:
+        return None
+
+    aliases: Dict[str, str] = {}
+    for part in ("first", "second"):
+        if source[part] is None:
+            continue
+        table = _unquote(source[part])[0].lower()
+        if table not in _TABLE_COLUMNS or table in aliases.values():
+            return None
+        aliases[table] = table
+        if source[f"{part}_alias"]:
+            aliases[_unquote(source[f"{part}_alias"])[0].lower()] = table
+    tables = set(aliases.values())
+    if tables == {"orders"}:
+        target = "daily_sales"
+    elif tables == {"orders", "order_details"}:
+        target = "product_daily"
+    else:
+        return None
+
+    def resolve(m: re.Match, prefix: str) -> Optional[Tuple[str, str]]:
+        column = _unquote(m[f"{prefix}c"])[0].lower()
+        if m[f"{prefix}q"]:
+            table = aliases.get(_unquote(m[f"{prefix}q"])[0].lower())
+            if table is None or column not in _TABLE_COLUMNS[table]:
+                return None
+            return table, column
+        owners = [table for table in tables if column in _TABLE_COLUMNS[table]]
+        return (owners[0], column) if len(owners) == 1 else None
+
+    if target == "product_daily":
+        on = {resolve(source, "l"), resolve(source, "r")}
+        if on != {("orders", "id"), ("order_details", "order_id")}:
+            return None
+
+    def output_name(raw: str) -> str:
+        name, quoted = _unquote(raw)
+        return name.lower() if dialect.fold_case and not quoted else name
+
+    def text_column(column: str) -> str:
+        nocase = dialect.nocase and column in ("tenant_id", "product_name")
+        return column + (" COLLATE NOCASE" if nocase else "")
+
+    # SELECT list: (output name, SQLite expression, source key for ORDER BY)
+    select: List[Tuple[str, str, str]] = []
+    selected_dimensions = set()
+    money_columns = []
+    for item in _split_items(match["select"]):
+        aggregate = _AGGREGATE_RE.match(item)
+        if aggregate is not None:
+            key = "*" if aggregate["star"] else resolve(aggregate, "a")
+            measure = _MEASURES[target].get((aggregate["fn"].lower(), key))
+            if measure is None:
+                return None
+            name = output_name(aggregate["alias"])
+            if measure[1]:
+                money_columns.append(name)
+            normalized = re.sub(r"\s+", "", aggregate["expr"]).lower()
+            select.append((name, f"SUM({measure[0]})", normalized))
+            continue
+        dimension = _DIMENSION_RE.match(item)
+        if dimension is None:
+            return None
+        ref = resolve(dimension, "d")
+        column = _DIMENSIONS.get(ref) if ref else None
+        if column is None:
+            return None
+        raw_name = dimension["alias"] or dimension["dc"]
+        select.append((output_name(raw_name), column, column))
+        selected_dimensions.add(column)
+
+    where_sql, params = [], []
+    if match["where"]:
+        text = match["where"].strip()
+        position = 0
+        while position < len(text):
+            predicate = _PREDICATE_RE.match(text, position)
+            if predicate is None:
+                return None
+            position = predicate.end()
+            ref = resolve(predicate, "p")
+            column = _DIMENSIONS.get(ref) if ref else None
+            if column is None:
+                return None
+            if predicate["op"]:
+                values = [predicate["value"]]
+            else:
+                values = [predicate["low"], predicate["high"]]
+            if column == "day" and not all(_DAY_RE.match(value) for value in values):
+                return None
+            if column != "day" and predicate["op"] != "=":
+                return None
+            if predicate["op"]:
+                where_sql.append(f"{text_column(column)} {predicate['op']} ?")
+            else:
+                where_sql.append(f"{column} BETWEEN ? AND ?")
+            params.extend(values)
+
+    group_columns = []
+    for item in _split_items(match["group"]):
+        dimension = _DIMENSION_RE.match(item)
+        if dimension is None or dimension["alias"]:
+            return None
+        ref = resolve(dimension, "d")
+        column = _DIMENSIONS.get(ref) if ref else None
+        if column is None:
+            return None
+        group_columns.append(column)
+    if not selected_dimensions <= set(group_columns):
+        return None
+
+    order_sql = []
+    if match["order"]:
+        for item in _split_items(match["order"]):
+            order_item = _ORDER_ITEM_RE.match(item)
+            expression = order_item["expr"].strip()
+            descending = (order_item["dir"] or "").upper() == "DESC"
+            chosen = None
+            if expression.isdigit():
+                index = int(expression) - 1
+                if not 0 <= index < len(select):
+                    return None
+                chosen = _quote_sqlite(select[index][0])
+            else:
+                for name, _, _ in select:
+                    if output_name(expression) == name:
+                        chosen = _quote_sqlite(name)
+                        break
+                if chosen is None:
+                    normalized = re.sub(r"\s+", "", expression).lower()
+                    for name, _, key in select:
+                        if normalized == key:
+                            chosen = _quote_sqlite(name)
+                            break
+                if chosen is None:
+                    dimension = _DIMENSION_RE.match(expression)
+                    if dimension is None or dimension["alias"]:
+                        return None
+                    ref = resolve(dimension, "d")
+                    column = _DIMENSIONS.get(ref) if ref else None
+                    if column is None or column not in group_columns:
+                        return None
+                    chosen = text_column(column)
+            # Emulate where the source database puts NULLs
+            nulls = "LAST" if dialect.nulls_largest != descending else "FIRST"
+            order_sql.append(f"{chosen} {'DESC' if descending else 'ASC'} NULLS {nulls}")
+
+    sql = (
+        "SELECT "
+        + ", ".join(f"{expression} AS {_quote_sqlite(name)}" for name, expression, _ in select)
+        + f" FROM {target}"
+        + (" WHERE " + " AND ".join(where_sql) if where_sql else "")
+        + " GROUP BY "
+        + ", ".join(text_column(column) for column in group_columns)
+        + (" ORDER BY " + ", ".join(order_sql) if order_sql else "")
+        + (f" LIMIT {int(match['limit'])}" if match["limit"] else "")
+    )
+    return RollupPlan(sql, params, money_columns)
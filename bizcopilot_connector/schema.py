@@ -0,0 +1,80 @@
+"""
+Cached schema snapshots for /schema.
+
+Building a full snapshot (tables or collections, columns and their types,
+indexes, row estimates) reads a lot of catalog, so a SchemaCache keeps
+the last one and only rebuilds it when the catalog version changes. The
+version is a cheap query the driver supplies: a hash over the column and
+index catalog for SQL backends, over the collection list for MongoDB.
+It is checked at most every SCHEMA_CHECK_SECONDS; a snapshot is also
+rebuilt after SCHEMA_MAX_AGE_SECONDS so row estimates do not go stale.
+
+Each snapshot carries an ETag, the hash of its content, so clients can
+send If-None-Match and get 304 Not Modified while nothing has changed.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+
+def fingerprint(content: Any) -> str:
+    canonical = json.dumps(content, default=str, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+def content_etag(content: Any) -> str:
+    return f'"{fingerprint(content)}"'
+
+
+class SchemaCache:
+    def __init__(
+        self,
+        version: Callable[[], str],
+        snapshot: Callable[[], List[Dict[str, Any]]],
+        check_seconds: float = 30.0,
+        max_age_seconds: float = 3600.0,
+    ):
+        self._version = version
+        self._snapshot = snapshot
+        self.check_seconds = check_seconds
+        self.max_age_seconds = max_age_seconds
+        self._state: Optional[Dict[str, Any]] = None
+        self._built_monotonic = 0.0
+        self._checked_monotonic = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, force: bool = False) -> Dict[str, Any]:
+        """The current snapshot: {"version", "etag", "generated_at", "tables"}."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state
+            if (
+                state is not None
+                and not force
+                and now - self._built_monotonic < self.max_age_seconds
+            ):
+                if now - self._checked_monotonic < self.check_seconds:
+                    return state
+                version = self._version()
+                self._checked_monotonic = now
+                if version == state["version"]:
+                    return state
+            else:
+                version = self._version()
+            tables = self._snapshot()
+            self._state = {
+                "version": version,
+                "etag": content_etag(tables),
+                "generated_at": datetime.utcnow().isoformat(),
+                "tables": tables,
+            }
+            self._built_monotonic = self._checked_monotonic = time.monotonic()
+            return self._state
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._state = None
@@ -0,0 +1,168 @@
+"""
+Result buffers that spill to disk.
+
+A result that has to exist in full before it is sent (the JSON envelope
+of /execute, merged partitions, a cached aggregation) is appended to a
+SpillBuffer instead of a Python list. Rows are kept encoded: the first
+RESULT_BUFFER_MEMORY_MB stay in memory and the rest go to an anonymous
+temporary file as length-prefixed records, so worker memory is bounded by
+the threshold however large the result. The buffer can be read back any
+number of times (for a retry or a cache fill) until it is closed.
+
+RowBuffer holds dict rows from the SQL drivers. Each row is pickled as
+the tuple of its values; column names are stored once.
+"""
+
+import os
+import pickle
+import struct
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic_core import to_json
+
+from bizcopilot_connector import config
+
+_LENGTH = struct.Struct("<I")
+
+
+class SpillBuffer:
+    """Append-only sequence of records; memory first, then a temporary file."""
+
+    def __init__(
+        self, memory_limit_bytes: Optional[int] = None, directory: Optional[str] = None
+    ):
+        if memory_limit_bytes is None:
+            memory_limit_bytes = int(config.RESULT_BUFFER_MEMORY_MB * 1024 * 1024)
+        self.memory_limit_bytes = memory_limit_bytes
+        self.directory = directory or config.RESULT_SPILL_DIR or None
+        self.memory_bytes = 0
+        self.spilled_bytes = 0
+        self._records: List[bytes] = []
+        self._file = None
+        self._count = 0
+        self._at_end = True
+
+    # Subclasses map their items to and from bytes
+
+    def encode(self, item: Any) -> bytes:
+        return item
+
+    def decode(self, record: bytes) -> Any:
+        return record
+
+    def to_json(self, record: bytes) -> bytes:
+        """One record as a JSON value."""
+        raise NotImplementedError
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, item: Any) -> None:
+        record = self.encode(item)
+        if self._file is None and self.memory_bytes + len(record) > self.memory_limit_bytes:
+            self._file = tempfile.TemporaryFile(prefix="bizcopilot-spill-", dir=self.directory)
+        if self._file is None:
+            self._records.append(record)
+            self.memory_bytes += len(record)
+        else:
+            if not self._at_end:
+                self._file.seek(0, os.SEEK_END)
+                self._at_end = True
+            self._file.write(_LENGTH.pack(len(record)))
+            self._file.write(record)
+            self.spilled_bytes += _LENGTH.size + len(record)
+        self._count += 1
+
+    def extend(self, items: Iterable[Any]) -> None:
+        for item in items:
+            self.append(item)
+
+    def records(self) -> Iterator[bytes]:
+        yield from self._records
+        if self._file is None:
+            return
+        self._file.flush()
+        self._file.seek(0)
+        self._at_end = False
+        read = self._file.read
+        while True:
+            header = read(_LENGTH.size)
+            if not header:
+                return
+            yield read(_LENGTH.unpack(header)[0])
+
+    def __iter__(self) -> Iterator[Any]:
+        decode = self.decode
+        for record in self.records():
+            yield decode(record)
+
+    def json_chunks(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """The records as one JSON array, in chunks of about chunk_size bytes."""
+        to_json = self.to_json
+        chunk = bytearray(b"[")
+        first = True
+        for record in self.records():
+            if not first:
+                chunk += b","
+            first = False
+            chunk += to_json(record)
+            if len(chunk) >= chunk_size:
+                yield bytes(chunk)
+                chunk.clear()
+        chunk += b"]"
+        yield bytes(chunk)
+
+    def close(self) -> None:
+        self._records = []
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "SpillBuffer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class RowBuffer(SpillBuffer):
+    """Dict rows; rows whose keys differ from the first row's are kept as dicts."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.columns: Optional[Tuple[str, ...]] = None
+
+    def encode(self, row: Dict[str, Any]) -> bytes:
+        keys = tuple(row)
+        if self.columns is None:
+            self.columns = keys
+        if keys == self.columns:
+            return pickle.dumps(tuple(row.values()), pickle.HIGHEST_PROTOCOL)
+        return pickle.dumps(dict(row), pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, record: bytes) -> Dict[str, Any]:
+        value = pickle.loads(record)
+        if isinstance(value, tuple):
+            return dict(zip(self.columns, value))
+        return value
+
+    def to_json(self, record: bytes) -> bytes:
+        # Serialised the way pydantic serialises the rows of a QueryResponse
+        return to_json(self.decode(record))
+
+
+def buffered_result(buffer: RowBuffer) -> Dict[str, Any]:
+    """
+    A driver result for buffer: small results as the usual "data" list,
+    spilled ones as "data_buffer" for the response to stream and close.
+    """
+    if buffer.spilled:
+        return {"data_buffer": buffer, "rows_affected": len(buffer)}
+    with buffer:
+        data = list(buffer)
+    return {"data": data, "rows_affected": len(data)}
@@ -0,0 +1,96 @@
+"""
+Streaming bytes from blocking producers.
+
+Database client calls such as psycopg2's copy_expert write into a file
+object and only return when they are done. ThreadedStream runs such a
+call on its own thread, hands it a file object that coalesces writes into
+chunks and a bounded queue, and is iterated to get the chunks back as they
+arrive. Memory stays at max_chunks * chunk_size however large the output,
+and a slow client applies back-pressure to the producer.
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Optional
+
+_DONE = object()
+
+
+class StreamCancelled(Exception):
+    """Raised inside the producer once the consumer has gone away."""
+
+
+class ThreadedStream:
+    def __init__(
+        self,
+        produce: Callable[[Any], Any],
+        chunk_size: int = 64 * 1024,
+        max_chunks: int = 16,
+    ):
+        self._produce = produce
+        self.chunk_size = chunk_size
+        self._queue: "queue.Queue[Any]" = queue.Queue(max_chunks)
+        self._buffer = bytearray()
+        self._cancelled = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Whatever produce returned, once the stream is exhausted
+        self.result: Any = None
+
+    # File side, called by the producer thread
+
+    def write(self, data) -> int:
+        self._buffer += data
+        if len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def _put(self, item: Any) -> None:
+        while True:
+            if self._cancelled.is_set():
+                raise StreamCancelled()
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _run(self) -> None:
+        try:
+            self.result = self._produce(self)
+            if self._buffer:
+                self._put(bytes(self._buffer))
+            self._put(_DONE)
+        except StreamCancelled:
+            pass
+        except BaseException as exc:
+            try:
+                self._put(exc)
+            except StreamCancelled:
+                pass
+
+    # Iterator side, called by the response
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stream-producer", daemon=True)
+            self._thread.start()
+        item = self._queue.get()
+        if item is _DONE:
+            self._queue.put(_DONE)
+            raise StopIteration
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def close(self) -> None:
+        """Stop the producer at its next write and release queued chunks."""
+        self._cancelled.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
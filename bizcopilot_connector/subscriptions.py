@@ -0,0 +1,216 @@
+"""
+Live query results for POST /subscribe, streamed as Server-Sent Events.
+
+Dashboards polling /execute for the same queries cost one execution per
+client per interval. Subscribers to the same query (database_type, query
+text, approximate, partition) share one Feed instead. A Feed runs the
+query once per interval, the shortest any of its subscribers asked for,
+and straight away when the result cache reports a write to a table the
+query reads. Runs are at least SUBSCRIPTION_MIN_INTERVAL_SECONDS apart.
+
+Each run's payload is hashed, and subscribers are only sent an event when
+the hash changes: a "result" event whose id is the hash, or an "error"
+event. A subscriber joining a running Feed gets the latest event at once.
+Failed runs are retried; a query the driver rejects outright ends the
+stream. A Feed stops with its last subscriber.
+"""
+
+import asyncio
+import hashlib
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, NamedTuple, Optional, Set, Tuple
+
+# run() -> (event name, JSON payload, whether the stream ends after it)
+Run = Callable[[], Awaitable[Tuple[str, bytes, bool]]]
+# watch(wake) registers wake to be called on writes and returns the unregister call
+Watch = Callable[[Callable[[], None]], Callable[[], None]]
+
+
+class SubscriptionsBusy(Exception):
+    pass
+
+
+class Message(NamedTuple):
+    event: str
+    data: bytes
+    digest: str
+    final: bool
+
+
+def sse_event(message: Message) -> bytes:
+    lines = [b"event: " + message.event.encode(), b"id: " + message.digest.encode()]
+    lines.extend(b"data: " + line for line in message.data.split(b"\n"))
+    return b"\n".join(lines) + b"\n\n"
+
+
+class Subscriber:
+    """One stream; only the newest undelivered message is kept for it."""
+
+    def __init__(self, feed: "Feed", interval_seconds: float):
+        self.feed = feed
+        self.interval_seconds = interval_seconds
+        self._pending: Optional[Message] = None
+        self._ready = asyncio.Event()
+
+    def deliver(self, message: Message) -> None:
+        self._pending = message
+        self._ready.set()
+
+    async def next(self, timeout: float) -> Optional[Message]:
+        """The next message, or None if there was none within timeout."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        message, self._pending = self._pending, None
+        return message
+
+
+class Feed:
+    def __init__(
+        self,
+        key: Hashable,
+        database_type: str,
+        run: Run,
+        min_interval_seconds: float,
+        on_stop: Callable[["Feed"], None],
+    ):
+        self.key = key
+        self.database_type = database_type
+        self.min_interval_seconds = min_interval_seconds
+        self.subscribers: Set[Subscriber] = set()
+        self.latest: Optional[Message] = None
+        self.runs = 0
+        self.pushes = 0
+        self.last_run_at: Optional[str] = None
+        self._run = run
+        self._on_stop = on_stop
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def interval_seconds(self) -> float:
+        wanted = min((s.interval_seconds for s in self.subscribers), default=0.0)
+        return max(self.min_interval_seconds, wanted)
+
+    def start(self) -> None:
+        self._task = self._loop.create_task(self._run_loop())
+
+    def stop(self) -> None:
+        """Cancel the run loop; safe to call from any thread."""
+        if self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+
+    def wake(self) -> None:
+        """Run again now rather than at the next interval; safe to call from any thread."""
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _run_loop(self) -> None:
+        try:
+            while self.subscribers:
+                self._wake.clear()
+                started = time.monotonic()
+                event, data, final = await self._run()
+                self.runs += 1
+                self.last_run_at = datetime.utcnow().isoformat()
+                digest = hashlib.sha256(data).hexdigest()[:32]
+                if final or self.latest is None or digest != self.latest.digest:
+                    self.latest = Message(event, data, digest, final)
+                    self.pushes += 1
+                    for subscriber in list(self.subscribers):
+                        subscriber.deliver(self.latest)
+                if final:
+                    break
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                # A burst of writes costs one run per minimum interval
+                rest = self.min_interval_seconds - (time.monotonic() - started)
+                if rest > 0:
+                    await asyncio.sleep(rest)
+        finally:
+            self._on_stop(self)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "database_type": self.database_type,
+            "subscribers": len(self.subscribers),
+            "interval_seconds": self.interval_seconds,
+            "runs": self.runs,
+            "pushes": self.pushes,
+            "last_run_at": self.last_run_at,
+            "hash": self.latest.digest if self.latest is not None else None,
+        }
+
+
+class SubscriptionHub:
+    """The running Feeds by query; used from the event loop only."""
+
+    def __init__(self, max_queries: int, min_interval_seconds: float):
+        self.max_queries = max_queries
+        self.min_interval_seconds = min_interval_seconds
+        self._feeds: Dict[Hashable, Feed] = {}
+        self._unwatch: Dict[Hashable, Callable[[], None]] = {}
+
+    def subscribe(
+        self,
+        key: Hashable,
+        database_type: str,
+        interval_seconds: float,
+        run: Run,
+        watch: Optional[Watch] = None,
+    ) -> Subscriber:
+        """
+        Join the Feed for key, starting one with run (and watch, to be woken
+        on writes) if there is none. Raises SubscriptionsBusy when
+        max_queries distinct queries are already running.
+        """
+        feed = self._feeds.get(key)
+        if feed is None:
+            if len(self._feeds) >= self.max_queries:
+                raise SubscriptionsBusy(
+                    f"{self.max_queries} distinct queries are already subscribed"
+                )
+            feed = Feed(key, database_type, run, self.min_interval_seconds, self._stopped)
+            self._feeds[key] = feed
+            if watch is not None:
+                self._unwatch[key] = watch(feed.wake)
+            feed.start()
+        subscriber = Subscriber(feed, interval_seconds)
+        feed.subscribers.add(subscriber)
+        if feed.latest is not None:
+            subscriber.deliver(feed.latest)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        feed = subscriber.feed
+        feed.subscribers.discard(subscriber)
+        if not feed.subscribers:
+            # Out of the hub first, so nobody joins a Feed that is stopping
+            self._stopped(feed)
+            feed.stop()
+
+    def _stopped(self, feed: Feed) -> None:
+        if self._feeds.get(feed.key) is feed:
+            del self._feeds[feed.key]
+            unwatch = self._unwatch.pop(feed.key, None)
+            if unwatch is not None:
+                unwatch()
+
+    def close(self) -> None:
+        for feed in list(self._feeds.values()):
+            feed.stop()
+
+    def status(self) -> Dict[str, Any]:
+        feeds: List[Feed] = list(self._feeds.values())
+        return {
+            "queries": len(feeds),
+            "subscribers": sum(len(feed.subscribers) for feed in feeds),
+            "max_queries": self.max_queries,
+            "min_interval_seconds": self.min_interval_seconds,
+            "feeds": [feed.status() for feed in feeds],
+        }